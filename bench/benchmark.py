@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+Runs the checks against the simulated CREAM CEs of creamsim.py and
+reports wall time, subprocess count, peak RSS and checks/second.
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+from optparse import OptionParser
+import os, resource, shutil, sys, tempfile, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from cream_cli.runner import Runner
+
+# the jdl installed by setup.py, else the one of the source tree
+INSTALLED_JDL = "/etc/nagios/plugins/eu.egi.CREAMCE/hostname.jdl"
+DEFAULT_JDL = os.path.exists(INSTALLED_JDL) and INSTALLED_JDL or \
+              os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "script", "hostname.jdl"))
+
+
+class TimedRunner(Runner):
+    results = None
+    verbose = False
+
+    def __init__(self, name, version):
+        super(TimedRunner, self).__init__(name, version)
+        self.results = []
+        self.starts = {}
+        self.lock = threading.Lock()
+
+
+    def runCheck(self, check, endpoint, started=None):
+        start = time.time()
+        code, msg = super(TimedRunner, self).runCheck(check, endpoint, started)
+
+        with self.lock:
+            self.results.append((check, code, time.time() - start))
+
+        return code, msg
+
+
+    def startCheck(self, check, endpoint, engine):
+        start = time.time()
+        client, command = super(TimedRunner, self).startCheck(check, endpoint, engine)
+        self.starts[command] = start
+
+        return client, command
+
+
+    def finishCheck(self, check, endpoint, client, command):
+        code, msg = super(TimedRunner, self).finishCheck(check, endpoint, client, command)
+
+        with self.lock:
+            self.results.append((check, code, time.time() - self.starts.pop(command)))
+
+        return code, msg
+
+
+    def printResult(self, check, endpoint, code, msg):
+        if code != 0 and self.verbose:
+            print "    %s %s %s: %s" % (check, endpoint, self.STATUS[code], str(msg).split("\n")[0])
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def countCalls(path):
+    try:
+        with open(path) as infile:
+            return sum(1 for line in infile)
+    except IOError:
+        return 0
+
+
+#Run the checks against the given number of simulated endpoints and print the figures.
+def bench(options, size):
+    workDir = tempfile.mkdtemp(prefix="creamsim-bench-")
+    urlFile = os.path.join(workDir, "endpoints")
+
+    with open(urlFile, "w") as outfile:
+        for i in range(size):
+            outfile.write("https://ce%04d.sim.example.org:8443/cream-pbs-bench\n" % i)
+
+    calls = os.path.join(os.environ.get("CREAMSIM_DIR", "/tmp/creamsim"), "calls.log")
+    callsBefore = countCalls(calls)
+
+    args = ["-f", urlFile, "-c", options.checks, "-w", str(options.workers), "-t", str(options.timeout),
+            "-j", options.jdl, "-d", os.path.join(workDir, "osb"), "--cli-path", options.cliPath,
+            "--state-dir", os.path.join(workDir, "state")]
+
+    if options.proxy:
+        args += ["-x", options.proxy]
+    else:
+        args.append("--disable-proxy-check")
+
+    os.makedirs(os.path.join(workDir, "osb"))
+
+    runner = TimedRunner("cream_benchmark", __version__)
+    runner.verbose = options.verbose
+    runner.createParser()
+    runner.readOptions(args)
+
+    start = time.time()
+    runner.run()
+    wallTime = time.time() - start
+
+    subprocesses = countCalls(calls) - callsBefore
+    selfRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    childRss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    print "endpoints=%d checks=%d wall=%.2fs checks/s=%.2f subprocesses=%d peak_rss=%dkB peak_child_rss=%dkB" % (
+        size, len(runner.results), wallTime, len(runner.results) / wallTime, subprocesses, selfRss, childRss)
+
+    for check in sorted(set(result[0] for result in runner.results)):
+        times = [t for name, code, t in runner.results if name == check]
+        failed = len([code for name, code, t in runner.results if name == check and code != 0])
+
+        print "    %-18s n=%-5d mean=%.3fs p95=%.3fs max=%.3fs not_ok=%d" % (
+            check, len(times), sum(times) / len(times), percentile(times, 95), max(times), failed)
+
+    shutil.rmtree(workDir, ignore_errors=True)
+
+
+def main():
+    optionParser = OptionParser(usage="%prog [options]", version="%prog v." + __version__)
+
+    optionParser.add_option("-s", "--sizes", dest="sizes", default="1,100,1000",
+                            help="Comma separated numbers of endpoints. [default: %default]")
+    optionParser.add_option("-c", "--checks", dest="checks", default=Runner.DEFAULT_CHECKS,
+                            help="Comma separated list of checks to run. [default: %default]")
+    optionParser.add_option("-w", "--workers", dest="workers", type="int", default=50,
+                            help="Number of checks running concurrently. [default: %default]")
+    optionParser.add_option("-t", "--timeout", dest="timeout", type="int", default=600,
+                            help="Execution time limit of each check. [default: %default sec]")
+    optionParser.add_option("-j", "--jdl", dest="jdl", default=DEFAULT_JDL,
+                            help="The jdl path passed to the job checks. [default: %default]")
+    optionParser.add_option("-x", "--proxy", dest="proxy",
+                            help="The proxy path (the proxy check is disabled if not set)")
+    optionParser.add_option("--cli-path", dest="cliPath", default="/tmp/creamsim/bin",
+                            help="The directory of the simulated glite-ce-* commands. [default: %default]")
+    optionParser.add_option("-v", "--verbose", action="store_true", dest="verbose", default=False,
+                            help="Print the checks not returning OK")
+
+    (options, args) = optionParser.parse_args()
+
+    if not os.path.exists(os.path.join(options.cliPath, "glite-ce-job-submit")):
+        optionParser.error("the simulator is not installed: run creamsim.py install %s" % options.cliPath)
+
+    for size in options.sizes.split(","):
+        bench(options, int(size))
+
+
+if __name__ == "__main__":
+    main()
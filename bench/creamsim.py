@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+A simulated CREAM CE behind fake glite-ce-* commands.
+
+Install the commands with
+
+    creamsim.py install <dir>
+
+and run the probes with --cli-path <dir>. The simulator is dispatched on
+the name of the command and configured by the environment:
+
+    CREAMSIM_DIR               state directory [/tmp/creamsim]
+    CREAMSIM_LATENCY           seconds spent by every command [0]
+    CREAMSIM_QUEUE_TIME        mean seconds a job stays IDLE (exponential) [1]
+    CREAMSIM_RUN_TIME          seconds a job stays REALLY-RUNNING [5]
+    CREAMSIM_FAILURE_RATE      probability of a command failing [0]
+    CREAMSIM_JOB_FAILURE_RATE  probability of a job ending DONE-FAILED [0]
+    CREAMSIM_OUTPUT_SIZE       bytes of std.out in the output sandbox [64]
+    CREAMSIM_TRANSFER_TIME     seconds added to a job per sandbox file [0]
+    CREAMSIM_DOWN_HOSTS        comma separated hosts refusing connections []
+
+Every invocation is appended to <CREAMSIM_DIR>/calls.log.
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+import json, os, random, re, sys, time, uuid
+from urlparse import urlparse
+
+
+COMMANDS = ["glite-ce-job-submit", "glite-ce-job-status", "glite-ce-job-cancel", "glite-ce-job-purge",
+            "glite-ce-job-output", "glite-ce-service-info", "glite-ce-allowed-submission",
+            "glite-ce-delegate-proxy", "glite-ce-proxy-renew", "voms-proxy-info"]
+
+
+def setting(name, default):
+    return type(default)(os.environ.get("CREAMSIM_" + name, default))
+
+
+stateDir = setting("DIR", "/tmp/creamsim")
+jobsDir = os.path.join(stateDir, "jobs")
+
+
+def log(level, msg):
+    print "%s %s - %s" % (time.strftime("%Y-%m-%d %H:%M:%S,000"), level, msg)
+
+
+def fail(msg):
+    log("ERROR", msg)
+    sys.exit(1)
+
+
+def jobPath(jobId):
+    return os.path.join(jobsDir, jobId.rsplit("/", 1)[-1])
+
+
+def loadJob(jobId):
+    try:
+        with open(jobPath(jobId)) as infile:
+            return json.load(infile)
+    except IOError:
+        return None
+
+
+def saveJob(job):
+    path = jobPath(job["id"])
+
+    with open(path + ".tmp", "w") as outfile:
+        json.dump(job, outfile)
+
+    os.rename(path + ".tmp", path)
+
+
+#The status of a job at the current time.
+def jobStatus(job):
+    if job.get("cancelled"):
+        return "CANCELLED", None
+
+    elapsed = time.time() - job["submitted"]
+
+    if elapsed < job["queueTime"]:
+        return "IDLE", None
+
+    if elapsed < job["queueTime"] + job["runTime"]:
+        return "REALLY-RUNNING", None
+
+    if job["failed"]:
+        return "DONE-FAILED", "1"
+
+    return "DONE-OK", "0"
+
+
+#The endpoint (host:port) the command talks to.
+def endpoint(args):
+    for arg in args:
+        if "://" in arg:
+            return urlparse(arg).netloc
+
+        if ":" in arg and not arg.startswith("-"):
+            return arg.split("/")[0]
+
+    return None
+
+
+#The number of files in the input and output sandboxes of a JDL.
+def sandboxFiles(path):
+    try:
+        with open(path) as infile:
+            jdl = infile.read()
+    except IOError as ex:
+        fail("cannot read the JDL: %s" % ex)
+
+    count = 0
+
+    for name in ["InputSandbox", "OutputSandbox"]:
+        match = re.search(r"^\s*%s\s*=\s*\{([^}]*)\}" % name, jdl, re.MULTILINE | re.IGNORECASE)
+
+        if match:
+            count += len(re.findall(r'"[^"]*"', match.group(1)))
+
+    return count
+
+
+def submit(args):
+    url = [arg for arg in args if not arg.startswith("-") and "/cream-" in arg]
+
+    if not url:
+        fail("the CREAM endpoint is not specified")
+
+    # every file of the sandboxes is staged from or to a GridFTP server
+    transferTime = setting("TRANSFER_TIME", 0.0) * sandboxFiles(args[-1])
+
+    host = url[0].split("/")[0]
+    job = {"id": "https://%s/CREAM%s" % (host, uuid.uuid4().hex[:9]),
+           "submitted": time.time(),
+           "queueTime": random.expovariate(1.0 / setting("QUEUE_TIME", 1.0)) if setting("QUEUE_TIME", 1.0) > 0 else 0,
+           "runTime": setting("RUN_TIME", 5.0) + transferTime,
+           "failed": random.random() < setting("JOB_FAILURE_RATE", 0.0)}
+
+    saveJob(job)
+    print job["id"]
+
+
+def status(args):
+    found = True
+
+    for jobId in [arg for arg in args if arg.startswith("https://")]:
+        job = loadJob(jobId)
+
+        if not job:
+            log("ERROR", "JobID=[%s] job not found" % jobId)
+            found = False
+            continue
+
+        state, exitCode = jobStatus(job)
+
+        print "\n******  JobID=[%s]" % jobId
+        print "\tStatus        = [%s]" % state
+
+        if exitCode is not None:
+            print "\tExitCode      = [%s]" % exitCode
+
+    if not found:
+        sys.exit(1)
+
+
+def cancel(args):
+    for jobId in [arg for arg in args if arg.startswith("https://")]:
+        job = loadJob(jobId)
+
+        if not job:
+            log("ERROR", "JobID=[%s] job not found" % jobId)
+            continue
+
+        job["cancelled"] = True
+        saveJob(job)
+
+
+def purge(args):
+    for jobId in [arg for arg in args if arg.startswith("https://")]:
+        try:
+            os.remove(jobPath(jobId))
+        except OSError:
+            log("ERROR", "JobID=[%s] job not found" % jobId)
+
+
+def output(args):
+    jobId = args[-1]
+    job = loadJob(jobId)
+
+    if not job:
+        fail("JobID=[%s] job not found" % jobId)
+
+    parent = os.path.join(stateDir, "osb")
+
+    if "--dir" in args:
+        parent = args[args.index("--dir") + 1]
+
+    osbdir = os.path.join(parent, jobId.split("://", 1)[1].replace("/", "_").replace(":", "_"))
+    os.makedirs(osbdir)
+
+    size = setting("OUTPUT_SIZE", 64)
+
+    with open(os.path.join(osbdir, "std.out"), "w") as outfile:
+        line = "hello from %s\n" % jobId
+        outfile.write((line * (size / len(line) + 1))[:size])
+
+    open(os.path.join(osbdir, "std.err"), "w").close()
+
+    log("INFO", "For JobID [%s] output will be stored in the dir %s" % (jobId, osbdir))
+
+
+def serviceInfo(args):
+    print "Interface Version  = [2.1]"
+    print "Service Version    = [1.16.7 - simulated]"
+    print "Status             = [OK]"
+
+
+def allowedSubmission(args):
+    print "Job Submission to this CREAM CE is enabled"
+
+
+def delegate(args):
+    log("INFO", "Proxy with delegation id [%s] successfully delegated to endpoint [%s]" % (args[-1], endpoint(args)))
+
+
+def renew(args):
+    log("INFO", "Proxy with delegation id [%s] successfully renewed to endpoint [%s]" % (args[-1], endpoint(args)))
+
+
+def proxyInfo(args):
+    print "3600"
+
+
+HANDLERS = {
+    "glite-ce-job-submit": submit,
+    "glite-ce-job-status": status,
+    "glite-ce-job-cancel": cancel,
+    "glite-ce-job-purge": purge,
+    "glite-ce-job-output": output,
+    "glite-ce-service-info": serviceInfo,
+    "glite-ce-allowed-submission": allowedSubmission,
+    "glite-ce-delegate-proxy": delegate,
+    "glite-ce-proxy-renew": renew,
+    "voms-proxy-info": proxyInfo
+}
+
+
+#Create the fake commands as symbolic links to a copy of this script run by the current interpreter.
+def install(target):
+    if not os.path.isdir(target):
+        os.makedirs(target)
+
+    with open(os.path.abspath(__file__)) as infile:
+        source = infile.read().split("\n", 1)[1]
+
+    script = os.path.join(os.path.abspath(target), "creamsim.py")
+
+    with open(script, "w") as outfile:
+        outfile.write("#!%s\n%s" % (sys.executable, source))
+
+    os.chmod(script, 0o755)
+
+    for command in COMMANDS:
+        path = os.path.join(target, command)
+
+        if os.path.lexists(path):
+            os.remove(path)
+
+        os.symlink(script, path)
+
+    print "installed %d commands in %s" % (len(COMMANDS), target)
+
+
+def main():
+    command = os.path.basename(sys.argv[0])
+    args = sys.argv[1:]
+
+    if command not in HANDLERS:
+        if len(args) == 2 and args[0] == "install":
+            return install(args[1])
+
+        print "usage: %s install <dir>" % command
+        sys.exit(2)
+
+    if not os.path.isdir(jobsDir):
+        try:
+            os.makedirs(jobsDir)
+        except OSError:
+            pass
+
+    with open(os.path.join(stateDir, "calls.log"), "a") as outfile:
+        outfile.write("%f %s %s\n" % (time.time(), command, " ".join(args)))
+
+    time.sleep(setting("LATENCY", 0.0))
+
+    host = endpoint(args)
+    downHosts = [h for h in setting("DOWN_HOSTS", "").split(",") if h]
+
+    if host and host.split(":")[0] in downHosts:
+        fail("Connection refused by %s" % host)
+
+    if command != "voms-proxy-info" and random.random() < setting("FAILURE_RATE", 0.0):
+        fail("FaultString=[simulated failure] FaultCode=[N/A] FaultCause=[CREAMSIM_FAILURE_RATE]")
+
+    HANDLERS[command](args)
+
+
+if __name__ == "__main__":
+    main()
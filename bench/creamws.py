@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+A local stand-in of the CREAM web service for the ws backend: an HTTPS
+server answering JobRegister, JobInfo, JobCancel, JobPurge and
+getServiceInfo with simulated jobs. GET /stats returns the number of
+connections and requests served, e.g. to check the connection reuse:
+
+    creamws.py --generate -p 8443
+    cream_jobSubmit.py -u https://localhost:8443/cream-pbs-q -j sleep.jdl \
+        --backend ws --ca-path /tmp/creamws/cert.pem --cli-path /tmp/creamsim/bin
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from optparse import OptionParser
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+import json, os, random, ssl, subprocess, threading, time, uuid
+
+
+ENVELOPE = """<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+<soapenv:Body>%s</soapenv:Body>
+</soapenv:Envelope>"""
+
+FAULT = """<soapenv:Fault><faultcode>soapenv:Server</faultcode><faultstring>%s</faultstring>
+<detail><FaultCause>%s</FaultCause></detail></soapenv:Fault>"""
+
+
+def localName(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def findAll(element, name):
+    return [child for child in element.iter() if localName(child.tag) == name]
+
+
+def dateTime(epoch):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(epoch))
+
+
+
+class CreamWS(object):
+    #The simulated jobs and the counters of the server.
+
+    def __init__(self, options):
+        self.options = options
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+
+
+    #The status changes of a job up to now: [(status, time, exitCode)].
+    def history(self, job):
+        history = [("REGISTERED", job["submitted"], None), ("IDLE", job["submitted"], None)]
+        started = job["submitted"] + job["queueTime"]
+        ended = started + job["runTime"]
+        now = time.time()
+
+        if job.get("cancelled") and job["cancelled"] < started:
+            return history + [("CANCELLED", job["cancelled"], None)]
+
+        if now >= started:
+            history.append(("REALLY-RUNNING", started, None))
+
+        if job.get("cancelled") and job["cancelled"] < ended:
+            return history + [("CANCELLED", job["cancelled"], None)]
+
+        if now >= ended:
+            history.append(job["failed"] and ("DONE-FAILED", ended, "1") or ("DONE-OK", ended, "0"))
+
+        return history
+
+
+    def jobIdXML(self, id):
+        return "<jobId><id>%s</id><creamURL>https://localhost:%d/ce-cream/services/CREAM2</creamURL></jobId>" % (escape(id), self.options.port)
+
+
+    def unknown(self, id):
+        return "<result>%s<JobUnknownFault><FaultCause>job %s not found</FaultCause></JobUnknownFault></result>" % (self.jobIdXML(id), escape(id))
+
+
+    def JobRegisterRequest(self, request):
+        results = []
+
+        for description in findAll(request, "JobDescriptionList"):
+            id = "CREAM" + uuid.uuid4().hex[:9]
+
+            with self.lock:
+                self.jobs[id] = {"submitted": time.time(),
+                                 "queueTime": random.expovariate(1.0 / self.options.queueTime) if self.options.queueTime > 0 else 0,
+                                 "runTime": self.options.runTime,
+                                 "failed": random.random() < self.options.jobFailureRate,
+                                 "jdl": findAll(description, "JDL")[0].text}
+
+            results.append("<result>%s</result>" % self.jobIdXML(id))
+
+        return "<JobRegisterResponse>%s</JobRegisterResponse>" % "".join(results)
+
+
+    def JobInfoRequest(self, request):
+        results = []
+
+        for element in findAll(request, "jobId"):
+            id = findAll(element, "id")[0].text
+            job = self.jobs.get(id)
+
+            if not job:
+                results.append(self.unknown(id))
+                continue
+
+            statuses = "".join(["<status><name>%s</name><timestamp>%s</timestamp>%s</status>" %
+                                (name, dateTime(when), exitCode and "<exitCode>%s</exitCode>" % exitCode or "")
+                                for name, when, exitCode in self.history(job)])
+
+            results.append("<result>%s<jobInfo>%s</jobInfo></result>" % (self.jobIdXML(id), statuses))
+
+        return "<JobInfoResponse>%s</JobInfoResponse>" % "".join(results)
+
+
+    def JobCancelRequest(self, request):
+        results = []
+
+        for element in findAll(request, "jobId"):
+            id = findAll(element, "id")[0].text
+
+            with self.lock:
+                job = self.jobs.get(id)
+
+                if job:
+                    job.setdefault("cancelled", time.time())
+
+            results.append(job and "<result>%s</result>" % self.jobIdXML(id) or self.unknown(id))
+
+        return "<JobCancelResponse>%s</JobCancelResponse>" % "".join(results)
+
+
+    def JobPurgeRequest(self, request):
+        results = []
+
+        for element in findAll(request, "jobId"):
+            id = findAll(element, "id")[0].text
+
+            with self.lock:
+                job = self.jobs.pop(id, None)
+
+            results.append(job and "<result>%s</result>" % self.jobIdXML(id) or self.unknown(id))
+
+        return "<JobPurgeResponse>%s</JobPurgeResponse>" % "".join(results)
+
+
+    def getServiceInfoRequest(self, request):
+        return "<getServiceInfoResponse><result><interfaceVersion>2.1</interfaceVersion>" \
+               "<serviceVersion>1.16.7 - stand-in</serviceVersion><status>OK</status>" \
+               "<doesAcceptNewJobSubmissions>true</doesAcceptNewJobSubmissions></result></getServiceInfoResponse>"
+
+
+    #Answer a SOAP request: return the HTTP status and the response envelope.
+    def dispatch(self, data):
+        time.sleep(self.options.latency)
+
+        try:
+            body = [element for element in ElementTree.fromstring(data) if localName(element.tag) == "Body"][0]
+            request = body[0]
+            operation = localName(request.tag)
+        except Exception as ex:
+            return 500, ENVELOPE % (FAULT % ("malformed request", escape("%s" % ex)))
+
+        if not hasattr(self, operation) or not operation[0].isalpha() or operation in ["dispatch", "history", "unknown"]:
+            return 500, ENVELOPE % (FAULT % ("unknown operation", escape(operation)))
+
+        if random.random() < self.options.failureRate:
+            return 500, ENVELOPE % (FAULT % ("simulated failure", "--failure-rate"))
+
+        return 200, ENVELOPE % getattr(self, operation)(request)
+
+
+
+class CreamWSHandler(BaseHTTPRequestHandler):
+    # keep the connections alive between the requests
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+
+        with self.server.creamws.lock:
+            self.server.creamws.connections += 1
+
+
+    def reply(self, code, contentType, data):
+        self.send_response(code)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers.getheader("content-length", 0)))
+
+        with self.server.creamws.lock:
+            self.server.creamws.requests += 1
+
+        code, response = self.server.creamws.dispatch(data)
+        self.reply(code, "text/xml; charset=utf-8", response)
+
+
+    def do_GET(self):
+        creamws = self.server.creamws
+
+        if self.path != "/stats":
+            return self.reply(404, "text/plain", "not found\n")
+
+        self.reply(200, "application/json", json.dumps({"connections": creamws.connections, "requests": creamws.requests, "jobs": len(creamws.jobs)}) + "\n")
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+
+class CreamWSServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+
+def main():
+    optionParser = OptionParser(usage="%prog [options]", version="%prog v." + __version__)
+    optionParser.add_option("-p", "--port", dest="port", type="int", default=8443, help="[default: %default]")
+    optionParser.add_option("--cert", dest="cert", default="/tmp/creamws/cert.pem", help="The server certificate. [default: %default]")
+    optionParser.add_option("--key", dest="key", default="/tmp/creamws/key.pem", help="The server key. [default: %default]")
+    optionParser.add_option("--generate", action="store_true", dest="generate", default=False,
+                            help="Generate a self-signed certificate for localhost if missing (requires openssl)")
+    optionParser.add_option("--client-ca", dest="clientCA",
+                            help="Require a client certificate issued by these CA certificates")
+    optionParser.add_option("--latency", dest="latency", type="float", default=0.0, help="Seconds spent by every request. [default: %default]")
+    optionParser.add_option("--queue-time", dest="queueTime", type="float", default=1.0, help="Mean seconds a job stays IDLE. [default: %default]")
+    optionParser.add_option("--run-time", dest="runTime", type="float", default=5.0, help="Seconds a job stays REALLY-RUNNING. [default: %default]")
+    optionParser.add_option("--failure-rate", dest="failureRate", type="float", default=0.0, help="Probability of a fault. [default: %default]")
+    optionParser.add_option("--job-failure-rate", dest="jobFailureRate", type="float", default=0.0, help="Probability of a DONE-FAILED job. [default: %default]")
+
+    (options, args) = optionParser.parse_args()
+
+    if options.generate and not os.path.exists(options.cert):
+        if not os.path.isdir(os.path.dirname(options.cert)):
+            os.makedirs(os.path.dirname(options.cert))
+
+        subprocess.check_call(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "7", "-subj", "/CN=localhost",
+                               "-addext", "subjectAltName=DNS:localhost", "-keyout", options.key, "-out", options.cert])
+
+    context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    context.load_cert_chain(options.cert, options.key)
+
+    if options.clientCA:
+        context.verify_mode = ssl.CERT_REQUIRED
+        context.load_verify_locations(cafile=options.clientCA)
+
+    server = CreamWSServer(("localhost", options.port), CreamWSHandler)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    server.creamws = CreamWS(options)
+
+    print "CREAM web service stand-in listening on https://localhost:%d/ce-cream/services/CREAM2" % options.port
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
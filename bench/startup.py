@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+Measures the start-up of the cream_* scripts: the time to the first byte
+of output and the number of modules imported, for --help and for each
+check run against the simulated CREAM CE of creamsim.py (with no queue
+and run time, so that the figures are dominated by the probe itself).
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+from optparse import OptionParser
+import os, shutil, subprocess, sys, tempfile, time
+
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+SCRIPTS = {"jobSubmit": "cream_jobSubmit.py",
+           "jobOutput": "cream_jobOutput.py",
+           "jobCancel": "cream_jobCancel.py",
+           "jobPurge": "cream_jobPurge.py",
+           "serviceInfo": "cream_serviceInfo.py",
+           "allowedSubmission": "cream_allowedSubmission.py"}
+
+JOB_CHECKS = ["jobSubmit", "jobOutput", "jobCancel", "jobPurge"]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def environment(options):
+    env = os.environ.copy()
+    env["PYTHONPATH"] = SRC + os.pathsep + env.get("PYTHONPATH", "")
+    env["CREAM_CLI_PATH"] = options.cliPath
+    env.setdefault("CREAMSIM_QUEUE_TIME", "0")
+    env.setdefault("CREAMSIM_RUN_TIME", "0")
+
+    return env
+
+
+#Run the command and return the seconds to its first byte of output and its exit code.
+def firstOutput(args, env):
+    start = time.time()
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+
+    proc.stdout.read(1)
+    elapsed = time.time() - start
+
+    proc.stdout.read()
+    return elapsed, proc.wait()
+
+
+#The number of modules imported by the command (python -v).
+def countImports(args, env):
+    proc = subprocess.Popen([args[0], "-v"] + args[1:], stdout=open(os.devnull, "w"), stderr=subprocess.PIPE, env=env)
+
+    imports = len([line for line in proc.stderr if line.startswith("import ")])
+    proc.wait()
+
+    return imports
+
+
+def measure(label, args, env, repeat):
+    countImports(args, env) # warm up the page cache and the .pyc files
+
+    runs = [firstOutput(args, env) for i in range(repeat)]
+    times = [elapsed for elapsed, code in runs]
+    codes = sorted(set(code for elapsed, code in runs))
+
+    print "%-34s mean=%.3fs p50=%.3fs p95=%.3fs min=%.3fs modules=%-4d exit=%s" % (
+        label, sum(times) / len(times), percentile(times, 50), percentile(times, 95), min(times),
+        countImports(args, env), ",".join([str(code) for code in codes]))
+
+
+def main():
+    optionParser = OptionParser(usage="%prog [options]", version="%prog v." + __version__)
+
+    optionParser.add_option("-n", "--repeat", dest="repeat", type="int", default=10,
+                            help="Number of runs of every command. [default: %default]")
+    optionParser.add_option("-c", "--checks", dest="checks", default=",".join(sorted(SCRIPTS)),
+                            help="Comma separated list of checks to run. [default: %default]")
+    optionParser.add_option("-j", "--jdl", dest="jdl", default=os.path.join(SRC, "..", "script", "hostname.jdl"),
+                            help="The jdl path passed to the job checks. [default: %default]")
+    optionParser.add_option("-x", "--proxy", dest="proxy",
+                            help="The proxy path (the proxy check is disabled if not set)")
+    optionParser.add_option("--cli-path", dest="cliPath", default="/tmp/creamsim/bin",
+                            help="The directory of the simulated glite-ce-* commands. [default: %default]")
+    optionParser.add_option("--help-only", action="store_true", dest="helpOnly", default=False,
+                            help="Measure --help only")
+
+    (options, args) = optionParser.parse_args()
+
+    checks = [check.strip() for check in options.checks.split(",") if check.strip()]
+
+    for check in checks:
+        if check not in SCRIPTS:
+            optionParser.error("unknown check '%s'" % check)
+
+    if not options.helpOnly and not os.path.exists(os.path.join(options.cliPath, "glite-ce-job-submit")):
+        optionParser.error("the simulator is not installed: run creamsim.py install %s" % options.cliPath)
+
+    env = environment(options)
+    python = sys.executable
+    stateDir = tempfile.mkdtemp(prefix="creamsim-startup-")
+
+    measure("interpreter", [python, "-c", "print"], env, options.repeat)
+
+    for check in checks:
+        measure("%s --help" % SCRIPTS[check], [python, os.path.join(SRC, SCRIPTS[check]), "--help"], env, options.repeat)
+
+    measure("cream_probe.py --help", [python, os.path.join(SRC, "cream_probe.py"), "--help"], env, options.repeat)
+
+    if options.helpOnly:
+        return
+
+    for check in checks:
+        args = [python, os.path.join(SRC, SCRIPTS[check]), "--state-dir", stateDir, "-t", "60"]
+
+        if check in JOB_CHECKS:
+            args += ["-u", "https://ce.sim.example.org:8443/cream-pbs-startup", "-j", options.jdl]
+        else:
+            args += ["-u", "https://ce.sim.example.org:8443"]
+
+        if check == "jobOutput":
+            args += ["-d", os.path.join(stateDir, "osb")]
+
+        if options.proxy:
+            args += ["-x", options.proxy]
+        else:
+            args.append("--disable-proxy-check")
+
+        # the job must still be running when jobCancel cancels it
+        checkEnv = dict(env)
+
+        if check == "jobCancel" and "CREAMSIM_RUN_TIME" not in os.environ:
+            checkEnv["CREAMSIM_RUN_TIME"] = "60"
+
+        measure(check, args, checkEnv, options.repeat)
+
+    shutil.rmtree(stateDir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
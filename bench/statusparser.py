@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+Checks the glite-ce-job-status parser against the fixtures of
+fixtures/job-status (<name>.txt parsed into the records of <name>.json)
+and measures it against the former scan-and-split parser.
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+from optparse import OptionParser
+import json, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from cream_cli.status import parseStatus, parseBlocks
+
+
+ROUNDS = 5
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "job-status")
+
+
+def asDict(record):
+    return {"jobId": record.jobId, "status": record.status, "exitCode": record.exitCode,
+            "failureReason": record.failureReason, "description": record.description,
+            "error": record.error, "timestamps": list(record.timestamps())}
+
+
+#Parse every fixture (through the single job path and through the full parser) and compare the records
+#with the expected ones: return the number of mismatches.
+def checkFixtures():
+    failures = 0
+
+    for name in sorted(os.listdir(FIXTURES)):
+        if not name.endswith(".txt"):
+            continue
+
+        with open(os.path.join(FIXTURES, name)) as infile:
+            output = infile.readlines()
+
+        with open(os.path.join(FIXTURES, name[:-4] + ".json")) as infile:
+            expected = json.load(infile)
+
+        for parse in parseStatus, parseBlocks:
+            records = [asDict(record) for record in parse(output)]
+
+            if records == expected:
+                print "%-20s %-12s OK (%d jobs)" % (name, parse.__name__, len(records))
+            else:
+                failures += 1
+                print "%-20s %-12s FAILED\n    expected: %s\n    parsed:   %s" % (name, parse.__name__, expected, records)
+
+    return failures
+
+
+#The former parser: the last "Status" and "ExitCode" lines of the output, split on the brackets.
+def legacyParse(output):
+    status = None
+    for i in output:
+        if "Status" in i:
+            status = i
+
+    jobStatus = status.split('[')[1].split(']')[0]
+
+    exitCode = None
+    for y in output:
+        if "ExitCode" in y:
+            exitCode = y
+
+    if exitCode:
+        return jobStatus, exitCode.split('[')[1].split(']')[0]
+
+    return jobStatus, -1
+
+
+#The best of ROUNDS rounds of repeat calls: the others are slowed down by the rest of the host.
+def measure(label, parse, output, repeat):
+    best = None
+
+    for attempt in range(ROUNDS):
+        start = time.time()
+
+        for i in xrange(repeat):
+            parse(output)
+
+        elapsed = time.time() - start
+        best = min(best or elapsed, elapsed)
+
+    print "%-45s %8.2f us/call" % (label, best / repeat * 1e6)
+
+
+def main():
+    optionParser = OptionParser(usage="%prog [options]", version="%prog v." + __version__)
+    optionParser.add_option("-n", "--repeat", dest="repeat", type="int", default=20000,
+                            help="Number of parses of each output. [default: %default]")
+    optionParser.add_option("-j", "--jobs", dest="jobs", type="int", default=50,
+                            help="Number of job blocks of the bulk output. [default: %default]")
+
+    (options, args) = optionParser.parse_args()
+
+    failures = checkFixtures()
+
+    with open(os.path.join(FIXTURES, "done-failed.txt")) as infile:
+        single = infile.readlines()
+
+    with open(os.path.join(FIXTURES, "verbose.txt")) as infile:
+        verbose = infile.readlines()
+
+    bulk = []
+    for i in range(options.jobs):
+        bulk += [line.replace("CREAM987654321", "CREAM%09d" % i) for line in single]
+
+    print
+    measure("legacy parser, single job", legacyParse, single, options.repeat)
+    measure("parseStatus, single job", parseStatus, single, options.repeat)
+    measure("legacy parser, single job -L 2", legacyParse, verbose, options.repeat)
+    measure("parseStatus, single job -L 2", parseStatus, verbose, options.repeat)
+    measure("parseStatus, %d jobs in one output" % options.jobs, parseStatus, bulk, max(1, options.repeat / options.jobs))
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
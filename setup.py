@@ -46,7 +46,14 @@ python_scripts = [
                   "src/cream_allowedSubmission.py",
                   "src/cream_jobOutput.py", 
                   "src/cream_jobSubmit.py", 
-                  "src/cream_serviceInfo.py"
+                  "src/cream_serviceInfo.py",
+                  "src/cream_probe.py",
+                  "src/cream_probeRunner.py",
+                  "src/cream_probeDaemon.py",
+                  "src/cream_probeClient.py",
+                  "src/cream_probeReaper.py",
+                  "src/cream_probeHistory.py",
+                  "src/cream_probeLoadTest.py"
                  ]
 
 etc_list = [
@@ -70,6 +77,8 @@ used to monitor a CREAM CE node.''',
       package_dir={'': 'src'},
       scripts=python_scripts,
       data_files=[ ('etc/nagios/plugins/%s' % pkg_ns, etc_list) ],
+      # the scripts are thin wrappers: the package ships compiled, .pyc and .pyo
+      options={'install_lib': {'compile': 1, 'optimize': 1}},
       cmdclass={'bdist_rpm': bdist_rpm}
      )
 
@@ -23,22 +23,9 @@ __author__ = "Lisa Zangrando lisa.zangrando@pd.infn.it"
 __date__ = "12.12.2019"
 __version__ = "0.1.1"
 
-from cream_cli.cream import Client
-
-def main():
-    client = Client("cream_allowedSubmission", "1.1")
-    client.createParser("FALSE")
-    client.readOptions()
-
-    try:
-        client.checkProxy()
-
-        data = client.allowedSubmission()
-        client.nagiosExit(client.OK, "CREAM allowedSubmission OK: the job submission is %s" % data)
-    except Exception as ex:
-        client.nagiosExit(client.CRITICAL, "CREAM allowedSubmission ERROR: %s" % ex)
+# the command is taken from the script name: see cream_cli.commands
+from cream_cli.commands import main
 
 
 if __name__ == '__main__':
     main()
-
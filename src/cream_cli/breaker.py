@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+The circuit breaker of a CE (host:port), shared by all the probes through
+a state file: after some consecutive connection failures the CE is not
+contacted until the cool-down has elapsed, then a single probe tries it.
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+import os, re, time
+
+from cream_cli.state import StateFile, fileName
+
+
+BREAKER_DIR = "breaker"
+
+# the failures meaning that the CE cannot be reached, as opposed to errors reported by the CE
+CONNECTION_ERRORS = re.compile(r"connection refused|timed out|no route to host|"
+                               r"network is unreachable|name or service not known|could not resolve|host not found|"
+                               r"connection reset|connection closed|broken pipe|eof was observed|ssl handshake", re.IGNORECASE)
+
+
+#Whether the error means that the CE cannot be reached.
+def isConnectionError(error):
+    return CONNECTION_ERRORS.search("%s" % error) is not None
+
+
+
+class BreakerOpen(Exception):
+    pass
+
+
+
+# state: {"failures": consecutive connection failures, "error": the last one,
+#         "opened": when the breaker opened, "trial": when the running trial started}
+class Breaker(object):
+    # this probe is running the half-open trial
+    trial = False
+
+    #debug(msg) logs the problems of the state file.
+    def __init__(self, stateDir, endpoint, threshold, cooldown, trialTime, debug=None):
+        self.endpoint = endpoint
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.trialTime = trialTime
+        self.state = StateFile(os.path.join(stateDir, BREAKER_DIR, fileName(endpoint) + ".json"))
+        self.debug = debug or (lambda msg: None)
+
+
+    def isOpen(self, data):
+        return data.get("failures", 0) >= self.threshold
+
+
+    def openError(self, data, now):
+        return BreakerOpen("CE %s unreachable, not contacted for %d sec after %d consecutive connection failures (circuit breaker open, next trial in %d sec): %s" % (
+                           self.endpoint, now - data["opened"], data["failures"], max(0, data["opened"] + self.cooldown - now), data.get("error")))
+
+
+    #Raise BreakerOpen unless the CE can be contacted: the breaker is closed, or this probe runs the half-open trial.
+    #An unusable state is a problem of the monitoring host, not of the CE: the call is then allowed.
+    def allow(self):
+        if self.trial:
+            return
+
+        try:
+            self.check()
+        except (IOError, OSError, ValueError) as ex:
+            self.debug("cannot read the circuit breaker of %s, contacting the CE: %s" % (self.endpoint, ex))
+
+
+    #Raise BreakerOpen if the breaker is open and this probe cannot run the half-open trial.
+    def check(self):
+        now = time.time()
+
+        # the shared lock is enough while the breaker is closed, the common case
+        data = self.state.read()
+
+        if not self.isOpen(data):
+            return
+
+        with self.state.update() as data:
+            if not self.isOpen(data):
+                return
+
+            if now - data["opened"] < self.cooldown:
+                raise self.openError(data, now)
+
+            # a single probe at a time tries the CE once the cool-down has elapsed
+            if "trial" in data and now - data["trial"] < self.trialTime:
+                raise self.openError(data, now)
+
+            data["trial"] = now
+            self.trial = True
+
+
+    #The CE answered: close the breaker.
+    def success(self):
+        data = self.state.read()
+
+        if not data.get("failures") and not self.trial:
+            return
+
+        with self.state.update() as data:
+            data.clear()
+
+        self.trial = False
+
+
+    #Count a connection failure: the breaker opens at the threshold, a failed trial opens it again.
+    def failure(self, error):
+        now = time.time()
+
+        with self.state.update() as data:
+            data["failures"] = data.get("failures", 0) + 1
+            data["error"] = ("%s" % error)[:1000]
+            data.pop("trial", None)
+
+            if self.trial or (self.isOpen(data) and "opened" not in data):
+                data["opened"] = now
+
+        self.trial = False
+
+
+    #Record the outcome of a call to the CE.
+    def record(self, error=None):
+        if error is not None and isConnectionError(error):
+            self.failure(error)
+        else:
+            self.success()
@@ -0,0 +1,454 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+The CREAM CE checks: each one returns the Nagios exit code and message.
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+import os, time
+
+# the job lifecycle modules are imported by the job checks only
+
+
+terminalStates = ['DONE-OK', 'DONE-FAILED', 'ABORTED', 'CANCELLED']
+activeStates = ['IDLE', 'RUNNING', 'REALLY-RUNNING']
+
+
+#Submit a job, wait for its terminal status and finally purge it.
+def jobSubmit(client):
+    if client.sharedJob:
+        return sharedJobSubmit(client)
+
+    if client.asyncJob:
+        from cream_cli.lifecycle import AsyncJob
+
+        return AsyncJob(client, "jobSubmit").run(finishJobSubmit, "CREAM JobSubmit ERROR: ", "CREAM JobSubmit OK: ")
+
+    try:
+        client.checkProxy()
+
+        jobId = client.jobSubmit()
+
+        client.debug("job id: " + jobId)
+    except Exception as ex:
+        return client.CRITICAL, "CREAM JobSubmit ERROR: %s" % ex
+
+    try:
+        lastStatus, exitCode = client.waitForState(jobId, terminalStates, deadline=client.deadline, exitCodes=['0', '1', 'N/A'])
+    except Exception as ex:
+        return client.CRITICAL, "CREAM JobSubmit ERROR: %s" % ex
+
+    return finishJobSubmit(client, jobId, lastStatus, exitCode)
+
+
+
+#Purge a terminated jobSubmit job and judge its status.
+def finishJobSubmit(client, jobId, lastStatus, exitCode):
+    try:
+        client.jobPurge(jobId)
+    except Exception as ex:
+        client.debug("cannot purge the job %s" % ex)
+
+    if lastStatus == terminalStates[0] and exitCode == "0":
+        return client.OK, "CREAM JobSubmit OK [%s]" % lastStatus
+
+    return client.CRITICAL, "CREAM JobSubmit ERROR [%s, exitCode=%s]" % (lastStatus, exitCode)
+
+
+
+#Read the output sandbox file by file within the per-file and total byte budgets.
+#Return the report and the size of the sandbox on disk.
+def readOutputSandbox(client, osbdir):
+    files = sorted(os.listdir(osbdir))
+    report = ["retrieved outputSandbox: %s" % files]
+    budget = client.maxOutputBytes
+    size = 0
+
+    for file in files:
+        path = os.path.join(osbdir, file)
+        fileSize = os.path.getsize(path)
+        size += fileSize
+
+        report.append("\n\n**** " + file + " ****\n")
+
+        with open(path) as infile:
+            data = infile.read(max(0, min(client.maxFileBytes, budget)))
+
+        budget -= len(data)
+        report.append(data.replace('|','_PIPE_'))
+
+        if fileSize > len(data):
+            report.append("\n[... truncated %d of %d bytes]" % (fileSize - len(data), fileSize))
+
+    return "".join(report), size
+
+
+
+#Submit a job, wait for its terminal status, retrieve its output sandbox and finally purge it.
+def jobOutput(client):
+    if client.sharedJob:
+        return sharedJobOutput(client)
+
+    if client.asyncJob:
+        from cream_cli.lifecycle import AsyncJob
+
+        return AsyncJob(client, "jobOutput").run(finishJobOutput, "CREAM JobOutput ERROR: ", "CREAM JobOutput OK: ")
+
+    try:
+        client.checkProxy()
+
+        jobId = client.jobSubmit()
+
+        client.debug("job id: " + jobId)
+    except Exception as ex:
+        return client.CRITICAL, "CREAM JobOutput ERROR: %s" % ex
+
+    try:
+        lastStatus, exitCode = client.waitForState(jobId, terminalStates, deadline=client.deadline, exitCodes=['0', '1', 'N/A'])
+    except Exception as ex:
+        return client.CRITICAL, "CREAM JobOutput ERROR: %s" % ex
+
+    return finishJobOutput(client, jobId, lastStatus, exitCode)
+
+
+
+#Retrieve the output sandbox of a terminated jobOutput job, purge it and judge its status.
+def finishJobOutput(client, jobId, lastStatus, exitCode):
+    outputSandbox = None
+    if lastStatus == terminalStates[0]:
+        try:
+            start = time.time()
+            osbdir = client.getOutputSandbox(jobId)
+            client.debug("output sandbox dir: " + osbdir)
+
+            outputSandbox, size = readOutputSandbox(client, osbdir)
+
+            client.addPerfData("osb_size", size, "B")
+            client.addPerfData("osb_time", time.time() - start, "s")
+
+            import shutil
+
+            shutil.rmtree(osbdir)
+        except Exception as ex:
+            return client.CRITICAL, "CREAM JobOutput ERROR: %s" % ex
+
+    try:
+        client.jobPurge(jobId)
+    except Exception as ex:
+        client.debug("cannot purge the job %s" % ex)
+
+    if lastStatus == terminalStates[0] and exitCode == "0":
+        return client.OK, "CREAM JobOutput OK: " + outputSandbox
+
+    return client.CRITICAL, "CREAM JobOutput ERROR [%s, exitCode=%s ]: %s" % (lastStatus, exitCode, outputSandbox)
+
+
+
+#Submit a job, wait for it to become active and finally cancel it.
+def jobCancel(client):
+    # the job must be caught while active: it cannot be left running until the next run
+    if client.asyncJob:
+        return client.UNKNOWN, "the asynchronous mode is not supported by jobCancel"
+
+    try:
+        client.checkProxy()
+
+        jobId = client.jobSubmit()
+
+        client.debug("job id: " + jobId)
+    except Exception as ex:
+        return client.CRITICAL, ex
+
+    try:
+        client.waitForState(jobId, activeStates, terminalStates, client.deadline)
+    except Exception as ex:
+        return client.CRITICAL, ex
+
+    try:
+        client.jobCancel(jobId)
+    except Exception as ex:
+        return client.CRITICAL, ex
+
+    try:
+        client.waitForState(jobId, ["CANCELLED"], deadline=client.deadline)
+    except Exception as ex:
+        return client.CRITICAL, ex
+
+    try:
+        client.jobPurge(jobId)
+    except Exception as ex:
+        client.debug("cannot purge the job")
+
+    return client.OK, "OK: job cancelled"
+
+
+
+#Submit a job, wait for its terminal status, purge it and check it disappeared.
+def jobPurge(client):
+    if client.sharedJob:
+        return sharedJobPurge(client)
+
+    if client.asyncJob:
+        from cream_cli.lifecycle import AsyncJob
+
+        return AsyncJob(client, "jobPurge").run(finishJobPurge, "", "OK: ")
+
+    try:
+        client.checkProxy()
+
+        jobId = client.jobSubmit()
+
+        client.debug("job id: " + jobId)
+    except Exception as ex:
+        return client.CRITICAL, ex
+
+    try:
+        lastStatus, exitCode = client.waitForState(jobId, terminalStates, deadline=client.deadline)
+    except Exception as ex:
+        return client.CRITICAL, ex
+
+    return finishJobPurge(client, jobId, lastStatus, exitCode)
+
+
+
+#Purge a terminated jobPurge job and check it disappeared.
+def finishJobPurge(client, jobId, lastStatus, exitCode):
+    try:
+        client.jobPurge(jobId)
+    except Exception as ex:
+        return client.CRITICAL, ex
+
+    try:
+        client.waitForPurge(jobId, client.deadline)
+    except Exception as ex:
+        return client.CRITICAL, ex
+
+    return client.OK, "OK: job purged"
+
+
+
+#Report the timings of the shared job measured by the probe running its lifecycle.
+def sharedTimings(client, data):
+    client.history = [tuple(entry) for entry in data.get("history", [])]
+    client.timings = data.get("timings", {})
+    client.polls = data.get("polls", 0)
+
+
+
+#The verdict of jobSubmit on the job shared with jobOutput and jobPurge.
+def sharedJobSubmit(client):
+    try:
+        client.checkProxy()
+
+        from cream_cli.lifecycle import SharedJob
+
+        data = SharedJob(client).get("status")
+    except Exception as ex:
+        return client.CRITICAL, "CREAM JobSubmit ERROR: %s" % ex
+
+    sharedTimings(client, data)
+
+    if "error" in data:
+        return client.CRITICAL, "CREAM JobSubmit ERROR: %s" % data["error"]
+
+    if data["status"] == terminalStates[0] and data["exitCode"] == "0":
+        return client.OK, "CREAM JobSubmit OK [%s]" % data["status"]
+
+    return client.CRITICAL, "CREAM JobSubmit ERROR [%s, exitCode=%s]" % (data["status"], data["exitCode"])
+
+
+
+#The verdict of jobOutput on the job shared with jobSubmit and jobPurge.
+def sharedJobOutput(client):
+    try:
+        client.checkProxy()
+
+        from cream_cli.lifecycle import SharedJob
+
+        data = SharedJob(client).get("outputSandbox")
+    except Exception as ex:
+        return client.CRITICAL, "CREAM JobOutput ERROR: %s" % ex
+
+    sharedTimings(client, data)
+
+    if "error" in data:
+        return client.CRITICAL, "CREAM JobOutput ERROR: %s" % data["error"]
+
+    if "outputError" in data:
+        return client.CRITICAL, "CREAM JobOutput ERROR: %s" % data["outputError"]
+
+    if "osbSize" in data:
+        client.addPerfData("osb_size", data["osbSize"], "B")
+        client.addPerfData("osb_time", data["osbTime"], "s")
+
+    outputSandbox = data["outputSandbox"] and data["outputSandbox"].encode("utf-8")
+
+    if data["status"] == terminalStates[0] and data["exitCode"] == "0":
+        return client.OK, "CREAM JobOutput OK: " + outputSandbox
+
+    return client.CRITICAL, "CREAM JobOutput ERROR [%s, exitCode=%s ]: %s" % (data["status"], data["exitCode"], outputSandbox)
+
+
+
+#The verdict of jobPurge on the job shared with jobSubmit and jobOutput.
+def sharedJobPurge(client):
+    try:
+        client.checkProxy()
+
+        from cream_cli.lifecycle import SharedJob
+
+        data = SharedJob(client).get("purged")
+    except Exception as ex:
+        return client.CRITICAL, ex
+
+    sharedTimings(client, data)
+
+    if "error" in data:
+        return client.CRITICAL, data["error"]
+
+    if not data["purged"]:
+        return client.CRITICAL, data["purgeError"]
+
+    return client.OK, "OK: job purged"
+
+
+
+#Retrieve the service info: started is the command of serviceInfoAsync when the check was started on an engine (see startCheck).
+def serviceInfo(client, started=None):
+    try:
+        if started:
+            data = started.wait()
+        else:
+            client.checkProxy()
+
+            data = client.serviceInfo()
+        datv = data.split("\n")
+        return client.OK, "CREAM serviceInfo OK: %s" % datv[1]
+    except Exception as ex:
+        return client.CRITICAL, "CREAM serviceInfo ERROR: %s" % ex
+
+
+
+#Check whether the job submission is allowed: started is the command of allowedSubmissionAsync (see startCheck).
+def allowedSubmission(client, started=None):
+    try:
+        if started:
+            data = started.wait()
+        else:
+            client.checkProxy()
+
+            data = client.allowedSubmission()
+        return client.OK, "CREAM allowedSubmission OK: the job submission is %s" % data
+    except Exception as ex:
+        return client.CRITICAL, "CREAM allowedSubmission ERROR: %s" % ex
+
+
+
+# check name: (client name, client version, full options, check)
+CHECKS = {
+    "jobSubmit":         ("cream-jobSubmit", "1.1", "TRUE", jobSubmit),
+    "jobOutput":         ("cream-jobOutput", "1.1", "TRUE", jobOutput),
+    "jobCancel":         ("cream_jobCancel", "1.0", "TRUE", jobCancel),
+    "jobPurge":          ("cream_jobPurge", "1.0", "TRUE", jobPurge),
+    "serviceInfo":       ("cream_serviceInfo", "1.1", "FALSE", serviceInfo),
+    "allowedSubmission": ("cream_allowedSubmission", "1.1", "FALSE", allowedSubmission)
+}
+
+# the checks made of a single command, which can share an engine: check name -> the Client method starting it
+ASYNC_CHECKS = {
+    "serviceInfo":       "serviceInfoAsync",
+    "allowedSubmission": "allowedSubmissionAsync"
+}
+
+# the name of a check in its messages ("CREAM JobSubmit OK: ..."), where it differs from the name of the check
+LABELS = {
+    "jobSubmit": "JobSubmit",
+    "jobOutput": "JobOutput"
+}
+
+
+
+
+#Run the check with the client: on every queue of the CE when several are given (--queues, --queue-file).
+def runOn(client, check, run):
+    if client.queues:
+        from cream_cli.fanout import QueueFanOut
+
+        return QueueFanOut(client).run(LABELS.get(check, check), run)
+
+    return run(client)
+
+
+
+#Run a check inside the current process with the given command-line and return its Nagios exit code and message.
+#cwd and environ are those of the caller when it is another process; started(client) is called with the client of the check.
+def runCheck(check, args, cwd=None, environ=None, started=None):
+    from cream_cli.cream import Client, ProbeExit
+
+    name, version, fullOptional, run = CHECKS[check]
+
+    try:
+        client = Client(name, version, embedded=True, cwd=cwd, environ=environ)
+
+        if started:
+            started(client)
+
+        client.createParser(fullOptional)
+        client.readOptions(args)
+
+        return client.finalize(*runOn(client, check, run))
+    except ProbeExit as ex:
+        return ex.exitCode, ex.msg
+    except Exception as ex:
+        return Client.UNKNOWN, "%s ERROR: %s" % (name, ex)
+
+
+
+#Start a check of ASYNC_CHECKS on the given engine, shared with other checks: return its client and its command.
+#The engine must be driven by the calling thread; finishCheck gives the verdict once the command is done.
+def startCheck(check, args, engine):
+    from cream_cli.cream import Client
+
+    name, version, fullOptional, run = CHECKS[check]
+
+    client = Client(name, version, embedded=True)
+    client.engine = engine
+
+    try:
+        client.createParser(fullOptional)
+        client.readOptions(args)
+        client.checkProxy()
+
+        return client, getattr(client, ASYNC_CHECKS[check])()
+    except Exception as ex:
+        return client, engine.completed(error=ex)
+
+
+
+#Return the Nagios exit code and message of a check started by startCheck.
+def finishCheck(check, client, command):
+    from cream_cli.cream import ProbeExit
+
+    try:
+        if isinstance(command.error, ProbeExit):
+            raise command.error
+
+        return client.finalize(*CHECKS[check][3](client, command))
+    except ProbeExit as ex:
+        return ex.exitCode, ex.msg
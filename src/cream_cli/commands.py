@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+The single entry point of the cream_* scripts: the command is taken from
+the script name (cream_jobSubmit.py, a symlink...) or from the first
+argument (cream_probe.py jobSubmit -u ...). Only the modules needed by
+the command are imported.
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+import os, sys
+
+
+UNKNOWN = 3
+
+CHECK_NAMES = ["jobSubmit", "jobOutput", "jobCancel", "jobPurge", "serviceInfo", "allowedSubmission"]
+
+# the scripts whose name is not the command they run
+SCRIPTS = {"probeRunner": "runner", "probeDaemon": "daemon", "probeReaper": "reaper", "probeHistory": "history",
+           "probeLoadTest": "loadtest"}
+
+
+#Run a check as a standalone Nagios plugin.
+def check(name, args):
+    from cream_cli.cream import Client
+    from cream_cli.checks import CHECKS, runOn
+
+    clientName, version, fullOptional, run = CHECKS[name]
+
+    client = Client(clientName, version)
+    client.createParser(fullOptional)
+    client.readOptions(args)
+
+    client.nagiosExit(*runOn(client, name, run))
+
+
+
+def runner(args):
+    from cream_cli.runner import Runner
+
+    runner = Runner("cream_probeRunner", "1.0")
+    runner.createParser()
+    runner.readOptions(args)
+
+    exit(runner.run())
+
+
+
+def daemon(args):
+    from cream_cli.daemon import main
+
+    main(args)
+
+
+
+def reaper(args):
+    from cream_cli.reaper import Reaper
+
+    reaper = Reaper("cream_probeReaper", "1.0")
+    reaper.createParser()
+    reaper.readOptions(args)
+
+    exit(reaper.run())
+
+
+
+def history(args):
+    from cream_cli.report import HistoryReport
+
+    report = HistoryReport("cream_probeHistory", "1.0")
+    report.createParser()
+    report.readOptions(args)
+
+    exit(report.run())
+
+
+
+def loadtest(args):
+    from cream_cli.loadtest import LoadTest
+
+    test = LoadTest("cream_probeLoadTest", "1.0")
+    test.createParser()
+    test.readOptions(args)
+
+    exit(test.run())
+
+
+
+TOOLS = {"runner": runner, "daemon": daemon, "reaper": reaper, "history": history, "loadtest": loadtest}
+
+
+#The command named by the script, or None for the multiplexed cream_probe script.
+def scriptCommand(path):
+    name = os.path.basename(path).split(".")[0]
+
+    if name.startswith("cream_"):
+        name = name[len("cream_"):]
+
+    name = SCRIPTS.get(name, name)
+
+    if name in CHECK_NAMES or name in TOOLS:
+        return name
+
+    return None
+
+
+
+def usage(out):
+    out.write("usage: %s <command> [options]\n\n" % os.path.basename(sys.argv[0]))
+    out.write("checks: %s\n" % ", ".join(CHECK_NAMES))
+    out.write("tools:  %s\n" % ", ".join(sorted(TOOLS)))
+    out.write("\nRun '%s <command> --help' for the options of a command.\n" % os.path.basename(sys.argv[0]))
+
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    args = argv[1:]
+    command = scriptCommand(argv[0])
+
+    if command is None:
+        if args and args[0] in ["-h", "--help"]:
+            usage(sys.stdout)
+            exit(0)
+
+        if not args or (args[0] not in CHECK_NAMES and args[0] not in TOOLS):
+            usage(sys.stderr)
+            exit(UNKNOWN)
+
+        command = args.pop(0)
+
+    if command in TOOLS:
+        return TOOLS[command](args)
+
+    check(command, args)
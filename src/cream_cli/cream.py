@@ -25,7 +25,45 @@ __version__ = "0.1.0"
 
 from optparse import OptionParser, OptionGroup
 from urlparse import urlparse
-import signal, subprocess, shlex, sys, time, string, os
+from contextlib import contextmanager
+import signal, shlex, sys, time, string, os, re
+
+from cream_cli.status import parseStatus
+from cream_cli.deadline import Deadline, DeadlineExceeded
+
+# the other modules of the package (and the subprocess, json, uuid... modules they need) are
+# imported by the methods using them: --help and the service checks do not pay for them
+
+
+class ProbeExit(Exception):
+    #Raised instead of exiting the process when the probe runs embedded (e.g. --help).
+    def __init__(self, exitCode, msg):
+        Exception.__init__(self, msg)
+        self.exitCode = exitCode
+        self.msg = msg
+
+
+
+class ProbeOptionParser(OptionParser):
+    #Raise the usage error instead of exiting: used when the probe runs embedded in another process.
+    def error(self, msg):
+        raise Exception("wrong options: " + msg)
+
+    def print_help(self, file=None):
+        raise ProbeExit(0, self.format_help().rstrip())
+
+    def print_version(self, file=None):
+        raise ProbeExit(0, self.get_version())
+
+
+
+#A threshold in the performance data and in the messages: 600 rather than 600.0, empty if not set.
+def formatThreshold(value):
+    if value is None:
+        return ""
+
+    return "%g" % value
+
 
 
 class Client(object):
@@ -38,11 +76,51 @@ class Client(object):
     # Default values for the different options and Constants    
     DEFAULT_PORT = 8443
     DEFAULT_TIMEOUT = 120
+    DEFAULT_CLEANUP_RESERVE = 20
     DEFAULT_VERBOSITY = False 
     DEFAULT_DISABLE_PROXY_CHECK = False
+    DEFAULT_PROXY_WARNING = 0
+    DEFAULT_PROXY_CRITICAL = 0
+    DEFAULT_STATE_DIR = "/var/lib/argo-monitoring/eu.egi.CREAMCE"
+    DEFAULT_CLI_PATH = "/usr/bin"
+    DEFAULT_BACKEND = "cli"
+    BACKENDS = ["cli", "ws"]
+    DEFAULT_CA_PATH = "/etc/grid-security/certificates"
+    DEFAULT_AUTO_DELEGATION = False
+    DEFAULT_MAX_FILE_BYTES = 1024
+    DEFAULT_MAX_OUTPUT_BYTES = 4096
+    DEFAULT_CACHE_TTL = 60
+    DEFAULT_HISTORY_SIZE = 4096
+    DEFAULT_BREAKER_THRESHOLD = 3
+    DEFAULT_BREAKER_COOLDOWN = 300
+    DEFAULT_MAX_PER_CE = 4
+    DEFAULT_MAX_GLOBAL = 0
+    DEFAULT_JITTER = 0
+    DEFAULT_SUBMIT_RATE = 0
+    DEFAULT_SUBMIT_BURST = 1
+    DEFAULT_SHARED_JOB = 0
+    DEFAULT_ASYNC_JOB = False
+    DEFAULT_KEEP_SANDBOX = False
+    DEFAULT_MAX_JOB_AGE = 3600
+    DEFAULT_POLL_INITIAL = 2
+    DEFAULT_POLL_MAX = 30
+    DEFAULT_POLL_FACTOR = 1.5
+    BULK_CHUNK_SIZE = 50
+    # the options naming a file or a directory
+    PATH_OPTIONS = ["proxy", "stateDir", "cliPath", "caPath", "jdl", "queueFile", "dir"]
+    JDL_INPUT_SANDBOX = re.compile(r"^\s*InputSandbox\s*=", re.MULTILINE | re.IGNORECASE)
+    # the timed operations reported in the performance data, in order
+    TIMED_PHASES = ["submit", "queue_wait", "run", "output", "cancel", "purge", "service_info", "allowed_submission"]
+    # the latency thresholds of the job checks (-w/-c metric=seconds,...): metric -> measured phase
+    THRESHOLD_METRICS = {"turnaround": "turnaround", "queue": "queue_wait", "submit": "submit"}
+    RUNNING_STATES = ["RUNNING", "REALLY-RUNNING"]
+    TERMINAL_STATES = ["DONE-OK", "DONE-FAILED", "ABORTED", "CANCELLED"]
+
+    # the job ids mentioned by the glite-ce-* commands, e.g. https://<host>:<port>/CREAM123456789
+    JOBID_PATTERN = re.compile(r"https://[^\s\[\]]+/CREAM[\w\-]+")
 
     # Variables
-    usage = "usage %prog [options]"
+    usage = "%prog [options]"
     # probeName = "CREAMProbe"
     optionParser = None
     options = None
@@ -52,24 +130,257 @@ class Client(object):
     hostname = None
     port = None
     jdl = None
+    inlinePayload = False
     queue = None
     lrms = None
+    # the queues of the CE probed in the same run (queue fan-out): [(lrms, queue)]
+    queues = None
+    delegated = None
     timeout = DEFAULT_TIMEOUT
     verbose = DEFAULT_VERBOSITY
     fullOptional = None
     disableProxyCheck = DEFAULT_DISABLE_PROXY_CHECK
-
-
-    def __init__(self, name, version):
+    proxyWarning = DEFAULT_PROXY_WARNING
+    proxyCritical = DEFAULT_PROXY_CRITICAL
+    stateDir = DEFAULT_STATE_DIR
+    cliPath = DEFAULT_CLI_PATH
+    backend = DEFAULT_BACKEND
+    caPath = DEFAULT_CA_PATH
+    cream = None
+    autoDelegation = DEFAULT_AUTO_DELEGATION
+    warnings = None
+    perfData = None
+    maxFileBytes = DEFAULT_MAX_FILE_BYTES
+    maxOutputBytes = DEFAULT_MAX_OUTPUT_BYTES
+    cacheTtl = DEFAULT_CACHE_TTL
+    historySize = DEFAULT_HISTORY_SIZE
+    breakerThreshold = DEFAULT_BREAKER_THRESHOLD
+    breakerCooldown = DEFAULT_BREAKER_COOLDOWN
+    breaker = None
+    maxPerCE = DEFAULT_MAX_PER_CE
+    maxGlobal = DEFAULT_MAX_GLOBAL
+    jitter = DEFAULT_JITTER
+    submitRate = DEFAULT_SUBMIT_RATE
+    submitBurst = DEFAULT_SUBMIT_BURST
+    refresh = False
+    sharedJob = DEFAULT_SHARED_JOB
+    asyncJob = DEFAULT_ASYNC_JOB
+    maxJobAge = DEFAULT_MAX_JOB_AGE
+    history = None
+    timings = None
+    proxy = None
+    embedded = False
+    deadline = None
+    cleanupReserve = DEFAULT_CLEANUP_RESERVE
+    pendingJobs = None
+    warningThresholds = None
+    criticalThresholds = None
+    pollInitial = DEFAULT_POLL_INITIAL
+    pollMax = DEFAULT_POLL_MAX
+    pollFactor = DEFAULT_POLL_FACTOR
+    polls = 0
+    waitTime = 0
+    engine = None
+    # the clients of the queues of the fan-out
+    children = None
+
+
+    #cwd and environ are those of the caller when the probe runs on its behalf (e.g. in the probe daemon).
+    def __init__(self, name, version, embedded=False, cwd=None, environ=None):
         #signal.signal(signal.SIGALRM, self.sig_handler)
         #signal.signal(signal.SIGTERM, self.sig_handler)
         self.name = name
         self.version = version
-        self.optionParser = OptionParser(version="%s v.%s" % (self.name, "1.0"))
+        self.embedded = embedded
+        self.cwd = cwd
+        self.environ = os.environ if environ is None else environ
+        self.warnings = []
+        self.perfData = []
+        self.history = []
+        self.timings = {}
+        self.pendingJobs = []
+        self.warningThresholds = {}
+        self.criticalThresholds = {}
+        self.deadline = Deadline(self.timeout, self.cleanupReserve)
+
+        if embedded:
+            self.optionParser = ProbeOptionParser(prog=self.name, version="%s v.%s" % (self.name, "1.0"))
+        else:
+            self.optionParser = OptionParser(version="%s v.%s" % (self.name, "1.0"))
+
+
+    # record a Nagios performance data item, e.g. addPerfData("osb_time", 1.5, "s")
+    def addPerfData(self, label, value, uom="", warning=None, critical=None):
+        if isinstance(value, float):
+            value = "%.3f" % value
+
+        if warning is None and critical is None:
+            self.perfData.append("%s=%s%s" % (label, value, uom))
+        else:
+            self.perfData.append("%s=%s%s;%s;%s" % (label, value, uom, formatThreshold(warning), formatThreshold(critical)))
+
+
+    # accumulate the time spent in an operation, e.g. with self.timed("purge"): ...
+    # the operation is also the phase reported if the time budget runs out
+    @contextmanager
+    def timed(self, phase):
+        start = time.time()
+
+        try:
+            with self.deadline.within(phase):
+                yield
+        finally:
+            self.addTiming(phase, start)
+
+
+    # accumulate the time spent in an operation since start
+    def addTiming(self, phase, start):
+        self.timings[phase] = self.timings.get(phase, 0) + time.time() - start
+
+
+
+    # the queue wait, run time and time to completion of the job, as seen by the polls of its status history:
+    # SUBMITTED -> (first active status) -> (first terminal status)
+    # a short job may go from IDLE to its terminal status between two polls: only its completion is then known
+    def historyTimings(self):
+        submitted = started = ended = None
+
+        for status, when in self.history:
+            if status == "SUBMITTED":
+                submitted, started, ended = when, None, None
+            elif status in self.RUNNING_STATES and started is None:
+                started = when
+            elif status in self.TERMINAL_STATES and ended is None:
+                ended = when
+
+        timings = {}
+
+        if submitted is not None and ended is not None:
+            timings["completion"] = ended - submitted
+
+        if submitted is not None and started is not None:
+            timings["queue_wait"] = started - submitted
+
+            if ended is not None:
+                timings["run"] = ended - started
+
+        return timings
+
+
+
+    # the time spent in each phase, including the queue wait and run time of the job
+    # and the turnaround from the submission to the terminal status
+    def phaseTimings(self):
+        timings = dict(self.timings)
+        timings.update(self.historyTimings())
+
+        if "completion" in timings:
+            timings["turnaround"] = timings.get("submit", 0) + timings.pop("completion")
+
+        return timings
+
+
+
+    # the per-phase performance data: submit_time, queue_wait, run_time, output_time, ..., polls
+    def phasePerfData(self):
+        timings = self.phaseTimings()
+        thresholds = dict((phase, metric) for metric, phase in self.THRESHOLD_METRICS.items())
+
+        for phase in self.TIMED_PHASES + ["turnaround"]:
+            if phase in timings:
+                label = phase if phase in ["queue_wait", "turnaround"] else phase + "_time"
+                metric = thresholds.get(phase)
+
+                self.addPerfData(label, float(timings[phase]), "s", self.warningThresholds.get(metric), self.criticalThresholds.get(metric))
+
+        if "submit" in timings or self.polls:
+            self.addPerfData("polls", self.polls)
+
+
+
+    # a successful check is downgraded to WARNING when something deserves attention (e.g. the proxy is expiring)
+    # the performance data go at the end of the first line, before the long output
+    def finalize(self, exitCode, msg):
+        if self.deadline.overrun:
+            exitCode, msg = self.timeoutVerdict(msg)
+
+        msg = "%s" % msg
+
+        exitCode, msg = self.thresholdVerdict(exitCode, msg)
+
+        self.phasePerfData()
+
+        if self.warnings:
+            if exitCode == self.OK:
+                exitCode = self.WARNING
+
+            lines = msg.split("\n", 1)
+            lines[0] = "%s [%s]" % (lines[0], "; ".join(self.warnings))
+            msg = "\n".join(lines)
+
+        if self.perfData:
+            lines = msg.split("\n", 1)
+            lines[0] = "%s | %s" % (lines[0], " ".join(self.perfData))
+            msg = "\n".join(lines)
+
+        self.recordResult(exitCode)
+
+        return exitCode, msg
+
+
+
+    # a slow job check is WARNING or CRITICAL even if the job succeeded: the breached metrics are named in the message
+    def thresholdVerdict(self, exitCode, msg):
+        if exitCode >= self.CRITICAL or not (self.warningThresholds or self.criticalThresholds):
+            return exitCode, msg
+
+        timings = self.phaseTimings()
+        level = self.OK
+        breaches = []
+
+        for metric in sorted(self.THRESHOLD_METRICS):
+            value = timings.get(self.THRESHOLD_METRICS[metric])
+
+            if value is None:
+                continue
+
+            for thresholdLevel, thresholds in [(self.CRITICAL, self.criticalThresholds), (self.WARNING, self.warningThresholds)]:
+                if metric in thresholds and value > thresholds[metric]:
+                    level = max(level, thresholdLevel)
+                    breaches.append("%s=%.3fs > %ss" % (metric, value, formatThreshold(thresholds[metric])))
+                    break
+
+        if not breaches:
+            return exitCode, msg
+
+        lines = msg.split("\n", 1)
+        lines[0] = "%s [too slow: %s]" % (lines[0], ", ".join(breaches))
+
+        return max(exitCode, level), "\n".join(lines)
+
+
+
+    # append the result to the history of the CE (see cream_probeHistory.py)
+    def recordResult(self, exitCode):
+        if self.historySize <= 0 or not self.hostname:
+            return
+
+        from cream_cli.history import History
+
+        timings = self.phaseTimings()
+        timings["total"] = time.time() - self.deadline.start
+
+        try:
+            History(self.stateDir, "%s:%s" % (self.hostname, self.port)).append(self.name[len("cream-"):], exitCode, timings,
+                                                                              self.polls, capacity=self.historySize)
+        except Exception as ex:
+            self.debug("cannot record the result in the history: %s" % ex)
 
 
     # return Values for Nagios
     def nagiosExit(self, exitCode, msg):
+        exitCode, msg = self.finalize(exitCode, msg)
+
         print msg
         exit(exitCode)
 
@@ -99,6 +410,12 @@ class Client(object):
                       dest="timeout",
                       help="Probe execution time limit. [default: %default sec]",
                       default = self.DEFAULT_TIMEOUT)
+
+        optionParser.add_option("--cleanup-reserve",
+                      dest="cleanupReserve",
+                      type="int",
+                      default = self.DEFAULT_CLEANUP_RESERVE,
+                      help="Part of the time limit kept for cancelling and purging the job once the check has run out of time (at most half of the time limit). [default: %default sec]")
         
         optionParser.add_option("-v",
                       "--verbose",
@@ -112,6 +429,86 @@ class Client(object):
                       dest="disableProxyCheck",
                       help="Disable checking user proxy certificate validity [default: %default]",
                       default = self.DEFAULT_DISABLE_PROXY_CHECK)
+
+        optionParser.add_option("--proxy-warning",
+                      dest="proxyWarning",
+                      type="int",
+                      help="Minimum proxy lifetime below which the result is WARNING. [default: %default sec]",
+                      default = self.DEFAULT_PROXY_WARNING)
+
+        optionParser.add_option("--proxy-critical",
+                      dest="proxyCritical",
+                      type="int",
+                      help="Minimum proxy lifetime below which the result is CRITICAL. [default: %default sec]",
+                      default = self.DEFAULT_PROXY_CRITICAL)
+
+        optionParser.add_option("--state-dir",
+                      dest="stateDir",
+                      help="The directory holding the state shared by the probes. [default: %default]",
+                      default = self.DEFAULT_STATE_DIR)
+
+        optionParser.add_option("--cli-path",
+                      dest="cliPath",
+                      help="The directory of the glite-ce-* commands, e.g. a simulator (environment: CREAM_CLI_PATH). [default: %s]" % self.DEFAULT_CLI_PATH)
+
+        optionParser.add_option("--backend",
+                      dest="backend",
+                      type="choice",
+                      choices=self.BACKENDS,
+                      default=self.DEFAULT_BACKEND,
+                      help="How to talk to CREAM: 'cli' runs the glite-ce-* commands, 'ws' calls the web service directly over kept-alive HTTPS connections (the proxy delegation and the output sandbox retrieval still use the commands). [default: %default]")
+
+        optionParser.add_option("--ca-path",
+                      dest="caPath",
+                      help="The directory (or file) of the CA certificates verifying the CE with the ws backend (environment: X509_CERT_DIR). [default: %s]" % self.DEFAULT_CA_PATH)
+
+        optionParser.add_option("--cache-ttl",
+                      dest="cacheTtl",
+                      type="int",
+                      help="Reuse the service info and allowed submission results younger than this (0 disables the cache). [default: %default sec]",
+                      default = self.DEFAULT_CACHE_TTL)
+
+        optionParser.add_option("--history-size",
+                      dest="historySize",
+                      type="int",
+                      help="Number of results kept in the history of the CE, set when the history is created (0 disables the history). [default: %default]",
+                      default = self.DEFAULT_HISTORY_SIZE)
+
+        optionParser.add_option("--breaker-threshold",
+                      dest="breakerThreshold",
+                      type="int",
+                      help="Consecutive connection failures after which the CE is no longer contacted by any probe until the cool-down has elapsed (0 disables the circuit breaker). [default: %default]",
+                      default = self.DEFAULT_BREAKER_THRESHOLD)
+
+        optionParser.add_option("--breaker-cooldown",
+                      dest="breakerCooldown",
+                      type="int",
+                      help="Time after which a single probe tries the CE again once the circuit breaker is open. [default: %default sec]",
+                      default = self.DEFAULT_BREAKER_COOLDOWN)
+
+        optionParser.add_option("--max-per-ce",
+                      dest="maxPerCE",
+                      type="int",
+                      help="Maximum number of glite-ce-* commands (or web service calls) run at the same time on a CE by all the probes; the others wait for a slot within their time limit (0 disables the limit). [default: %default]",
+                      default = self.DEFAULT_MAX_PER_CE)
+
+        optionParser.add_option("--max-global",
+                      dest="maxGlobal",
+                      type="int",
+                      help="Maximum number of glite-ce-* commands (or web service calls) run at the same time by all the probes on all the CEs (0 disables the limit). [default: %default]",
+                      default = self.DEFAULT_MAX_GLOBAL)
+
+        optionParser.add_option("--jitter",
+                      dest="jitter",
+                      type="float",
+                      help="Wait a random time up to this before starting the check, so that the checks scheduled at the same time do not hit the CE together. [default: %default sec]",
+                      default = self.DEFAULT_JITTER)
+
+        optionParser.add_option("--refresh",
+                      action="store_true",
+                      dest="refresh",
+                      help="Ignore the cached service info and allowed submission results [default: %default]",
+                      default = False)
  
         if fullOptional == "TRUE":
             optionParser.add_option("-u",
@@ -134,13 +531,103 @@ class Client(object):
                           dest="jdl",
                           help="The jdl path")
 
+            optionParser.add_option("--queues",
+                          dest="queues",
+                          help="Comma separated list of queues of the CE to probe in the same run, as <queue> or <lrms>-<queue>: the proxy check, the delegation and the allowed submission check are done once and the jobs submitted concurrently")
+
+            optionParser.add_option("--queue-file",
+                          dest="queueFile",
+                          help="A file containing one queue of the CE per line, as in --queues")
+
+            optionParser.add_option("--auto-delegation",
+                          action="store_true",
+                          dest="autoDelegation",
+                          default = self.DEFAULT_AUTO_DELEGATION,
+                          help="Delegate the proxy at every job submission instead of reusing a stored delegation [default: %default]")
+
+            optionParser.add_option("--shared-job",
+                          dest="sharedJob",
+                          type="int",
+                          default = self.DEFAULT_SHARED_JOB,
+                          help="Let jobSubmit, jobOutput and jobPurge share one test job per endpoint and jdl submitted at most once in this interval (0 disables the sharing). [default: %default sec]")
+
+            optionParser.add_option("--keep-sandbox",
+                          action="store_true",
+                          dest="keepSandbox",
+                          default = self.DEFAULT_KEEP_SANDBOX,
+                          help="Submit the jdl as it is instead of inlining the input sandbox in the job arguments and dropping the output sandbox (jobOutput and --shared-job always keep the sandboxes) [default: %default]")
+
+            optionParser.add_option("--async",
+                          action="store_true",
+                          dest="asyncJob",
+                          default = self.DEFAULT_ASYNC_JOB,
+                          help="Judge the job submitted by the previous run, then submit the next one and exit [default: %default]")
+
+            optionParser.add_option("--max-job-age",
+                          dest="maxJobAge",
+                          type="int",
+                          default = self.DEFAULT_MAX_JOB_AGE,
+                          help="In asynchronous mode, a job not terminated within this time is cancelled and reported as stuck. [default: %default sec]")
+
+            optionParser.add_option("--submit-rate",
+                          dest="submitRate",
+                          type="float",
+                          default = self.DEFAULT_SUBMIT_RATE,
+                          help="Maximum number of job submissions per minute to a CE by all the probes (0 disables the limit). [default: %default]")
+
+            optionParser.add_option("--submit-burst",
+                          dest="submitBurst",
+                          type="int",
+                          default = self.DEFAULT_SUBMIT_BURST,
+                          help="Number of job submissions allowed at once when the CE has not been used for a while, with --submit-rate. [default: %default]")
+
+            optionParser.add_option("-w",
+                          "--warning",
+                          dest="warning",
+                          help="Latency thresholds above which the result is WARNING, as metric=seconds separated by commas. Metrics: turnaround (submission to terminal status), queue (queue wait), submit (submission latency). Example: turnaround=1800,queue=600,submit=30")
+
+            optionParser.add_option("-c",
+                          "--critical",
+                          dest="critical",
+                          help="Latency thresholds above which the result is CRITICAL, in the format of --warning")
+
+            optionParser.add_option("--poll-initial",
+                          dest="pollInitial",
+                          type="float",
+                          default = self.DEFAULT_POLL_INITIAL,
+                          help="Delay before the first job status poll. [default: %default sec]")
+
+            optionParser.add_option("--poll-max",
+                          dest="pollMax",
+                          type="float",
+                          default = self.DEFAULT_POLL_MAX,
+                          help="Maximum delay between two job status polls. [default: %default sec]")
+
+            optionParser.add_option("--poll-factor",
+                          dest="pollFactor",
+                          type="float",
+                          default = self.DEFAULT_POLL_FACTOR,
+                          help="Growth factor of the delay between two job status polls. [default: %default]")
+
             if self.name == "cream-jobOutput":
                 optionParser.add_option("-d",
                               "--dir",
                               dest="dir",
-                              default = "/var/lib/argo-monitoring/eu.egi.CREAMCE",
+                              default = self.DEFAULT_STATE_DIR,
                               help="The output sandbox path")
 
+                optionParser.add_option("--max-file-bytes",
+                              dest="maxFileBytes",
+                              type="int",
+                              default = self.DEFAULT_MAX_FILE_BYTES,
+                              help="Maximum number of bytes reported for each output sandbox file. [default: %default]")
+
+                optionParser.add_option("--max-output-bytes",
+                              dest="maxOutputBytes",
+                              type="int",
+                              default = self.DEFAULT_MAX_OUTPUT_BYTES,
+                              help="Maximum number of bytes reported for the whole output sandbox. [default: %default]")
+
         else:
             optionParser.add_option("-u",
                       "--url",
@@ -149,10 +636,15 @@ class Client(object):
 
 
 
-    def readOptions(self):
+    def readOptions(self, args=None):
         optionParser = self.optionParser
         
-        (self.options, self.args) = optionParser.parse_args()
+        (self.options, self.args) = optionParser.parse_args(args)
+
+        # the relative paths are those of the caller
+        for dest in self.PATH_OPTIONS:
+            if getattr(self.options, dest, None):
+                setattr(self.options, dest, self.path(getattr(self.options, dest)))
        
         if not self.options.url and not self.options.hostname:
             optionParser.error("Specify either option -u URL or option -H HOSTNAME (and -p PORT) or read the help (-h)")
@@ -201,7 +693,7 @@ class Client(object):
             else:
                 self.port = self.options.port
         elif not self.port:
-                self.port = DEFAULT_PORT
+                self.port = self.DEFAULT_PORT
 
         if self.options.verbose:
             self.verbose = self.options.verbose
@@ -209,17 +701,72 @@ class Client(object):
         if self.options.disableProxyCheck:
             self.disableProxyCheck = self.options.disableProxyCheck
 
+        self.proxyWarning = self.options.proxyWarning
+        self.proxyCritical = self.options.proxyCritical
+
+        if self.options.stateDir:
+            self.stateDir = self.options.stateDir
+
+        self.cliPath = self.options.cliPath or self.path(self.environ.get("CREAM_CLI_PATH", self.DEFAULT_CLI_PATH))
+        self.backend = self.options.backend
+        self.caPath = self.options.caPath or self.path(self.environ.get("X509_CERT_DIR", self.DEFAULT_CA_PATH))
+
+        self.cacheTtl = self.options.cacheTtl
+        self.historySize = self.options.historySize
+        self.breakerThreshold = self.options.breakerThreshold
+        self.breakerCooldown = self.options.breakerCooldown
+
+        if self.options.maxPerCE < 0 or self.options.maxGlobal < 0 or self.options.jitter < 0:
+            optionParser.error("the concurrency limits and the jitter cannot be negative")
+
+        self.maxPerCE = self.options.maxPerCE
+        self.maxGlobal = self.options.maxGlobal
+        self.jitter = self.options.jitter
+        self.refresh = self.options.refresh
+
         if self.options.proxy:
-            os.environ["X509_USER_PROXY"] = self.options.proxy
+            self.proxy = self.options.proxy
+
+            # the environment is shared by all the probes running in the same process
+            if not self.embedded:
+                os.environ["X509_USER_PROXY"] = self.options.proxy
+        elif self.environ.has_key("X509_USER_PROXY"):
+            self.proxy = self.path(self.environ["X509_USER_PROXY"])
 
 
         if self.options.timeout:
             self.timeout = self.options.timeout
 
-        signal.signal(signal.SIGALRM, self.sig_handler)
-        signal.alarm(int(self.timeout)) # triger alarm in n seconds
+        if self.options.cleanupReserve < 0:
+            optionParser.error("the cleanup reserve cannot be negative")
+
+        # only the job checks leave something to clean up
+        if self.fullOptional == "TRUE":
+            self.cleanupReserve = self.options.cleanupReserve
+        else:
+            self.cleanupReserve = 0
+
+        self.deadline = Deadline(int(self.timeout), self.cleanupReserve)
+
+        # only the main thread of a standalone probe can handle signals:
+        # the alarm is the last resort, the deadline stops the probe and kills its commands before
+        if not self.embedded:
+            signal.signal(signal.SIGALRM, self.sig_handler)
+            signal.alarm(int(self.timeout) + 1) # triger alarm in n seconds
 
         if self.fullOptional == "TRUE":
+            self.queues = self.readQueues(optionParser)
+
+            # the first queue names the endpoint when the URL has none
+            if self.queues and not (self.queue or self.options.queue):
+                self.queue = self.queues[0][1]
+
+                if not (self.lrms or self.options.lrms):
+                    self.lrms = self.queues[0][0]
+
+            if len(self.queues) < 2:
+                self.queues = []
+
             if self.options.lrms:
                 if self.lrms:
                     optionParser.error("lrms name already defined in the URL")
@@ -241,19 +788,250 @@ class Client(object):
             else:
                 self.jdl = self.options.jdl
 
+            if self.options.pollInitial <= 0 or self.options.pollMax < self.options.pollInitial or self.options.pollFactor < 1:
+                optionParser.error("wrong polling options: 0 < --poll-initial <= --poll-max and --poll-factor >= 1 required")
+
+            self.autoDelegation = self.options.autoDelegation
+            self.sharedJob = self.options.sharedJob
+            self.asyncJob = self.options.asyncJob
+            self.maxJobAge = self.options.maxJobAge
+
+            if self.sharedJob and self.asyncJob:
+                optionParser.error("Options --shared-job and --async are mutually exclusive")
+
+            # the job of jobOutput, and the job shared with it, must bring its output sandbox back
+            self.inlinePayload = not self.options.keepSandbox and not self.sharedJob and self.name != "cream-jobOutput"
+
+            if self.options.submitRate < 0 or self.options.submitBurst < 1:
+                optionParser.error("wrong submission rate options: --submit-rate >= 0 and --submit-burst >= 1 required")
+
+            self.submitRate = self.options.submitRate
+            self.submitBurst = self.options.submitBurst
+
+            self.warningThresholds = self.parseThresholds("--warning", self.options.warning)
+            self.criticalThresholds = self.parseThresholds("--critical", self.options.critical)
+
+            self.pollInitial = self.options.pollInitial
+            self.pollMax = self.options.pollMax
+            self.pollFactor = self.options.pollFactor
+
             self.url = self.hostname + ":" + str(self.port) + "/cream-" + self.lrms + "-" + self.queue
             #self.url = "%(hostname)s:%(port)s/cream-%(lrms)-%(queue)" % {'hostname': self.url, 'port': self.port, 'lrms': self.lrms, 'queue': self.queue}
   
             if self.name == "cream-jobOutput" and self.options.dir:
                     self.dir = self.options.dir 
+
+            if self.name == "cream-jobOutput":
+                self.maxFileBytes = self.options.maxFileBytes
+                self.maxOutputBytes = self.options.maxOutputBytes
         else:
             self.url = self.hostname + ":" + str(self.port)
 
+        if self.jitter > 0:
+            self.startJitter()
+
+
+
+    #A path relative to the working directory of the caller.
+    def path(self, path):
+        if self.cwd and path:
+            return os.path.join(self.cwd, os.path.expanduser(path))
+
+        return path
+
+
+
+    #Parse the queues of --queues and --queue-file: [(lrms, queue)], starting with the queue of the URL if any.
+    def readQueues(self, optionParser):
+        names = []
+
+        if self.options.queues:
+            names += [name.strip() for name in self.options.queues.split(",") if name.strip()]
+
+        if self.options.queueFile:
+            try:
+                for line in open(self.options.queueFile):
+                    line = line.strip()
+
+                    if line and not line.startswith("#"):
+                        names.append(line)
+            except IOError as ex:
+                optionParser.error("cannot read the queue file: %s" % ex)
+
+        if not names:
+            return []
+
+        lrms = self.lrms or self.options.lrms
+        queues = []
+
+        if self.queue or self.options.queue:
+            queues.append((lrms, self.queue or self.options.queue))
+
+        for name in names:
+            if name.startswith("cream-"):
+                name = name[len("cream-"):]
+
+            s = name.split("-")
+
+            if len(s) == 2 and s[0] and s[1]:
+                queue = (s[0], s[1])
+            elif len(s) == 1 and lrms:
+                queue = (lrms, s[0])
+            else:
+                optionParser.error("wrong queue '%s' (use <queue> or <lrms>-<queue>, the lrms being given by the URL or -l)" % name)
+
+            if queue not in queues:
+                queues.append(queue)
+
+        return queues
+
+
+
+    #A client of another queue of the CE for the queue fan-out: it shares the options, the delegation
+    #and the time limit of this one but has its own results, engine and cleanup.
+    def forQueue(self, lrms, queue):
+        import copy
+
+        client = copy.copy(self)
+        client.lrms = lrms
+        client.queue = queue
+        client.url = self.hostname + ":" + str(self.port) + "/cream-" + lrms + "-" + queue
+        client.queues = []
+        client.warnings = []
+        client.perfData = []
+        client.history = []
+        client.timings = {}
+        client.pendingJobs = []
+        client.polls = 0
+        client.waitTime = 0
+        client.deadline = copy.copy(self.deadline)
+        client.engine = None
+        client.children = None
+        client.breaker = None
+        client.cream = None
+
+        if self.delegated and self.delegated[1]:
+            from cream_cli.delegation import DelegationManager
+
+            client.delegated = self.delegated[0], DelegationManager(client)
+
+        # the proxy is checked once by the fan-out
+        client.disableProxyCheck = True
+
+        return client
+
+
+
+    #Wait a random part of the jitter: the checks scheduled together by Nagios do not start together.
+    #At most half of the time limit is spent waiting.
+    def startJitter(self):
+        import random
+
+        delay = random.uniform(0, min(self.jitter, self.deadline.remaining() / 2))
+
+        self.debug("start delayed by %.1f sec" % delay)
+        time.sleep(delay)
+
+
+
+    #Hold a slot of the global and of the CE concurrency limits, waiting for them within the deadline.
+    @contextmanager
+    def slot(self):
+        from cream_cli.limiter import Semaphore
+
+        held = []
+
+        try:
+            with self.deadline.within("wait for a slot"):
+                # always in the same order: two probes never wait for each other
+                if self.maxGlobal > 0:
+                    held.append(Semaphore(self.stateDir, "global", self.maxGlobal, self.debug).acquire(self.deadline))
+
+                if self.maxPerCE > 0:
+                    held.append(Semaphore(self.stateDir, "%s:%s" % (self.hostname, self.port), self.maxPerCE, self.debug).acquire(self.deadline))
+
+            yield
+        finally:
+            for lockFile in held:
+                lockFile.close()
+
+
+
+    #Try once to take a slot of the global and of the CE concurrency limits: return the lock files holding them, or None.
+    def trySlot(self):
+        from cream_cli.limiter import Semaphore
+
+        held = []
+
+        for name, slots in (("global", self.maxGlobal), ("%s:%s" % (self.hostname, self.port), self.maxPerCE)):
+            if slots <= 0:
+                continue
+
+            lockFile = Semaphore(self.stateDir, name, slots, self.debug).tryAcquire()
+
+            if not lockFile:
+                for lockFile in held:
+                    lockFile.close()
+
+                return None
+
+            held.append(lockFile)
+
+        return held
+
+
+
+    #Wait for a submission token of the CE if the submission rate is limited: return the time waited.
+    def submitToken(self):
+        if self.submitRate <= 0:
+            return 0
+
+        from cream_cli.limiter import TokenBucket
+
+        with self.deadline.within("wait for a submission token"):
+            wait = TokenBucket(self.stateDir, "%s:%s" % (self.hostname, self.port), self.submitRate / 60.0, self.submitBurst, self.debug).take(self.deadline)
+
+        if wait:
+            self.debug("submission delayed by %.1f sec (--submit-rate)" % wait)
+
+        return wait
+
+
+
+    #Parse the thresholds of an option (e.g. turnaround=1800,queue=600): return metric -> seconds.
+    def parseThresholds(self, option, value):
+        thresholds = {}
+
+        for item in (value or "").split(","):
+            if not item.strip():
+                continue
+
+            metric, sep, seconds = item.partition("=")
+            metric = metric.strip()
+
+            if metric not in self.THRESHOLD_METRICS:
+                self.optionParser.error("wrong %s: unknown metric '%s' (use %s)" % (option, metric, ", ".join(sorted(self.THRESHOLD_METRICS))))
+
+            try:
+                thresholds[metric] = float(seconds)
+            except ValueError:
+                self.optionParser.error("wrong %s: '%s' is not a number of seconds" % (option, seconds.strip()))
+
+            if thresholds[metric] < 0:
+                self.optionParser.error("wrong %s: the threshold of %s cannot be negative" % (option, metric))
+
+        return thresholds
+
 
 
     # set-up the signal-handlers                        
     def sig_handler(self, signum, frame):
         if signum == signal.SIGALRM:
+            self.deadline.exceeded()
+
+            if self.deadline.cleanupResult is None:
+                self.deadline.cleanupResult = "interrupted"
+
             self.nagiosExit(self.WARNING, "Timeout occurred (" + str(self.timeout) + " sec)")
         elif signum == signal.SIGTERM:
             self.nagiosExit(self.WARNING, "SIGTERM received!")
@@ -273,26 +1051,194 @@ class Client(object):
         if self.disableProxyCheck:
             return        
 
-        if not os.environ.has_key("X509_USER_PROXY"):
+        if not self.proxy:
             raise Exception("X509_USER_PROXY not set")
     
-        if not os.path.exists(os.environ["X509_USER_PROXY"]):
+        if not os.path.exists(self.proxy):
             raise Exception("Proxy file not found or not readable")
 
-        cmd="/usr/bin/voms-proxy-info -timeleft"
+        from cream_cli.proxy import getNotAfter
+
+        timeLeft = int(getNotAfter(self.proxy, os.path.join(self.stateDir, "proxy.cache")) - time.time())
+
+        self.debug("proxy time left: %d sec" % timeLeft)
 
-        timeLeft = self.execute(cmd)
-        
         if timeLeft <= 0 :
             raise Exception("No proxy time left")
 
+        if timeLeft < self.proxyCritical:
+            raise Exception("Proxy expires in %d sec (critical threshold %d sec)" % (timeLeft, self.proxyCritical))
+
+        if timeLeft < self.proxyWarning:
+            self.warnings.append("proxy expires in %d sec" % timeLeft)
+
+        return timeLeft
+
+
+
+    #Return the delegation options of glite-ce-job-submit and the delegation manager (if any).
+    def delegation(self):
+        # the queues of a fan-out reuse the delegation of the CE
+        if self.delegated:
+            return self.delegated
+
+        from cream_cli.delegation import DelegationManager
+
+        # the web service has no automatic delegation
+        if self.backend == "ws":
+            manager = DelegationManager(self)
+            return "-D " + manager.getDelegationId(), manager
+
+        if self.autoDelegation or not self.proxy:
+            return "-a", None
+
+        try:
+            manager = DelegationManager(self)
+            return "-D " + manager.getDelegationId(), manager
+        except Exception as ex:
+            self.debug("cannot use a stored delegation, falling back to automatic delegation: %s" % ex)
+            return "-a", None
+
 
 
-    #Submit a job to CREAM with automatic delegation and return its job id.
+    #Submit a job to CREAM and return its job id: the proxy is delegated once and the delegation reused.
     def jobSubmit(self):
-        cmd="/usr/bin/glite-ce-job-submit -a -r " + self.url + " " + self.jdl
+        self.submitToken()
+
+        with self.timed("submit"):
+            delegation, manager = self.delegation()
+
+            try:
+                jobId = self.submit(delegation)
+            except Exception as ex:
+                if not manager or not "delegation" in str(ex).lower():
+                    raise
+
+                # the CE lost the delegation (e.g. it has been restarted): delegate again once
+                self.debug("delegation %s refused: %s" % (delegation, ex))
+                manager.invalidate()
+
+                jobId = self.submit("-D " + manager.getDelegationId())
+
+        # the status history starts at the submission
+        self.history.append(("SUBMITTED", time.time()))
+
+        return jobId
+
+
+
+    #Submit a job asynchronously: the submission token and the delegation, if needed, are taken beforehand.
+    #A refused delegation is invalidated but not retried: the next submission delegates again.
+    def jobSubmitAsync(self):
+        if self.backend == "ws":
+            return self.blockingAsync(self.jobSubmit)
+
+        self.submitToken()
+
+        delegation, manager = self.delegation()
+
+        def submitted(output):
+            jobId = self.recordJob(self.parseJobSubmit(output))
+            self.history.append(("SUBMITTED", time.time()))
+
+            return jobId
+
+        def failed(ex):
+            if manager and "delegation" in str(ex).lower():
+                self.debug("delegation %s refused: %s" % (delegation, ex))
+                manager.invalidate()
+
+        return self.executeAsync(self.cliPath + "/glite-ce-job-submit " + delegation + " -r " + self.url + " " + self.jdlPath(),
+                                 submitted, "submit", failed)
+
+
+
+    #Submit a job to CREAM with the given delegation options and return its job id.
+    def submit(self, delegation):
+        if self.backend == "ws":
+            return self.recordJob(self.service().jobRegister(self.jdlText(), delegation[len("-D "):]))
+
+        cmd=self.cliPath + "/glite-ce-job-submit " + delegation + " -r " + self.url + " " + self.jdlPath()
         output = self.execute(cmd)
 
+        return self.recordJob(self.parseJobSubmit(output))
+
+
+
+    #Record a submitted job in the ledger of the endpoint until it is purged: return its job id.
+    def recordJob(self, jobId):
+        from cream_cli.ledger import Ledger
+
+        self.pendingJobs.append(jobId)
+
+        try:
+            Ledger(self.stateDir, "%s:%s" % (self.hostname, self.port)).add(jobId, self.url)
+        except Exception as ex:
+            self.debug("cannot record the job %s in the ledger: %s" % (jobId, ex))
+
+        return jobId
+
+
+
+    #Remove the purged jobs from the ledger of the endpoint.
+    def forgetJobs(self, jobIds):
+        from cream_cli.ledger import Ledger
+
+        self.pendingJobs = [jobId for jobId in self.pendingJobs if jobId not in jobIds]
+
+        try:
+            Ledger(self.stateDir, "%s:%s" % (self.hostname, self.port)).remove(jobIds)
+        except Exception as ex:
+            self.debug("cannot remove the jobs %s from the ledger: %s" % (jobIds, ex))
+
+
+
+    #Cancel and purge the jobs submitted by this run and not purged yet, on the cleanup reserve.
+    #Return how the cleanup went.
+    def cleanupJobs(self):
+        if not self.pendingJobs:
+            return "not needed"
+
+        jobIds = list(self.pendingJobs)
+        failures = []
+
+        with self.deadline.cleanup():
+            with self.deadline.within("cleanup"):
+                for jobId in jobIds:
+                    try:
+                        status, exitCode = self.jobStatus(jobId)
+
+                        if status not in self.TERMINAL_STATES:
+                            self.jobCancel(jobId)
+                            self.waitForState(jobId, self.TERMINAL_STATES, deadline=self.deadline)
+
+                        self.jobPurge(jobId)
+                    except Exception as ex:
+                        self.debug("cannot clean the job %s up: %s" % (jobId, ex))
+                        failures.append("%s: %s" % (jobId, ex))
+
+        if failures:
+            return "failed (%s), left to the reaper" % "; ".join(failures)
+
+        return "succeeded (%d job%s purged)" % (len(jobIds), len(jobIds) > 1 and "s" or "")
+
+
+
+    #The verdict of a check that ran out of time: the phase that overran and how the cleanup went.
+    def timeoutVerdict(self, msg):
+        if self.deadline.cleanupResult is None:
+            self.deadline.cleanupResult = self.cleanupJobs()
+
+        verdict = "Timeout occurred (%s sec) during %s, cleanup %s" % (self.timeout, self.deadline.overrun, self.deadline.cleanupResult)
+
+        if msg and not ("%s" % msg).startswith("Timeout occurred"):
+            verdict += "\n%s" % msg
+
+        return self.WARNING, verdict
+
+
+
+    def parseJobSubmit(self, output):
         self.debug(output)
 
         for elem in output:
@@ -326,48 +1272,180 @@ class Client(object):
     def jobStatus(self, jobId):
         self.debug("invoking jobStatus")
 
-        cmd = "/usr/bin/glite-ce-job-status " + jobId
+        if self.backend == "ws":
+            record = self.jobStatusRecord(jobId, self.service().jobInfo([jobId]))
+
+            return self.statusOf(jobId, record, record and record.error)
+
+        cmd = self.cliPath + "/glite-ce-job-status " + jobId
 
         output = self.execute(cmd)
 
-        self.debug(output)
-        
-        status = None
-        for i in output:
-            if "Status" in i:
-                status=i
+        return self.parseJobStatus(jobId, output)
 
-        if not status:
-            raise Exception("Status couldn't be determined for jobId " + jobId + ". Command reported: " + ','.join(output))
 
-        jobStatus = status.split('[')
-        jobStatus = jobStatus[1].split(']')
 
-        exitCode = None
-        for y in output:
-            if "ExitCode" in y:
-                exitCode = y
+    def jobStatusAsync(self, jobId):
+        if self.backend == "ws":
+            return self.blockingAsync(self.jobStatus, jobId)
 
-        if exitCode:
-            self.debug("exitCode="+exitCode)
+        return self.executeAsync(self.cliPath + "/glite-ce-job-status " + jobId, lambda output: self.parseJobStatus(jobId, output))
 
-            jobExitCode = exitCode.split('[')
-            jobExitCode = jobExitCode[1].split(']')
 
-            return jobStatus[0], jobExitCode[0]
 
-        return jobStatus[0], -1
+    def parseJobStatus(self, jobId, output):
+        self.debug(output)
 
+        return self.statusOf(jobId, self.jobStatusRecord(jobId, parseStatus(output)), ','.join(output))
 
 
-    #Cancel the job.
-    def jobCancel(self, jobId):
+
+    #Return the status and the exit code (-1 if not yet known) of a job status record.
+    def statusOf(self, jobId, record, details):
+        if not record or not record.status:
+            raise Exception("Status couldn't be determined for jobId " + jobId + ". Command reported: " + "%s" % details)
+
+        if record.failureReason:
+            self.debug("failure reason: " + record.failureReason)
+
+        if record.exitCode is not None:
+            self.debug("exitCode=" + record.exitCode)
+
+            return record.status, record.exitCode
+
+        return record.status, -1
+
+
+
+    #Return the status record of the given job among the parsed ones (None if missing).
+    def jobStatusRecord(self, jobId, records):
+        for record in records:
+            if record.jobId == jobId:
+                return record
+
+        # the CLI may report the job id in a different form (e.g. without the port)
+        if len(records) == 1:
+            return records[0]
+
+        return None
+
+
+
+    #Yield the delays between two consecutive polls: short at first, then longer.
+    def pollDelays(self):
+        delay = self.pollInitial
+
+        while True:
+            yield delay
+            delay = min(delay * self.pollFactor, self.pollMax)
+
+
+
+    #Sleep before the next poll without going beyond the deadline.
+    def pollSleep(self, delay, deadline):
+        if deadline:
+            delay = min(delay, deadline.remaining())
+
+            if delay <= 0:
+                return False
+
+        time.sleep(delay)
+        return True
+
+
+
+    #Poll the job status until it reaches one of the target states; fail on the fail states or at the deadline.
+    def waitForState(self, jobId, targetStates, failStates=None, deadline=None, exitCodes=None):
+        failStates = failStates or []
+        start = time.time()
+        polls = 0
+        status = None
+
+        try:
+            for delay in self.pollDelays():
+                # the phase reported on timeout names the status the job was stuck in
+                with self.deadline.within("wait for %s (last status %s)" % ("/".join(targetStates), status)):
+                    if not self.pollSleep(delay, deadline):
+                        raise self.deadline.exceeded("timeout waiting for job " + jobId + " to reach " + "/".join(targetStates) + " (" + str(polls) + " polls)")
+
+                    status, exitCode = self.jobStatus(jobId)
+                    polls += 1
+
+                self.debug("job status: " + status)
+
+                # the status history: when each new status has been seen first
+                if not self.history or self.history[-1][0] != status:
+                    self.history.append((status, time.time()))
+
+                if status in targetStates and (exitCodes is None or exitCode in exitCodes):
+                    return status, exitCode
+
+                if status in failStates:
+                    raise Exception("job " + jobId + " unexpectedly reached the status " + status)
+        finally:
+            elapsed = time.time() - start
+            self.polls += polls
+            self.waitTime += elapsed
+
+            self.debug("waited %.1f sec for job %s (%d polls)" % (elapsed, jobId, polls))
+
+
+
+    #Poll the job status until the job is no longer known by CREAM.
+    def waitForPurge(self, jobId, deadline=None):
+        start = time.time()
+        polls = 0
+
+        try:
+            for delay in self.pollDelays():
+                with self.deadline.within("wait for the purge"):
+                    if not self.pollSleep(delay, deadline):
+                        raise self.deadline.exceeded("timeout waiting for job " + jobId + " to be purged (" + str(polls) + " polls)")
+
+                    polls += 1
+
+                    try:
+                        status, exitCode = self.jobStatus(jobId)
+                    except DeadlineExceeded:
+                        raise
+                    except Exception:
+                        return
+
+                self.debug("job status: " + status)
+        finally:
+            elapsed = time.time() - start
+            self.polls += polls
+            self.waitTime += elapsed
+
+            self.debug("waited %.1f sec for job %s to be purged (%d polls)" % (elapsed, jobId, polls))
+
+
+
+    #Cancel the job.
+    def jobCancel(self, jobId):
         self.debug("invoking jobCancel")
 
-        cmd="/usr/bin/glite-ce-job-cancel --noint " + jobId
+        cmd=self.cliPath + "/glite-ce-job-cancel --noint " + jobId
 
-        output = self.execute(cmd)
+        with self.timed("cancel"):
+            if self.backend == "ws":
+                return self.service().jobCancel([jobId])
+
+            output = self.execute(cmd)
 
+        self.parseJobNotFound(jobId, output)
+
+
+
+    def jobCancelAsync(self, jobId):
+        if self.backend == "ws":
+            return self.blockingAsync(self.jobCancel, jobId)
+
+        return self.executeAsync(self.cliPath + "/glite-ce-job-cancel --noint " + jobId, lambda output: self.parseJobNotFound(jobId, output), "cancel")
+
+
+
+    def parseJobNotFound(self, jobId, output):
         for elem in output:
             if string.find(elem, "job not found") > 0:
                 raise Exception("Job " + jobId + " not found!")
@@ -378,21 +1456,159 @@ class Client(object):
     def jobPurge(self, jobId):
         self.debug("invoking jobPurge")
 
-        cmd="/usr/bin/glite-ce-job-purge --noint " + jobId
-        output = self.execute(cmd)
+        cmd=self.cliPath + "/glite-ce-job-purge --noint " + jobId
 
-        for elem in output:
-            if string.find(elem, "job not found") > 0:
-                raise Exception("Job " + jobId + " not found!")
+        with self.timed("purge"):
+            if self.backend == "ws":
+                self.service().jobPurge([jobId])
+                return self.forgetJobs([jobId])
+
+            output = self.execute(cmd)
+
+        self.parseJobPurge(jobId, output)
+
+
+
+    def jobPurgeAsync(self, jobId):
+        if self.backend == "ws":
+            return self.blockingAsync(self.jobPurge, jobId)
+
+        return self.executeAsync(self.cliPath + "/glite-ce-job-purge --noint " + jobId, lambda output: self.parseJobPurge(jobId, output), "purge")
+
+
+
+    def parseJobPurge(self, jobId, output):
+        try:
+            self.parseJobNotFound(jobId, output)
+        finally:
+            # a job unknown to the CE is gone as well
+            self.forgetJobs([jobId])
+
+
+
+    #Return the result of an operation on the CE from the cache when younger than the TTL, otherwise fetch and cache it.
+    def cached(self, operation, fetch):
+        if self.cacheTtl <= 0:
+            return fetch()
+
+        state = self.cacheState()
+        lookup = lambda data: self.cacheEntry(data, operation)
+        value = None
+        fetched = False
+
+        try:
+            if not self.refresh:
+                value = lookup(state.read())
+
+                if value is not None:
+                    return value
+
+            # the concurrent probes wait for this one to refresh the entry instead of calling the CE too
+            with state.update() as data:
+                if not self.refresh:
+                    value = lookup(data)
+
+                if value is None:
+                    fetched = True
+                    value = fetch()
+                    data[operation] = {"time": time.time(), "value": value}
+
+            return value
+        except (IOError, OSError) as ex:
+            # the CE failed, not the cache: calling it again would only double the failure
+            if fetched and value is None:
+                raise
+
+            self.debug("cannot use the cache: %s" % ex)
+
+            if fetched:
+                return value
+
+            return fetch()
+
+
+
+    #The cache of the operations on the CE, shared by the probes.
+    def cacheState(self):
+        from cream_cli.state import StateFile, fileName
+
+        return StateFile(os.path.join(self.stateDir, "cache", fileName("%s:%s" % (self.hostname, self.port)) + ".json"))
+
+
+
+    #Return the cached result of an operation if younger than the TTL, otherwise None.
+    def cacheEntry(self, data, operation):
+        entry = data.get(operation)
+
+        if entry and 0 <= time.time() - entry["time"] < self.cacheTtl:
+            self.debug("using the cached %s (%d sec old)" % (operation, time.time() - entry["time"]))
+            return entry["value"].encode("utf-8")
+
+
+
+    #Start command on the engine unless the result of the operation is in the cache, which is then updated with parse(output).
+    #Unlike cached, the concurrent probes do not wait for this one: the engine cannot wait for a lock.
+    def cachedAsync(self, operation, phase, blocking, command, parse):
+        if self.backend == "ws":
+            return self.blockingAsync(blocking)
+
+        if self.cacheTtl <= 0:
+            return self.executeAsync(command, parse, phase)
+
+        start = time.time()
+
+        if not self.refresh:
+            try:
+                value = self.cacheEntry(self.cacheState().read(), operation)
+            except (IOError, OSError) as ex:
+                self.debug("cannot use the cache: %s" % ex)
+                value = None
+
+            if value is not None:
+                self.addTiming(phase, start)
+                return self.getEngine().completed(value)
+
+        def store(output):
+            value = parse(output)
+
+            try:
+                with self.cacheState().update() as data:
+                    data[operation] = {"time": time.time(), "value": value}
+            except (IOError, OSError) as ex:
+                self.debug("cannot use the cache: %s" % ex)
+
+            return value
+
+        return self.executeAsync(command, store, phase)
 
 
 
     #Service info.
     def serviceInfo(self):
+        with self.timed("service_info"):
+            return self.cached("serviceInfo", self.fetchServiceInfo)
+
+
+
+    def fetchServiceInfo(self):
         self.debug("invoking service info")
 
-        cmd="/usr/bin/glite-ce-service-info " + self.url
+        if self.backend == "ws":
+            return self.parseServiceInfo(self.service().serviceInfo())
+
+        cmd=self.cliPath + "/glite-ce-service-info " + self.url
         output = self.execute(cmd)
+
+        return self.parseServiceInfo(output)
+
+
+
+    def serviceInfoAsync(self):
+        return self.cachedAsync("serviceInfo", "service_info", self.serviceInfo, self.cliPath + "/glite-ce-service-info " + self.url, self.parseServiceInfo)
+
+
+
+    def parseServiceInfo(self, output):
         info = ""
 
         for elem in output:
@@ -404,11 +1620,32 @@ class Client(object):
 
     #Allowed submission.
     def allowedSubmission(self):
+        with self.timed("allowed_submission"):
+            return self.cached("allowedSubmission", self.fetchAllowedSubmission)
+
+
+
+    def fetchAllowedSubmission(self):
         self.debug("invoking allowedSubmission")
 
-        cmd="/usr/bin/glite-ce-allowed-submission " + self.url
+        if self.backend == "ws":
+            return self.service().allowedSubmission() and "ENABLED" or "DISABLED"
+
+        # the job checks have the queue in their URL
+        cmd=self.cliPath + "/glite-ce-allowed-submission " + self.hostname + ":" + str(self.port)
         output = self.execute(cmd)
 
+        return self.parseAllowedSubmission(output)
+
+
+
+    def allowedSubmissionAsync(self):
+        return self.cachedAsync("allowedSubmission", "allowed_submission", self.allowedSubmission,
+                                self.cliPath + "/glite-ce-allowed-submission " + self.hostname + ":" + str(self.port), self.parseAllowedSubmission)
+
+
+
+    def parseAllowedSubmission(self, output):
         for elem in output:
             if string.find(elem, "enabled") > 0:
                 return "ENABLED"
@@ -422,14 +1659,31 @@ class Client(object):
     def getOutputSandbox(self, jobId):
         self.debug("invoking getOutputSandbox")
 
-        cmd="/usr/bin/glite-ce-job-output --noint"
+        cmd=self.cliPath + "/glite-ce-job-output --noint"
 
         if self.dir:
             cmd += " --dir " + self.dir
 
         cmd += " " + jobId
-        output = self.execute(cmd)
 
+        with self.timed("output"):
+            output = self.execute(cmd)
+
+        return self.parseOutputSandbox(output)
+
+
+
+    def getOutputSandboxAsync(self, jobId):
+        cmd=self.cliPath + "/glite-ce-job-output --noint"
+
+        if self.dir:
+            cmd += " --dir " + self.dir
+
+        return self.executeAsync(cmd + " " + jobId, self.parseOutputSandbox, "output")
+
+
+
+    def parseOutputSandbox(self, output):
         for elem in output:
             if string.find(elem, "UBERFTP ERROR OUTPUT") > 0:
                 raise Exception("cannot retrieve the output sandbox")
@@ -441,26 +1695,428 @@ class Client(object):
                     return "n/a"
 
 
-    #Execute command.
-    def execute(self, command):
+    #The CREAM web service of the endpoint (ws backend).
+    def service(self):
+        if not self.cream:
+            from cream_cli.soap import CreamService
+
+            self.cream = CreamService(self)
+
+        return self.cream
+
+
+
+    #The JDL of the test job: with the payload inlined unless the check needs the sandboxes.
+    def jobJDL(self):
+        with open(self.jdl) as infile:
+            jdl = infile.read()
+
+        if not self.inlinePayload:
+            return jdl
+
+        from cream_cli.jdl import inlineJDL
+
+        try:
+            return inlineJDL(jdl, os.path.dirname(os.path.abspath(self.jdl)))
+        except Exception as ex:
+            self.debug("cannot inline the payload of %s, submitting it with its sandboxes: %s" % (self.jdl, ex))
+            return jdl
+
+
+
+    #The JDL file given to glite-ce-job-submit: the inlined JDL is written once in the state directory,
+    #named after its content, and reused by the next runs.
+    def jdlPath(self):
+        if not self.inlinePayload:
+            return self.jdl
+
+        import hashlib, tempfile
+
+        jdl = self.jobJDL()
+        dir = os.path.join(self.stateDir, "jdl")
+        path = os.path.join(dir, "%s-%s.jdl" % (os.path.splitext(os.path.basename(self.jdl))[0], hashlib.sha1(jdl).hexdigest()[:12]))
+
+        if os.path.exists(path):
+            return path
+
+        try:
+            if not os.path.isdir(dir):
+                os.makedirs(dir)
+
+            fd, tmp = tempfile.mkstemp(prefix=".", dir=dir)
+
+            with os.fdopen(fd, "w") as outfile:
+                outfile.write(jdl)
+
+            os.chmod(tmp, 0644)
+            os.rename(tmp, path)
+        except (IOError, OSError) as ex:
+            self.debug("cannot write the inlined JDL in %s, submitting %s: %s" % (dir, self.jdl, ex))
+            return self.jdl
+
+        return path
+
+
+
+    #The JDL sent to the web service: the CLI adds the batch system and the queue of the endpoint the same way.
+    def jdlText(self):
+        jdl = self.jobJDL().strip()
+
+        if self.JDL_INPUT_SANDBOX.search(jdl):
+            raise Exception("the ws backend cannot transfer the input sandbox of " + self.jdl + " (use --backend cli)")
+
+        if not jdl.endswith("]"):
+            raise Exception("malformed JDL " + self.jdl)
+
+        jdl = jdl[:-1].rstrip()
+
+        if not jdl.endswith(";") and not jdl.endswith("["):
+            jdl += ";"
+
+        return jdl + '\nBatchSystem = "%s";\nQueueName = "%s";\n]' % (self.lrms, self.queue)
+
+
+
+    #Check whether an output line of a glite-ce-* command reports a failure.
+    def isFailure(self, line):
+        return "ERROR" in line or "FATAL" in line or "FaultString" in line or "FaultCode" in line or "FaultCause" in line
+
+
+
+    #Run command and return its return code and output lines.
+    #The command gets only the time left before the deadline: it is killed when overrunning.
+    def run(self, command):
         self.debug("executing command: " + command)
 
         args = shlex.split(command.encode('ascii'))
 
-        proc = subprocess.Popen(args , stderr=subprocess.STDOUT , stdout=subprocess.PIPE)
-        fPtr = proc.stdout
-        retVal = proc.wait()
-        output = fPtr.readlines()
+        self.deadline.check()
+
+        try:
+            with self.slot():
+                return self.getEngine().start(args, self.childEnv(), self.deadline.remaining(), lambda retVal, output: (retVal, output)).wait()
+        except DeadlineExceeded:
+            raise
+        except Exception as ex:
+            if self.deadline.expired():
+                raise self.deadline.exceeded("%s" % ex)
+
+            raise
+
+
+
+    #The environment of the glite-ce-* commands.
+    def childEnv(self):
+        if not self.proxy:
+            return None
+
+        env = os.environ.copy()
+        env["X509_USER_PROXY"] = self.proxy
+
+        return env
+
+
+
+    #Execute command, unless the circuit breaker of the CE is open.
+    def execute(self, command):
+        self.deadline.check()
+        self.allowCall()
+
+        try:
+            retVal, output = self.run(command)
+            output = self.checkOutput(command, retVal, output)
+        except Exception as ex:
+            self.recordCall(ex)
+            raise
+
+        self.recordCall()
+
+        return output
+
+
+
+    #Start command on the engine without waiting for it: the returned command completes with parse(output).
+    #It follows the rules of execute: the circuit breaker, the concurrency slots (taken without blocking the engine)
+    #and the probe deadline; its time is accounted to phase and failed(error) is called if the command fails.
+    def executeAsync(self, command, parse=None, phase=None, failed=None):
+        self.debug("starting command: " + command)
+
+        self.deadline.check()
+        self.allowCall()
+
+        start = time.time()
+
+        def finish(retVal, output):
+            if phase:
+                self.addTiming(phase, start)
+
+            try:
+                output = self.checkOutput(command, retVal, output)
+            except Exception as ex:
+                self.recordCall(ex)
+
+                if failed:
+                    failed(ex)
+                raise
+
+            self.recordCall()
+
+            if parse:
+                return parse(output)
+
+            return output
+
+        def fail(error):
+            if phase:
+                self.addTiming(phase, start)
+
+            if self.deadline.expired():
+                with self.deadline.within(phase):
+                    error = self.deadline.exceeded("%s" % error)
+
+            self.recordCall(error)
+
+            if failed:
+                failed(error)
+
+            return error
+
+        return self.getEngine().start(shlex.split(command.encode('ascii')), self.childEnv(), self.deadline.remaining(), finish, self.trySlot, fail)
+
+
+
+    #The ws backend has no asynchronous calls: make the blocking call and return its completed command.
+    def blockingAsync(self, call, *args):
+        try:
+            return self.getEngine().completed(call(*args))
+        except Exception as ex:
+            return self.getEngine().completed(error=ex)
+
+
+
+    #The circuit breaker of the CE shared by the probes (None if disabled).
+    def getBreaker(self):
+        if self.breakerThreshold <= 0 or not self.hostname:
+            return None
+
+        if not self.breaker:
+            from cream_cli.breaker import Breaker
+
+            self.breaker = Breaker(self.stateDir, "%s:%s" % (self.hostname, self.port), self.breakerThreshold, self.breakerCooldown, self.timeout, self.debug)
+
+        return self.breaker
+
+
+
+    #Fail fast with the last connection error while the circuit breaker of the CE is open.
+    def allowCall(self):
+        breaker = self.getBreaker()
+
+        if breaker:
+            breaker.allow()
+
 
+
+    #Record the outcome of a call to the CE in its circuit breaker: only the connection errors count as failures.
+    def recordCall(self, error=None):
+        breaker = self.getBreaker()
+
+        if not breaker:
+            return
+
+        try:
+            breaker.record(error)
+        except Exception as ex:
+            self.debug("cannot update the circuit breaker: %s" % ex)
+
+
+
+    #Kill the running glite-ce-* commands of the check and of its queues, from the thread giving up on it.
+    def kill(self):
+        for client in [self] + (self.children or []):
+            if client.engine:
+                client.engine.kill()
+
+
+
+    #The engine running the glite-ce-* commands of the client: it can be shared by several clients driven by the same thread.
+    def getEngine(self):
+        if not self.engine:
+            from cream_cli.engine import Engine
+
+            self.engine = Engine()
+
+        return self.engine
+
+
+
+    #Raise if the return code or the output of a command report a failure, otherwise return the output.
+    def checkOutput(self, command, retVal, output):
         if retVal != 0:
-            raise Exception("command '" + command + "' failed: return_code=" + str(proc.returncode) + "\ndetails: " + repr(output))
+            raise Exception("command '" + command + "' failed: return_code=" + str(retVal) + "\ndetails: " + repr(output))
 
         for elem in output:
-            if "ERROR" in elem or "FATAL" in elem or "FaultString" in elem or "FaultCode" in elem or "FaultCause" in elem:
-                raise Exception("command '" + command + "' failed: return_code=" + str(proc.returncode) + "\ndetails: " + repr(output))
+            if self.isFailure(elem):
+                raise Exception("command '" + command + "' failed: return_code=" + str(retVal) + "\ndetails: " + repr(output))
 
         return output
 
+
+
+    #Split the job ids in chunks of at most chunkSize ids.
+    def chunks(self, jobIds, chunkSize=None):
+        chunkSize = chunkSize or self.BULK_CHUNK_SIZE
+
+        for i in range(0, len(jobIds), chunkSize):
+            yield jobIds[i:i + chunkSize]
+
+
+
+    #Execute command on many jobs, one invocation per chunk, and group the output lines by job id,
+    #unless the circuit breaker of the CE is open (as execute does).
+    #Return a map job id -> (output lines of the job, error of the whole chunk or None).
+    def executeBulk(self, command, jobIds, chunkSize=None):
+        result = {}
+
+        for chunk in self.chunks(list(jobIds), chunkSize):
+            self.deadline.check()
+            self.allowCall()
+
+            try:
+                retVal, output = self.run(command + " " + " ".join(chunk))
+            except Exception as ex:
+                self.recordCall(ex)
+                raise
+
+            lines = dict((jobId, []) for jobId in chunk)
+            general = []
+            current = general
+
+            # a line mentioning a job id opens the block of that job
+            for elem in output:
+                for jobId in self.JOBID_PATTERN.findall(elem):
+                    if jobId in lines:
+                        current = lines[jobId]
+                        break
+
+                current.append(elem)
+
+            error = None
+            for elem in general:
+                if self.isFailure(elem):
+                    error = elem.strip()
+
+            if retVal != 0 and not error:
+                failed = [jobId for jobId in chunk if [elem for elem in lines[jobId] if self.isFailure(elem)]]
+
+                if not failed:
+                    error = "command '" + command + "' failed: return_code=" + str(retVal) + " details: " + repr(output)
+
+            # the errors about single jobs (e.g. not found) tell nothing about the CE
+            self.recordCall(error and Exception(error))
+
+            for jobId in chunk:
+                result[jobId] = (lines[jobId], error)
+
+        return result
+
+
+
+    #Build the per-job result (error) of a bulk command.
+    def bulkResult(self, jobId, lines, error):
+        for elem in lines:
+            if self.isFailure(elem) or "job not found" in elem:
+                return {"error": elem.strip()}
+
+        return {"error": error}
+
+
+
+    #Retrieve the status of many jobs: map job id -> {"status", "exitCode", "failureReason", "description", "error"}.
+    def jobStatusBulk(self, jobIds, chunkSize=None):
+        self.debug("invoking jobStatusBulk")
+
+        result = {}
+
+        for jobId, (lines, error) in self.executeBulk(self.cliPath + "/glite-ce-job-status", jobIds, chunkSize).items():
+            record = self.bulkResult(jobId, lines, error)
+            status = self.jobStatusRecord(jobId, parseStatus(lines))
+
+            record["status"] = status and status.status
+            record["exitCode"] = status and status.exitCode or -1
+            record["failureReason"] = status and status.failureReason
+            record["description"] = status and status.description
+
+            if record["status"]:
+                record["error"] = None
+            elif not record["error"]:
+                record["error"] = "Status couldn't be determined for jobId " + jobId
+
+            result[jobId] = record
+
+        return result
+
+
+
+    #Cancel many jobs: map job id -> {"error"}.
+    def jobCancelBulk(self, jobIds, chunkSize=None):
+        self.debug("invoking jobCancelBulk")
+
+        result = {}
+
+        for jobId, (lines, error) in self.executeBulk(self.cliPath + "/glite-ce-job-cancel --noint", jobIds, chunkSize).items():
+            result[jobId] = self.bulkResult(jobId, lines, error)
+
+        return result
+
+
+
+    #Purge many jobs: map job id -> {"error"}.
+    def jobPurgeBulk(self, jobIds, chunkSize=None):
+        self.debug("invoking jobPurgeBulk")
+
+        result = {}
+
+        for jobId, (lines, error) in self.executeBulk(self.cliPath + "/glite-ce-job-purge --noint", jobIds, chunkSize).items():
+            result[jobId] = self.bulkResult(jobId, lines, error)
+
+        self.forgetJobs([jobId for jobId, record in result.items() if not record["error"] or "not found" in record["error"]])
+
+        return result
+
+
+
+    #Get the output sandbox of many jobs: map job id -> {"dir", "error"}.
+    def getOutputSandboxBulk(self, jobIds, chunkSize=None):
+        self.debug("invoking getOutputSandboxBulk")
+
+        cmd=self.cliPath + "/glite-ce-job-output --noint"
+
+        if self.dir:
+            cmd += " --dir " + self.dir
+
+        result = {}
+
+        for jobId, (lines, error) in self.executeBulk(cmd, jobIds, chunkSize).items():
+            record = self.bulkResult(jobId, lines, error)
+            record["dir"] = None
+
+            for elem in lines:
+                if "UBERFTP ERROR OUTPUT" in elem:
+                    record["error"] = "cannot retrieve the output sandbox"
+                    record["dir"] = None
+                    break
+                elif "output" in elem and "dir " in elem:
+                    record["dir"] = elem[elem.find("dir ") + 4:].strip()
+                    record["error"] = None
+
+            if not record["dir"] and not record["error"]:
+                record["error"] = "cannot retrieve the output sandbox"
+
+            result[jobId] = record
+
+        return result
+
 """
 def main():
     probe = CREAMDirectJobSubmissionProbe()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+---------------------------------------------------------------------------
+A resident probe daemon running the checks requested over a Unix socket.
+---------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+from SocketServer import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+from optparse import OptionParser
+import errno, json, os, signal, socket, stat, threading
+
+from cream_cli.checks import CHECKS, runCheck
+from cream_cli.cream import Client
+
+
+DEFAULT_SOCKET = "/var/lib/argo-monitoring/eu.egi.CREAMCE/probe.sock"
+DEFAULT_WORKERS = 50
+
+UNKNOWN = 3
+
+# the environment variables of the client read by the probes: the glite-ce-* commands are those of the daemon
+ENVIRONMENT = ["X509_USER_PROXY", "X509_CERT_DIR"]
+
+
+# request:  {"check": "<check name>", "args": [<the command-line of the cream_* script>],
+#            "cwd": "<working directory of the client>", "env": {<the variables of ENVIRONMENT set for the client>}}
+# response: {"code": <Nagios exit code>, "output": "<plugin output>"}
+class ProbeRequestHandler(StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+
+        # a connection closed without a request, e.g. by a daemon checking whether the socket is served
+        if not line:
+            return
+
+        try:
+            request = json.loads(line)
+            check = request["check"]
+            args = [str(arg) for arg in request["args"]]
+            cwd = request.get("cwd")
+            environ = None
+
+            if cwd is not None and not os.path.isabs(cwd):
+                raise Exception("the working directory of the client is not absolute")
+
+            # the older clients send neither: the probe sees the environment of the daemon
+            if "env" in request:
+                environ = dict((str(key), str(value)) for key, value in request["env"].items() if key in ENVIRONMENT)
+
+            # any --cli-path of the client is overridden: the last occurrence of an option wins
+            cliPath = "--cli-path=" + self.server.cliPath
+
+            if "--" in args:
+                args.insert(args.index("--"), cliPath)
+            else:
+                args.append(cliPath)
+
+            if check not in CHECKS:
+                code, msg = UNKNOWN, "unknown check '%s'" % check
+            else:
+                # checks exceeding the number of workers wait for a free slot
+                with self.server.slots:
+                    code, msg = runCheck(check, args, cwd and str(cwd), environ)
+        except Exception as ex:
+            code, msg = UNKNOWN, "CREAM probe daemon ERROR: %s" % ex
+
+        self.wfile.write(json.dumps({"code": code, "output": "%s" % msg}) + "\n")
+
+
+
+class ProbeServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path=DEFAULT_SOCKET, workers=DEFAULT_WORKERS, cliPath=Client.DEFAULT_CLI_PATH):
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+            try:
+                probe.connect(path)
+            except socket.error as ex:
+                if ex.errno != errno.ECONNREFUSED:
+                    raise Exception("cannot check the socket %s: %s" % (path, ex))
+
+                # a socket left by a previous instance prevents the bind
+                os.unlink(path)
+            else:
+                raise Exception("the socket %s is served by another daemon" % path)
+            finally:
+                probe.close()
+
+        UnixStreamServer.__init__(self, path, ProbeRequestHandler)
+
+        os.chmod(path, 0660)
+        self.path = path
+        self.slots = threading.BoundedSemaphore(workers)
+        self.cliPath = cliPath
+
+
+    def server_close(self):
+        UnixStreamServer.server_close(self)
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+
+def main(args=None):
+    optionParser = OptionParser(version="cream_probeDaemon v.1.0")
+    optionParser.add_option("-s",
+                  "--socket",
+                  dest="socket",
+                  default=DEFAULT_SOCKET,
+                  help="The Unix socket path. [default: %default]")
+
+    optionParser.add_option("-w",
+                  "--workers",
+                  dest="workers",
+                  type="int",
+                  default=DEFAULT_WORKERS,
+                  help="Number of checks running concurrently. [default: %default]")
+
+    optionParser.add_option("--cli-path",
+                  dest="cliPath",
+                  default=os.environ.get("CREAM_CLI_PATH", Client.DEFAULT_CLI_PATH),
+                  help="The directory of the glite-ce-* commands run for every client (environment: CREAM_CLI_PATH). [default: %default]")
+
+    (options, args) = optionParser.parse_args(args)
+
+    try:
+        server = ProbeServer(options.socket, options.workers, os.path.abspath(options.cliPath))
+    except Exception as ex:
+        optionParser.error("%s" % ex)
+
+    # shutdown() waits for serve_forever() to return: it must not be called from the serving thread
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
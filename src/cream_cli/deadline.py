@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+The time budget of a probe: the main budget for the check and a reserve
+kept for cleaning its job up once the main budget has run out.
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+from contextlib import contextmanager
+import time
+
+
+class DeadlineExceeded(Exception):
+    #Raised when the main budget runs out: phase is the operation in progress.
+    def __init__(self, phase, msg):
+        Exception.__init__(self, msg)
+        self.phase = phase
+
+
+
+class Deadline(object):
+    phase = None
+    overrun = None
+    cleaning = False
+    cleanupResult = None
+
+    # the reserve is at most half of the timeout
+    def __init__(self, timeout, reserve=0):
+        self.start = time.time()
+        self.end = self.start + timeout
+        self.reserve = max(0, min(reserve, timeout / 2.0))
+
+
+    #The end of the current budget: the main one, or the whole timeout while cleaning up.
+    def limit(self):
+        if self.cleaning:
+            return self.end
+
+        return self.end - self.reserve
+
+
+    def remaining(self):
+        return max(0, self.limit() - time.time())
+
+
+    def expired(self):
+        return time.time() >= self.limit()
+
+
+    #Record that the budget ran out in the current phase and return the exception to raise.
+    def exceeded(self, msg=None):
+        if not self.cleaning and not self.overrun:
+            self.overrun = self.phase or "unknown phase"
+
+        return DeadlineExceeded(self.phase, msg or "timeout during %s" % (self.phase or "unknown phase"))
+
+
+    #Raise DeadlineExceeded if the budget has run out.
+    def check(self):
+        if self.expired():
+            raise self.exceeded()
+
+
+    #Run the block as the given phase.
+    @contextmanager
+    def within(self, phase):
+        previous = self.phase
+        self.phase = phase
+
+        try:
+            yield
+        finally:
+            self.phase = previous
+
+
+    #Run the block on the reserve.
+    @contextmanager
+    def cleanup(self):
+        self.cleaning = True
+
+        try:
+            yield
+        finally:
+            self.cleaning = False
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+----------------------------------------------------------------------------
+Delegates the user proxy once per (CE endpoint, proxy) and reuses the id.
+----------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+import os, time, uuid
+
+from cream_cli.proxy import getNotAfter
+from cream_cli.state import StateFile, fileName
+
+
+class DelegationManager(object):
+    # a delegation expiring within this time is renewed
+    RENEW_MARGIN = 600
+
+    def __init__(self, client):
+        self.client = client
+        self.endpoint = "%s:%s" % (client.hostname, client.port)
+        self.state = StateFile(os.path.join(client.stateDir, "delegation", fileName(self.endpoint) + ".json"))
+
+
+    #Return a delegation id valid on the endpoint: delegate a new one or renew the stored one only when needed.
+    def getDelegationId(self):
+        client = self.client
+        proxy = os.path.abspath(client.proxy)
+        info = os.stat(proxy)
+        expiry = getNotAfter(proxy, os.path.join(client.stateDir, "proxy.cache"))
+
+        # the lock makes the concurrent probes wait for a single delegation
+        with self.state.update() as state:
+            entry = state.get(proxy)
+
+            if entry:
+                changed = entry["mtime"] != info.st_mtime or entry["inode"] != info.st_ino
+
+                if not changed and entry["expiry"] - time.time() > self.RENEW_MARGIN:
+                    client.debug("reusing delegation " + entry["id"])
+                    return entry["id"]
+
+                try:
+                    client.execute(client.cliPath + "/glite-ce-proxy-renew -e " + self.endpoint + " " + entry["id"])
+                    client.debug("renewed delegation " + entry["id"])
+                except Exception as ex:
+                    client.debug("cannot renew the delegation %s: %s" % (entry["id"], ex))
+                    entry = None
+
+            if not entry:
+                entry = {"id": "cream-nagios-" + uuid.uuid4().hex[:16]}
+
+                client.execute(client.cliPath + "/glite-ce-delegate-proxy -e " + self.endpoint + " " + entry["id"])
+                client.debug("delegated " + entry["id"])
+
+            entry["mtime"] = info.st_mtime
+            entry["inode"] = info.st_ino
+            entry["expiry"] = expiry
+
+            state[proxy] = entry
+
+            return entry["id"]
+
+
+    #Forget the stored delegation, e.g. when the CE no longer knows it.
+    def invalidate(self):
+        with self.state.update() as state:
+            state.pop(os.path.abspath(self.client.proxy), None)
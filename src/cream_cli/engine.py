@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+---------------------------------------------------------------------------------
+Runs many commands at once from a single thread, with per-command timeouts.
+---------------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+import errno, os, select, subprocess, time
+
+
+class Command(object):
+    done = False
+    result = None
+    error = None
+    proc = None
+    deadline = None
+    retVal = None
+    held = None
+
+    #acquire() takes what the command needs to start (e.g. the concurrency slots of the CE) without waiting:
+    #it returns the objects closed when the command completes, or None to be tried again at the next poll.
+    #fail(error) is given the error of a command that could not start, timed out or was cancelled: it returns the error to raise.
+    def __init__(self, engine, args, env, timeout, finish, acquire=None, fail=None):
+        self.engine = engine
+        self.args = args
+        self.env = env
+        self.timeout = timeout
+        self.finish = finish
+        self.acquire = acquire
+        self.fail = fail
+        self.data = []
+
+        # the timeout includes the time spent waiting to start
+        if timeout is not None:
+            self.deadline = time.time() + timeout
+
+
+    def launch(self):
+        try:
+            self.proc = subprocess.Popen(self.args, stderr=subprocess.STDOUT, stdout=subprocess.PIPE, env=self.env, close_fds=True)
+        except OSError as ex:
+            self.abort(Exception("command '%s' failed: %s" % (" ".join(self.args), ex)))
+
+
+    def fileno(self):
+        return self.proc.stdout.fileno()
+
+
+    #Read the available output: return False at end of file.
+    def read(self):
+        try:
+            data = os.read(self.fileno(), 65536)
+        except OSError as ex:
+            if ex.errno in (errno.EAGAIN, errno.EINTR):
+                return True
+            raise
+
+        if data:
+            self.data.append(data)
+            return True
+
+        return False
+
+
+    #Reap the child and hand its return code and output lines to the finish callback.
+    def reap(self):
+        self.retVal = self.proc.wait()
+        self.proc.stdout.close()
+
+        try:
+            self.complete(result=self.finish(self.retVal, "".join(self.data).splitlines(True)))
+        except Exception as ex:
+            self.complete(error=ex)
+
+
+    def complete(self, result=None, error=None):
+        self.done = True
+        self.result = result
+        self.error = error
+
+        for held in self.held or []:
+            held.close()
+
+        self.held = None
+        self.engine.release(self)
+
+
+    #Fail the command with an error of its own.
+    def abort(self, error):
+        if self.fail:
+            error = self.fail(error)
+
+        self.complete(error=error)
+
+
+    #Kill the child (if started) and fail the command.
+    def cancel(self, reason="cancelled"):
+        if self.done:
+            return
+
+        if self.proc:
+            try:
+                self.proc.kill()
+            except OSError:
+                pass
+
+            self.proc.wait()
+            self.proc.stdout.close()
+
+        self.abort(Exception("command '%s' %s" % (" ".join(self.args), reason)))
+
+
+    #Drive the engine until this command completes: return its result or raise its error.
+    def wait(self):
+        self.engine.run([self])
+
+        if self.error:
+            raise self.error
+
+        return self.result
+
+
+
+class Engine(object):
+    # the maximum time spent in select() before checking the timeouts
+    TICK = 1.0
+
+    # the delay between two attempts to start the commands waiting for what they acquire
+    RETRY = 0.1
+
+    def __init__(self, maxRunning=None):
+        self.maxRunning = maxRunning
+        self.queued = []
+        self.running = []
+
+
+    #Start (or queue, when it cannot start yet) a command and return it.
+    #finish(retVal, output) turns the output lines into the command result or raises its error (see Command for acquire and fail).
+    def start(self, args, env=None, timeout=None, finish=None, acquire=None, fail=None):
+        command = Command(self, args, env, timeout, finish or (lambda retVal, output: output), acquire, fail)
+
+        self.queued.append(command)
+        self.launch()
+
+        return command
+
+
+    #Return a command already completed with the given result or error (e.g. a result found in the cache).
+    def completed(self, result=None, error=None):
+        command = Command(self, None, None, None, None)
+        command.complete(result, error)
+
+        return command
+
+
+    #Start the queued commands in order, while fewer than maxRunning are running.
+    def launch(self):
+        for command in list(self.queued):
+            if self.maxRunning and len(self.running) >= self.maxRunning:
+                return
+
+            if command.acquire:
+                try:
+                    command.held = command.acquire()
+                except Exception as ex:
+                    command.abort(ex)
+                    continue
+
+                if command.held is None:
+                    continue
+
+            self.queued.remove(command)
+            self.running.append(command)
+            command.launch()
+
+
+    def release(self, command):
+        if command in self.running:
+            self.running.remove(command)
+        elif command in self.queued:
+            self.queued.remove(command)
+
+
+    #Start what can be started, then wait for output or timeouts once.
+    def poll(self):
+        self.launch()
+
+        if not self.running and not self.queued:
+            return
+
+        now = time.time()
+        tick = self.TICK
+
+        if self.queued:
+            tick = self.RETRY
+
+        for command in self.running + self.queued:
+            if command.deadline is not None:
+                tick = max(0, min(tick, command.deadline - now))
+
+        try:
+            readable = select.select(self.running, [], [], tick)[0]
+        except select.error as ex:
+            if ex.args[0] != errno.EINTR:
+                raise
+            readable = []
+
+        for command in readable:
+            if not command.read():
+                command.reap()
+
+        now = time.time()
+
+        for command in list(self.queued):
+            if command.deadline is not None and now >= command.deadline:
+                command.cancel("timed out after %.1f sec waiting to start" % command.timeout)
+
+        for command in list(self.running):
+            if command.deadline is not None and now >= command.deadline:
+                command.cancel("timed out after %.1f sec" % command.timeout)
+
+        self.launch()
+
+
+    #Kill the children of the running commands from another thread: the thread driving the engine
+    #reaps them and fails the commands.
+    def kill(self):
+        for command in list(self.running):
+            if command.proc:
+                try:
+                    command.proc.kill()
+                except OSError:
+                    pass
+
+
+    #Drive all the commands (or only the given ones) to completion.
+    def run(self, commands=None):
+        while True:
+            if commands is None:
+                pending = self.running or self.queued
+            else:
+                pending = [command for command in commands if not command.done]
+
+            if not pending:
+                return
+
+            self.poll()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+The queue fan-out of the job checks: the proxy check, the delegation and
+the allowed submission check are done once for the CE, then the check
+runs concurrently on every queue and the verdicts are aggregated.
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+import threading, time
+
+
+STATUS = ["OK", "WARNING", "CRITICAL", "UNKNOWN"]
+
+
+class QueueFanOut(object):
+    # the checks stop at their own deadline: this is the extra time granted before abandoning them
+    TIMEOUT_GRACE = 10
+
+    def __init__(self, client):
+        self.client = client
+
+
+    #Run the check on a queue: its verdict is finalized by its own client (thresholds, timeout, history).
+    def runQueue(self, queueClient, run, results, index):
+        try:
+            results[index] = queueClient.finalize(*run(queueClient))
+        except Exception as ex:
+            results[index] = queueClient.UNKNOWN, "%s" % ex
+
+
+    #Run the check on all the queues and return the aggregated verdict:
+    #the worst one, a line per queue and the performance data of every queue.
+    def run(self, name, run):
+        client = self.client
+        endpoint = "%s:%s" % (client.hostname, client.port)
+
+        try:
+            client.checkProxy()
+
+            allowed = client.allowedSubmission()
+
+            if allowed != "ENABLED":
+                return client.CRITICAL, "CREAM %s ERROR: the job submission is %s on %s, no job submitted to its %d queues" % (name,
+                                        allowed, endpoint, len(client.queues))
+
+            client.delegated = client.delegation()
+        except Exception as ex:
+            return client.CRITICAL, "CREAM %s ERROR: %s" % (name, ex)
+
+        queueClients = [client.forQueue(lrms, queue) for lrms, queue in client.queues]
+        client.children = queueClients
+        results = [None] * len(queueClients)
+        threads = []
+
+        for index, queueClient in enumerate(queueClients):
+            thread = threading.Thread(target=self.runQueue, args=(queueClient, run, results, index))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join(max(0, client.deadline.end - time.time()) + self.TIMEOUT_GRACE)
+
+        # the queues record their own results in the history
+        client.historySize = 0
+
+        exitCode = client.OK
+        counts = {}
+        lines = []
+
+        for (lrms, queue), queueClient, result in zip(client.queues, queueClients, results):
+            label = "%s-%s" % (lrms, queue)
+
+            if result is None:
+                result = client.UNKNOWN, "no result within the time limit"
+
+            code, msg = result
+            msg = "%s" % msg
+
+            # the performance data of the queue go with the aggregated ones
+            if queueClient.perfData:
+                first = msg.split("\n", 1)
+                first[0] = first[0].rsplit(" | ", 1)[0]
+                msg = "\n".join(first)
+
+                client.perfData += ["%s_%s" % (label, perfData) for perfData in queueClient.perfData]
+
+            exitCode = max(exitCode, code)
+            counts.setdefault(code, []).append(label)
+            lines.append("%s %s: %s" % (STATUS[code], label, msg))
+
+        summary = []
+
+        for code in sorted(counts, reverse=True):
+            if code == client.OK:
+                summary.append("%d OK" % len(counts[code]))
+            else:
+                summary.append("%d %s (%s)" % (len(counts[code]), STATUS[code], ", ".join(counts[code])))
+
+        client.addPerfData("queues", len(queueClients))
+        client.addPerfData("queues_ok", len(counts.get(client.OK, [])))
+
+        return exitCode, "CREAM %s on %d queues of %s: %s\n%s" % (name, len(queueClients), endpoint, ", ".join(summary), "\n".join(lines))
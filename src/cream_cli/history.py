@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+The history of the check results of a CE (host:port): a ring buffer of
+fixed-size binary records in the state directory, and the percentiles
+and failure rates computed over a time window (with numpy if available).
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+import errno, fcntl, math, os, struct, time
+
+from cream_cli.state import fileName
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+HISTORY_DIR = "history"
+
+MAGIC = "CRMH"
+VERSION = 1
+
+# the layout of the records: new checks and phases go at the end of the lists
+CHECKS = ["jobSubmit", "jobOutput", "jobCancel", "jobPurge", "serviceInfo", "allowedSubmission"]
+PHASES = ["total", "submit", "queue_wait", "run", "output", "cancel", "purge", "service_info", "allowed_submission"]
+
+UNKNOWN_CHECK = 255
+PERCENTILES = [50, 95, 99]
+
+# magic, version, record size, capacity, records written so far, endpoint
+HEADER = struct.Struct("<4sHHII64s")
+
+# time, check, Nagios exit code, polls, the phase durations (NaN if the phase did not happen)
+RECORD = struct.Struct("<dBBH%df" % len(PHASES))
+
+
+
+#The percentile of the sorted values, interpolated as numpy.percentile does.
+def percentile(values, p):
+    position = (len(values) - 1) * p / 100.0
+    lower = int(math.floor(position))
+    upper = min(lower + 1, len(values) - 1)
+
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+
+class History(object):
+    DEFAULT_CAPACITY = 4096
+
+    def __init__(self, stateDir, endpoint):
+        self.endpoint = endpoint
+        self.path = os.path.join(stateDir, HISTORY_DIR, fileName(endpoint) + ".ring")
+
+
+    def open(self, flags):
+        dir = os.path.dirname(self.path)
+
+        if flags & os.O_CREAT and not os.path.isdir(dir):
+            try:
+                os.makedirs(dir)
+            except OSError as ex:
+                if ex.errno != errno.EEXIST:
+                    raise
+
+        return os.fdopen(os.open(self.path, flags, 0644), flags & os.O_RDWR and "r+b" or "rb")
+
+
+    #The header of the file: (capacity, written), or None if the file is empty or not a history.
+    def readHeader(self, file):
+        file.seek(0)
+        data = file.read(HEADER.size)
+
+        if len(data) < HEADER.size:
+            return None
+
+        magic, version, recordSize, capacity, written, endpoint = HEADER.unpack(data)
+
+        if magic != MAGIC or version != VERSION or recordSize != RECORD.size or not capacity:
+            return None
+
+        return capacity, written
+
+
+    #Append the result of a check; the oldest record is overwritten once the file is full.
+    #The capacity is set when the file is created.
+    def append(self, check, exitCode, durations, polls=0, when=None, capacity=DEFAULT_CAPACITY):
+        values = [durations.get(phase, float("nan")) for phase in PHASES]
+
+        if check in CHECKS:
+            checkIndex = CHECKS.index(check)
+        else:
+            checkIndex = UNKNOWN_CHECK
+
+        record = RECORD.pack(when or time.time(), checkIndex, exitCode, min(polls, 65535), *values)
+
+        with self.open(os.O_RDWR | os.O_CREAT) as file:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+
+            header = self.readHeader(file)
+
+            if header is None:
+                header = capacity, 0
+                file.truncate(0)
+
+            capacity, written = header
+
+            file.seek(HEADER.size + (written % capacity) * RECORD.size)
+            file.write(record)
+
+            file.seek(0)
+            file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, capacity, written + 1, self.endpoint[:64]))
+
+
+    #The raw records in chronological order.
+    def read(self):
+        try:
+            file = self.open(os.O_RDONLY)
+        except (IOError, OSError):
+            return ""
+
+        with file:
+            fcntl.flock(file.fileno(), fcntl.LOCK_SH)
+
+            header = self.readHeader(file)
+
+            if header is None:
+                return ""
+
+            capacity, written = header
+            data = file.read(min(written, capacity) * RECORD.size)
+
+        # past the capacity the oldest record follows the last one written
+        split = (written % capacity) * RECORD.size
+
+        if written > capacity:
+            data = data[split:] + data[:split]
+
+        return data
+
+
+    #The statistics of the records younger than window seconds, per check:
+    #{check: {"runs", "warnings", "failures", "failureRate", "last", "phases": {phase: (count, p50, p95, p99)}}}
+    def summary(self, window, now=None):
+        data = self.read()
+        since = (now or time.time()) - window
+
+        if numpy:
+            return summarizeArray(data, since)
+
+        return summarizeRecords(data, since)
+
+
+
+#The statistics of the records computed with numpy.
+def summarizeArray(data, since):
+    records = numpy.frombuffer(data, numpy.dtype([("time", "<f8"), ("check", "u1"), ("code", "u1"), ("polls", "<u2"),
+                                                  ("phases", "<f4", (len(PHASES),))]))
+    records = records[records["time"] >= since]
+    result = {}
+
+    for checkIndex in numpy.unique(records["check"]):
+        selected = records[records["check"] == checkIndex]
+        codes = selected["code"]
+        phases = {}
+
+        for index, phase in enumerate(PHASES):
+            values = selected["phases"][:, index].astype(float)
+            values = values[~numpy.isnan(values)]
+
+            if len(values):
+                phases[phase] = tuple([len(values)] + [float(value) for value in numpy.percentile(values, PERCENTILES)])
+
+        result[checkName(checkIndex)] = statistics(len(selected), int((codes == 1).sum()), int((codes >= 2).sum()),
+                                                   float(selected["time"].max()), phases)
+
+    return result
+
+
+
+#The statistics of the records computed in pure Python.
+def summarizeRecords(data, since):
+    checks = {}
+
+    for offset in range(0, len(data) - RECORD.size + 1, RECORD.size):
+        record = RECORD.unpack_from(data, offset)
+
+        if record[0] >= since:
+            checks.setdefault(record[1], []).append(record)
+
+    result = {}
+
+    for checkIndex, records in checks.items():
+        phases = {}
+
+        for index, phase in enumerate(PHASES):
+            values = sorted([record[4 + index] for record in records if not math.isnan(record[4 + index])])
+
+            if values:
+                phases[phase] = tuple([len(values)] + [percentile(values, p) for p in PERCENTILES])
+
+        codes = [record[2] for record in records]
+
+        result[checkName(checkIndex)] = statistics(len(records), codes.count(1), len([code for code in codes if code >= 2]),
+                                                   max([record[0] for record in records]), phases)
+
+    return result
+
+
+
+def checkName(checkIndex):
+    if checkIndex < len(CHECKS):
+        return CHECKS[checkIndex]
+
+    return "unknown"
+
+
+
+def statistics(runs, warnings, failures, last, phases):
+    return {"runs": runs, "warnings": warnings, "failures": failures, "failureRate": float(failures) / runs,
+            "last": last, "phases": phases}
+
+
+
+#The CEs having a history in the state directory.
+def histories(stateDir):
+    result = []
+    dir = os.path.join(stateDir, HISTORY_DIR)
+
+    if not os.path.isdir(dir):
+        return result
+
+    for name in sorted(os.listdir(dir)):
+        if not name.endswith(".ring"):
+            continue
+
+        # the file name is sanitized: the endpoint is read from the header
+        try:
+            with open(os.path.join(dir, name), "rb") as file:
+                endpoint = HEADER.unpack(file.read(HEADER.size))[5].rstrip("\0")
+        except (IOError, struct.error):
+            continue
+
+        result.append(History(stateDir, endpoint))
+
+    return result
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+The JDL of the test jobs without sandboxes: the files of the input
+sandbox are embedded base64-encoded in the arguments of the job, which
+writes them on the WN and runs the executable; the output sandbox is
+dropped, the result of the job being its exit code.
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+import base64, os, re
+
+
+# above this the JDL is submitted with its sandboxes
+MAX_INLINE_SIZE = 16384
+
+# the attributes of the sandboxes and of the files staged with them
+SANDBOX_ATTRIBUTES = ["inputsandbox", "outputsandbox", "outputsandboxbasedesturi", "outputsandboxdesturi", "stdoutput", "stderror"]
+
+ATTRIBUTE = re.compile(r"^\s*([A-Za-z_][A-Za-z0-9_]*)\s*=\s*(.*?)\s*$", re.DOTALL)
+STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+FILE_NAME = re.compile(r"^[A-Za-z0-9._-]+$")
+
+
+#Split the body of a JDL on the semicolons outside of the strings and lists.
+def statements(body):
+    result = []
+    current = []
+    quoted = escaped = False
+    depth = 0
+
+    for char in body:
+        if quoted:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                quoted = False
+        elif char == '"':
+            quoted = True
+        elif char in "{[(":
+            depth += 1
+        elif char in "}])":
+            depth -= 1
+        elif char == ";" and depth == 0:
+            result.append("".join(current))
+            current = []
+            continue
+
+        current.append(char)
+
+    result.append("".join(current))
+
+    return [statement for statement in result if statement.strip()]
+
+
+
+#The attributes of a JDL, in order: [(name, value as written)].
+def parseJDL(text):
+    lines = [line for line in text.splitlines() if not line.strip().startswith("#") and not line.strip().startswith("//")]
+    body = "\n".join(lines).strip()
+
+    if not body.startswith("[") or not body.endswith("]"):
+        raise Exception("malformed JDL: not enclosed in [ ]")
+
+    attributes = []
+
+    for statement in statements(body[1:-1]):
+        match = ATTRIBUTE.match(statement)
+
+        if not match:
+            raise Exception("malformed JDL attribute: %s" % statement.strip())
+
+        attributes.append((match.group(1), match.group(2)))
+
+    return attributes
+
+
+
+def formatJDL(attributes):
+    return "[\n%s\n]\n" % "\n".join(["%s = %s;" % (name, value) for name, value in attributes])
+
+
+
+#The strings of a JDL value: "a" or {"a", "b"}.
+def strings(value):
+    return [string.replace('\\"', '"') for string in STRING.findall(value or "")]
+
+
+
+#Read a file of the input sandbox: the installed path, or the same file next to the JDL.
+def readInput(path, jdlDir):
+    if "://" in path:
+        raise Exception("the input file %s is remote" % path)
+
+    for candidate in [path, os.path.join(jdlDir, path), os.path.join(jdlDir, os.path.basename(path))]:
+        if os.path.isfile(candidate):
+            with open(candidate, "rb") as infile:
+                return infile.read()
+
+    raise Exception("cannot find the input file %s" % path)
+
+
+
+#The JDL with the payload inlined: the files of the input sandbox are written by the job itself
+#and the sandboxes are dropped. Raise if the JDL cannot be inlined.
+def inlineJDL(text, jdlDir, maxSize=MAX_INLINE_SIZE):
+    attributes = parseJDL(text)
+    values = dict((name.lower(), value) for name, value in attributes)
+    result = [(name, value) for name, value in attributes if name.lower() not in SANDBOX_ATTRIBUTES]
+
+    files = strings(values.get("inputsandbox"))
+
+    if not files:
+        return formatJDL(result)
+
+    executable = (strings(values.get("executable")) or [""])[0]
+    arguments = (strings(values.get("arguments")) or [""])[0]
+    commands = []
+    names = []
+
+    for path in files:
+        name = os.path.basename(path)
+
+        if not FILE_NAME.match(name):
+            raise Exception("the input file name %s is not safe in a shell command" % name)
+
+        commands.append("echo %s | base64 -d > %s" % (base64.b64encode(readInput(path, jdlDir)), name))
+        names.append(name)
+
+    if executable in names or os.path.basename(executable) in names:
+        executable = "./" + os.path.basename(executable)
+        commands.append("chmod +x " + executable)
+
+    commands.append(("exec %s %s" % (executable, arguments)).strip())
+    script = " && ".join(commands)
+
+    if "'" in script or '"' in script or "\\" in script:
+        raise Exception("the executable or the arguments contain quotes")
+
+    result = [(name, value) for name, value in result if name.lower() not in ["executable", "arguments"]]
+    result.append(("Executable", '"/bin/sh"'))
+    result.append(("Arguments", "\"-c '%s'\"" % script))
+
+    jdl = formatJDL(result)
+
+    if len(jdl) > maxSize:
+        raise Exception("the inlined payload takes %d bytes (at most %d)" % (len(jdl), maxSize))
+
+    return jdl
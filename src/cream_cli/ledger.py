@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+The ledger of the jobs submitted by the probes, per endpoint: a job is
+recorded at its submission and forgotten once purged, so the jobs left
+behind (e.g. by a probe killed at its timeout) can be reaped.
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+import os, time
+
+from cream_cli.state import StateFile, fileName
+
+
+LEDGER_DIR = "ledger"
+
+
+# The jobs of an endpoint (host:port): {jobId: {"submitted", "url", "pid", "endpoint"}}
+class Ledger(object):
+
+    def __init__(self, stateDir, endpoint):
+        self.endpoint = endpoint
+        self.state = StateFile(os.path.join(stateDir, LEDGER_DIR, fileName(endpoint) + ".json"))
+
+
+    #Record a job just submitted to the given CE URL.
+    def add(self, jobId, url):
+        with self.state.update() as jobs:
+            jobs[jobId] = {"submitted": time.time(), "url": url, "pid": os.getpid(), "endpoint": self.endpoint}
+
+
+    #Forget the given jobs.
+    def remove(self, jobIds):
+        with self.state.update() as jobs:
+            for jobId in jobIds:
+                jobs.pop(jobId, None)
+
+
+    def jobs(self):
+        return self.state.read()
+
+
+    #The jobs submitted more than age seconds ago.
+    def olderThan(self, age):
+        now = time.time()
+
+        return dict((jobId, entry) for jobId, entry in self.jobs().items() if now - entry["submitted"] > age)
+
+
+
+#The ledgers holding some jobs in the state directory.
+def ledgers(stateDir):
+    result = []
+    dir = os.path.join(stateDir, LEDGER_DIR)
+
+    if not os.path.isdir(dir):
+        return result
+
+    for name in sorted(os.listdir(dir)):
+        if not name.endswith(".json") or name.startswith("."):
+            continue
+
+        # the file name is sanitized: the endpoint is recorded with the jobs, the CE may name
+        # itself differently in the job ids (an alias, the FQDN); the older entries only have
+        # the job id (https://<host>:<port>/CREAM<id>)
+        for jobId, entry in StateFile(os.path.join(dir, name)).read().items():
+            endpoint = entry.get("endpoint") or jobId.split("://", 1)[-1].split("/", 1)[0]
+            result.append(Ledger(stateDir, endpoint.encode("utf-8")))
+            break
+
+    return result
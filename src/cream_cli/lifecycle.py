@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------------------
+The test jobs outliving a single probe run: the job shared by jobSubmit, jobOutput
+and jobPurge, and the job submitted by a run to be judged by the next one.
+------------------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+import errno, fcntl, os, shutil, time
+
+from cream_cli.state import StateFile, fileName
+
+
+terminalStates = ['DONE-OK', 'DONE-FAILED', 'ABORTED', 'CANCELLED']
+
+
+#Check whether a process of this host is still running.
+def isAlive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as ex:
+        return ex.errno == errno.EPERM
+
+    return True
+
+
+
+# The state of the shared job, rewritten at every step by the probe running its lifecycle (the owner):
+#   owner, submitted, jobId, history: [[status, time]], timings: {phase: sec}, polls, status, exitCode,
+#   outputSandbox, osbSize, osbTime, outputError, purged, purgeError, error, done
+class SharedJob(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.state = StateFile(os.path.join(client.stateDir, "lifecycle", fileName(client.url + "_" + os.path.basename(client.jdl)) + ".json"))
+        # the owner and submission time of the interval whose lifecycle this probe runs
+        self.interval = None
+
+
+    #Return the state of the job of the current interval once it holds the given item,
+    #running the lifecycle of a new job if no probe did in this interval.
+    def get(self, item):
+        client = self.client
+        owner = False
+
+        with self.state.update() as data:
+            if not data.get("submitted") or time.time() - data["submitted"] >= client.sharedJob:
+                data.clear()
+                data["owner"] = os.getpid()
+                data["submitted"] = time.time()
+                owner = True
+
+                self.interval = data["owner"], data["submitted"]
+
+        if owner:
+            client.debug("running the lifecycle of the shared job")
+            self.lifecycle()
+
+        for delay in client.pollDelays():
+            data = self.state.read()
+
+            if item in data or "error" in data or "done" in data:
+                return data
+
+            if not isAlive(data.get("owner", 0)):
+                raise Exception("the probe running the shared job (pid %s) terminated before reporting %s" % (data.get("owner"), item))
+
+            if not client.pollSleep(min(delay, 5), client.deadline):
+                raise Exception("timeout waiting for the shared job to report " + item)
+
+
+    #Record the given items along with the timings measured so far, unless the interval expired
+    #and another probe took the shared job over: return whether the items were recorded.
+    def update(self, **items):
+        client = self.client
+
+        with self.state.lock(fcntl.LOCK_EX):
+            data = self.state.load()
+
+            if (data.get("owner"), data.get("submitted")) != self.interval:
+                client.debug("the interval of the shared job expired: %s not recorded" % ", ".join(sorted(items)))
+                return False
+
+            data.update(items)
+            data.update(history=client.history, timings=client.timings, polls=client.polls)
+
+            self.state.save(data)
+
+        return True
+
+
+    #Submit the job, wait for its terminal status, retrieve its output sandbox and purge it, recording every step.
+    def lifecycle(self):
+        from cream_cli.checks import readOutputSandbox
+
+        client = self.client
+
+        try:
+            jobId = client.jobSubmit()
+            client.debug("job id: " + jobId)
+
+            self.update(jobId=jobId)
+
+            status, exitCode = client.waitForState(jobId, terminalStates, deadline=client.deadline, exitCodes=['0', '1', 'N/A'])
+
+            self.update(status=status, exitCode=exitCode)
+        except Exception as ex:
+            self.update(error="%s" % ex, done=time.time())
+            return
+
+        if status == terminalStates[0]:
+            try:
+                start = time.time()
+                osbdir = client.getOutputSandbox(jobId)
+
+                outputSandbox, size = readOutputSandbox(client, osbdir)
+                shutil.rmtree(osbdir)
+
+                # the state is JSON: the sandbox may hold any byte
+                self.update(outputSandbox=outputSandbox.decode("utf-8", "replace"), osbSize=size, osbTime=time.time() - start)
+            except Exception as ex:
+                self.update(outputSandbox=None, outputError="%s" % ex)
+        else:
+            self.update(outputSandbox=None)
+
+        try:
+            client.jobPurge(jobId)
+            client.waitForPurge(jobId, client.deadline)
+
+            self.update(purged=True, done=time.time())
+        except Exception as ex:
+            self.update(purged=False, purgeError="%s" % ex, done=time.time())
+
+
+
+# The state of the two-phase (asynchronous) mode of a check on an endpoint:
+#   jobId, submitted: the job submitted by the last run
+#   history: [[status, time]], timings: {phase: sec}, polls: the statuses of the job seen by the runs, its submission time
+#   lastCode, lastMessage: the last verdict, reported again while the next job is still pending
+class AsyncJob(object):
+
+    def __init__(self, client, check):
+        self.client = client
+        self.state = StateFile(os.path.join(client.stateDir, "async", fileName(check + "_" + client.url) + ".json"))
+
+
+    #Judge the job submitted by the previous run with finish(client, jobId, status, exitCode), then submit the next one.
+    #prefix and okPrefix start the messages of the errors and of the first run, as the verdicts of finish do.
+    #The timings and thresholds of the check are those of the judged job.
+    def run(self, finish, prefix, okPrefix):
+        client = self.client
+
+        try:
+            client.checkProxy()
+        except Exception as ex:
+            return client.CRITICAL, prefix + "%s" % ex
+
+        # the lock keeps two runs of the same check on the same endpoint from overlapping
+        with self.state.update() as data:
+            verdict = None
+            judged = None
+
+            if "jobId" in data:
+                jobId = data["jobId"].encode("utf-8")
+                age = time.time() - data["submitted"]
+
+                client.history = [tuple(entry) for entry in data.get("history", [])]
+                client.timings = data.get("timings", {})
+                client.polls = data.get("polls", 0) + 1
+
+                try:
+                    status, exitCode = client.jobStatus(jobId)
+                    client.debug("status of the previous job %s: %s" % (jobId, status))
+                except Exception as ex:
+                    status = None
+                    verdict = client.CRITICAL, prefix + "cannot get the status of the previous job %s: %s" % (jobId, ex)
+
+                # the status history: when each new status has been seen first
+                if status and (not client.history or client.history[-1][0] != status):
+                    client.history.append((status, time.time()))
+
+                data["history"], data["polls"] = client.history, client.polls
+
+                # the exit code of a DONE job may show up a little later
+                if status in terminalStates and (exitCode != -1 or status in ['ABORTED', 'CANCELLED']):
+                    verdict = finish(client, jobId, status, exitCode)
+                elif status and age < client.maxJobAge:
+                    code = data.get("lastCode", client.OK)
+                    msg = data.get("lastMessage", "no result yet").encode("utf-8")
+
+                    return code, "%s (job %s is %s since %d sec)" % (msg, jobId, status, age)
+                elif status:
+                    try:
+                        client.jobCancel(jobId)
+                        client.jobPurge(jobId)
+                    except Exception as ex:
+                        client.debug("cannot clean the stale job %s up: %s" % (jobId, ex))
+
+                    verdict = client.CRITICAL, prefix + "job %s stuck in %s for %d sec" % (jobId, status, age)
+
+                judged = client.history, client.timings, client.polls
+                client.history, client.timings, client.polls = [], {}, 0
+
+            data.clear()
+
+            try:
+                jobId = client.jobSubmit()
+                client.debug("job id: " + jobId)
+
+                data["jobId"] = jobId
+                data["submitted"] = time.time()
+                data["history"], data["timings"] = client.history, client.timings
+
+                # the job is judged by the next run: not cleaned up if this one runs out of time
+                client.pendingJobs.remove(jobId)
+
+                if not verdict:
+                    verdict = client.OK, okPrefix + "job %s submitted, no previous job to judge" % jobId
+            except Exception as ex:
+                if not verdict or verdict[0] == client.OK:
+                    verdict = client.CRITICAL, prefix + "%s" % ex
+
+            if judged:
+                client.history, client.timings, client.polls = judged
+
+            # repeated while the next job is pending: as slow as the judged job was
+            data["lastCode"], data["lastMessage"] = client.thresholdVerdict(verdict[0], "%s" % verdict[1])
+
+            return verdict
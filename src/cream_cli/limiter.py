@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+The limits shared by the probes through the state directory: a counting
+semaphore made of lock files (a slot is released when its holder exits,
+even if killed) and a token bucket capping the rate of the submissions.
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+import errno, fcntl, os, random, time
+
+from cream_cli.state import StateFile, fileName
+
+
+LIMITS_DIR = "limits"
+
+
+
+#Stands for a slot when the lock files cannot be used: the probe runs unthrottled.
+class NoSlot(object):
+
+    def close(self):
+        pass
+
+
+
+class Semaphore(object):
+    # the delays between two attempts to take a slot
+    MIN_DELAY = 0.05
+    MAX_DELAY = 0.5
+
+    #debug(msg) logs the problems of the lock files.
+    def __init__(self, stateDir, name, slots, debug=None):
+        self.name = name
+        self.paths = [os.path.join(stateDir, LIMITS_DIR, "%s.%d.lock" % (fileName(name), slot)) for slot in range(slots)]
+        self.debug = debug or (lambda msg: None)
+
+
+    #Try once to take a free slot: return its open lock file, or None.
+    #A problem of the monitoring host is not a failure of the CE: without usable lock files the slot is a NoSlot.
+    def tryAcquire(self):
+        try:
+            return self.lock()
+        except (IOError, OSError) as ex:
+            self.debug("cannot use the slots of %s, running unthrottled: %s" % (self.name, ex))
+            return NoSlot()
+
+
+    #Lock the file of a free slot: return it open, or None.
+    def lock(self):
+        dir = os.path.dirname(self.paths[0])
+
+        if not os.path.isdir(dir):
+            try:
+                os.makedirs(dir)
+            except OSError as ex:
+                if ex.errno != errno.EEXIST:
+                    raise
+
+        # in random order: the waiting probes do not all try the same slot first
+        for path in random.sample(self.paths, len(self.paths)):
+            lockFile = open(path, "a")
+
+            try:
+                fcntl.flock(lockFile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return lockFile
+            except IOError as ex:
+                lockFile.close()
+
+                if ex.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+
+        return None
+
+
+    #Wait for a free slot until the deadline: return the open lock file holding it (closing it frees the slot).
+    def acquire(self, deadline):
+        delay = self.MIN_DELAY
+
+        while True:
+            lockFile = self.tryAcquire()
+
+            if lockFile:
+                return lockFile
+
+            if deadline.remaining() <= 0:
+                raise deadline.exceeded("timeout waiting for one of the %d slots of %s" % (len(self.paths), self.name))
+
+            time.sleep(min(random.uniform(self.MIN_DELAY, delay), deadline.remaining()))
+            delay = min(delay * 2, self.MAX_DELAY)
+
+
+
+# state: {"tokens": the tokens left at "time"}, the tokens may be negative: they are reserved by the waiting probes
+class TokenBucket(object):
+
+    #debug(msg) logs the problems of the state file.
+    def __init__(self, stateDir, name, rate, burst, debug=None):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.state = StateFile(os.path.join(stateDir, LIMITS_DIR, fileName(name) + ".bucket.json"))
+        self.debug = debug or (lambda msg: None)
+
+
+    #Take a token, waiting for it if needed: the wait must end before the deadline.
+    #Return the time waited (none, unthrottled, when the state file cannot be used).
+    def take(self, deadline):
+        now = time.time()
+
+        try:
+            with self.state.update() as data:
+                tokens = min(self.burst, data.get("tokens", self.burst) + (now - data.get("time", now)) * self.rate)
+                wait = max(0, 1 - tokens) / self.rate
+
+                if wait > deadline.remaining():
+                    raise deadline.exceeded("timeout waiting %.1f sec for a submission token of %s" % (wait, self.name))
+
+                data["tokens"] = tokens - 1
+                data["time"] = now
+        except (IOError, OSError, ValueError) as ex:
+            self.debug("cannot use the submission tokens of %s, running unthrottled: %s" % (self.name, ex))
+            return 0
+
+        if wait > 0:
+            time.sleep(wait)
+
+        return wait
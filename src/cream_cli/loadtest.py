@@ -0,0 +1,522 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+Load test of a CE queue: submits N jobs at a given rate and concurrency,
+tracks them to a terminal state with bulk status calls, purges them in
+bulk and reports the submission throughput, the latency percentiles and
+the classes of the errors.
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+from optparse import OptionParser
+from Queue import Queue, Empty
+import re, sys, threading, time
+
+from cream_cli.cream import Client
+from cream_cli.breaker import CONNECTION_ERRORS
+from cream_cli.history import percentile, PERCENTILES
+
+
+# the first matching class names an error
+ERROR_CLASSES = [("timeout", re.compile(r"timed out|timeout", re.IGNORECASE)),
+                 ("connection", CONNECTION_ERRORS),
+                 ("authorization", re.compile(r"authoriz|not allowed|denied|proxy|delegation|credential|certificate", re.IGNORECASE)),
+                 ("fault", re.compile(r"FaultString|fault", re.IGNORECASE))]
+
+
+#The class of an error: timeout, connection, authorization, fault or other.
+def errorClass(error):
+    for name, pattern in ERROR_CLASSES:
+        if pattern.search("%s" % error):
+            return name
+
+    return "other"
+
+
+
+class LoadTest(object):
+    DEFAULT_JOBS = 10
+    DEFAULT_RATE = 0
+    DEFAULT_CONCURRENCY = 5
+    DEFAULT_TIMEOUT = 3600
+    DEFAULT_POLL_INTERVAL = 10
+
+    STATUS = ["OK", "WARNING", "CRITICAL", "UNKNOWN"]
+
+    usage = "%prog [options]"
+    options = None
+
+
+    def __init__(self, name, version):
+        self.name = name
+        self.version = version
+        self.optionParser = OptionParser(usage=self.usage, version="%s v.%s" % (self.name, self.version))
+
+
+    # read out the options from the command-line
+    def createParser(self):
+        optionParser = self.optionParser
+        optionParser.add_option("-u",
+                      "--url",
+                      dest="url",
+                      help="The endpoint URL of the CREAM CE queue. Example: https://<host>:<port>/cream-<lrms>-<queue>")
+
+        optionParser.add_option("-j",
+                      "--jdl",
+                      dest="jdl",
+                      help="The jdl path of the jobs, e.g. script/sleep.jdl")
+
+        optionParser.add_option("-n",
+                      "--jobs",
+                      dest="jobs",
+                      type="int",
+                      default=self.DEFAULT_JOBS,
+                      help="Number of jobs to submit. [default: %default]")
+
+        optionParser.add_option("-r",
+                      "--rate",
+                      dest="rate",
+                      type="float",
+                      default=self.DEFAULT_RATE,
+                      help="Target submission rate in jobs per minute (0 submits as fast as the concurrency allows). [default: %default]")
+
+        optionParser.add_option("-c",
+                      "--concurrency",
+                      dest="concurrency",
+                      type="int",
+                      default=self.DEFAULT_CONCURRENCY,
+                      help="Number of submissions running at the same time. [default: %default]")
+
+        optionParser.add_option("-t",
+                      "--timeout",
+                      dest="timeout",
+                      type="int",
+                      default=self.DEFAULT_TIMEOUT,
+                      help="Time limit of the whole test, cleanup included. [default: %default sec]")
+
+        optionParser.add_option("--poll-interval",
+                      dest="pollInterval",
+                      type="int",
+                      default=self.DEFAULT_POLL_INTERVAL,
+                      help="Interval between two bulk status calls on the submitted jobs. [default: %default sec]")
+
+        optionParser.add_option("--cleanup-reserve",
+                      dest="cleanupReserve",
+                      type="int",
+                      default=Client.DEFAULT_CLEANUP_RESERVE,
+                      help="Part of the time limit kept to cancel and purge the jobs left. [default: %default sec]")
+
+        optionParser.add_option("-x",
+                      "--proxy",
+                      dest="proxy",
+                      help="The proxy path")
+
+        optionParser.add_option("-v",
+                      "--verbose",
+                      action="store_true",
+                      dest="verbose",
+                      default=False,
+                      help="verbose mode [default: %default]")
+
+        optionParser.add_option("--disable-proxy-check",
+                      action="store_true",
+                      dest="disableProxyCheck",
+                      default=False,
+                      help="Disable checking user proxy certificate validity [default: %default]")
+
+        optionParser.add_option("--auto-delegation",
+                      action="store_true",
+                      dest="autoDelegation",
+                      default=False,
+                      help="Delegate the proxy at every job submission [default: %default]")
+
+        optionParser.add_option("--cli-path",
+                      dest="cliPath",
+                      help="The directory of the glite-ce-* commands")
+
+        optionParser.add_option("--backend",
+                      dest="backend",
+                      type="choice",
+                      choices=Client.BACKENDS,
+                      help="How the test talks to CREAM: cli or ws")
+
+        optionParser.add_option("--ca-path",
+                      dest="caPath",
+                      help="The CA certificates verifying the CE with the ws backend")
+
+        optionParser.add_option("--state-dir",
+                      dest="stateDir",
+                      help="The directory holding the state shared by the probes")
+
+
+    def readOptions(self, args=None):
+        optionParser = self.optionParser
+
+        (self.options, args) = optionParser.parse_args(args)
+
+        if not self.options.url or not self.options.jdl:
+            optionParser.error("Specify the queue with -u URL and the job with -j JDL")
+
+        if self.options.jobs < 1 or self.options.concurrency < 1:
+            optionParser.error("the number of jobs and the concurrency must be positive")
+
+        if self.options.rate < 0 or self.options.pollInterval < 1:
+            optionParser.error("wrong options: --rate >= 0 and --poll-interval >= 1 required")
+
+        # the client checks the other options
+        self.tracker = self.makeClient()
+
+
+    #A client of the queue: the load test does not take the slots of the probes
+    #nor does it count in their circuit breaker.
+    def makeClient(self):
+        args = ["-u", self.options.url, "-j", self.options.jdl, "-t", str(self.options.timeout),
+                "--cleanup-reserve", str(self.options.cleanupReserve),
+                "--max-per-ce", "0", "--max-global", "0", "--breaker-threshold", "0"]
+
+        if self.options.proxy:
+            args += ["-x", self.options.proxy]
+
+        if self.options.verbose:
+            args.append("-v")
+
+        if self.options.disableProxyCheck:
+            args.append("--disable-proxy-check")
+
+        if self.options.autoDelegation:
+            args.append("--auto-delegation")
+
+        if self.options.cliPath:
+            args += ["--cli-path", self.options.cliPath]
+
+        if self.options.backend:
+            args += ["--backend", self.options.backend]
+
+        if self.options.caPath:
+            args += ["--ca-path", self.options.caPath]
+
+        if self.options.stateDir:
+            args += ["--state-dir", self.options.stateDir]
+
+        client = Client(self.name, self.version, embedded=True)
+        client.createParser("TRUE")
+        client.readOptions(args)
+
+        return client
+
+
+    #Submit the jobs taken from the queue of the tasks, each one not before its turn at the target rate.
+    def worker(self, client, tasks, results, start):
+        while True:
+            try:
+                index = tasks.get_nowait()
+            except Empty:
+                return
+
+            if self.options.rate:
+                delay = start + index * 60.0 / self.options.rate - time.time()
+
+                if delay > 0:
+                    time.sleep(min(delay, client.deadline.remaining()))
+
+            if client.deadline.expired():
+                results.put((index, None, None, None, "timeout: not submitted before the deadline"))
+                continue
+
+            submitted = time.time()
+
+            try:
+                jobId = client.jobSubmit()
+                results.put((index, submitted, time.time(), jobId, None))
+            except Exception as ex:
+                results.put((index, submitted, time.time(), None, "%s" % ex))
+
+
+    #The status of the jobs: map job id -> {"status", "exitCode", "error"}.
+    def statuses(self, client, jobIds):
+        if client.backend != "ws":
+            return client.jobStatusBulk(jobIds)
+
+        result = {}
+
+        for jobId in jobIds:
+            try:
+                status, exitCode = client.jobStatus(jobId)
+                result[jobId] = {"status": status, "exitCode": exitCode, "error": None}
+            except Exception as ex:
+                result[jobId] = {"status": None, "exitCode": -1, "error": "%s" % ex}
+
+        return result
+
+
+    #Cancel or purge the jobs: map job id -> {"error"}.
+    def bulk(self, client, operation, jobIds):
+        if client.backend != "ws":
+            return getattr(client, operation + "Bulk")(jobIds)
+
+        result = {}
+
+        for jobId in jobIds:
+            try:
+                getattr(client, operation)(jobId)
+                result[jobId] = {"error": None}
+            except Exception as ex:
+                result[jobId] = {"error": "%s" % ex}
+
+        return result
+
+
+    #Record the submissions reported by the workers: return how many were read.
+    def collect(self, results, jobs, active, timeout):
+        count = 0
+
+        try:
+            while True:
+                index, submitted, ended, jobId, error = results.get(timeout=timeout)
+                timeout = 0.01
+                count += 1
+
+                jobs[index].update(submitted=submitted, ended=ended, jobId=jobId, error=error)
+
+                if jobId:
+                    active[jobId] = jobs[index]
+        except Empty:
+            pass
+
+        return count
+
+
+    #Poll the status of the active jobs: the terminated ones leave the active jobs.
+    def poll(self, client, active):
+        try:
+            statuses = self.statuses(client, sorted(active))
+        except Exception as ex:
+            client.debug("cannot get the status of the jobs: %s" % ex)
+            self.pollErrors.append("%s" % ex)
+            return
+
+        now = time.time()
+
+        for jobId, record in statuses.items():
+            job = active[jobId]
+
+            if record["error"]:
+                job["statusError"] = record["error"]
+                continue
+
+            job.pop("statusError", None)
+
+            if record["status"] in client.RUNNING_STATES and "started" not in job:
+                job["started"] = now
+
+            if record["status"] in client.TERMINAL_STATES:
+                job["status"], job["exitCode"], job["terminated"] = record["status"], "%s" % record["exitCode"], now
+                del active[jobId]
+
+
+    #Cancel the unfinished jobs and purge all of them on the cleanup reserve.
+    def cleanup(self, client, jobs, active):
+        submitted = [job for job in jobs if job.get("jobId")]
+
+        with client.deadline.cleanup():
+            try:
+                if active:
+                    for jobId, record in self.bulk(client, "jobCancel", sorted(active)).items():
+                        if record["error"]:
+                            active[jobId]["cancelError"] = record["error"]
+
+                    # give CREAM the time to move the cancelled jobs to CANCELLED
+                    client.pollSleep(client.pollInitial, client.deadline)
+
+                    for jobId, record in self.statuses(client, sorted(active)).items():
+                        if record["status"] in client.TERMINAL_STATES:
+                            active[jobId]["cancelled"] = True
+
+                jobIds = [job["jobId"] for job in submitted if "status" in job or job.get("cancelled")]
+                purged = {}
+
+                if jobIds:
+                    start = time.time()
+                    purged = self.bulk(client, "jobPurge", jobIds)
+                    self.purgeTime = time.time() - start
+            except Exception as ex:
+                client.debug("cannot clean the jobs up: %s" % ex)
+                purged = {}
+                self.cleanupError = "%s" % ex
+
+        for job in submitted:
+            record = purged.get(job["jobId"])
+
+            if record is None:
+                job["purgeError"] = "not purged, left to the reaper"
+            elif record["error"] and "not found" not in record["error"]:
+                job["purgeError"] = record["error"]
+            else:
+                job["purged"] = True
+
+
+    #Run the test and print the report.
+    def run(self):
+        options = self.options
+        tracker = self.tracker
+
+        try:
+            tracker.checkProxy()
+        except Exception as ex:
+            print "CRITICAL: %s" % ex
+            return Client.CRITICAL
+
+        # all the clients share the same deadline
+        clients = [self.makeClient() for i in range(min(options.concurrency, options.jobs))]
+        for client in clients:
+            client.deadline = tracker.deadline
+
+        jobs = [{"index": index} for index in range(options.jobs)]
+        tasks = Queue()
+        results = Queue()
+        active = {}
+
+        self.pollErrors = []
+        self.purgeTime = None
+        self.cleanupError = None
+
+        for index in range(options.jobs):
+            tasks.put(index)
+
+        start = time.time()
+        threads = []
+
+        for client in clients:
+            thread = threading.Thread(target=self.worker, args=(client, tasks, results, start))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        reported = 0
+        lastPoll = 0
+
+        while reported < options.jobs or active:
+            reported += self.collect(results, jobs, active, min(1, max(0.01, tracker.deadline.remaining())))
+
+            if tracker.deadline.expired():
+                break
+
+            if active and time.time() - lastPoll >= options.pollInterval:
+                lastPoll = time.time()
+                self.poll(tracker, active)
+
+        # the submissions running at the deadline end with it
+        for thread in threads:
+            thread.join()
+
+        self.collect(results, jobs, active, 0.01)
+        self.cleanup(tracker, jobs, active)
+
+        elapsed = time.time() - start
+
+        exitCode, lines = self.report(jobs, elapsed)
+
+        for line in lines:
+            print line
+
+        sys.stdout.flush()
+
+        return exitCode
+
+
+    def percentiles(self, label, values):
+        if not values:
+            return "%-12s n=0" % label
+
+        values = sorted(values)
+
+        return "%-12s n=%-5d %s max=%.3fs" % (label, len(values),
+               " ".join(["p%d=%.3fs" % (p, percentile(values, p)) for p in PERCENTILES]), values[-1])
+
+
+    #The verdict and the lines of the report.
+    def report(self, jobs, elapsed):
+        options = self.options
+        submitted = [job for job in jobs if job.get("jobId")]
+        terminated = [job for job in submitted if "status" in job]
+        purged = [job for job in submitted if job.get("purged")]
+
+        errors = {}
+        examples = {}
+
+        def count(name, example):
+            errors[name] = errors.get(name, 0) + 1
+            examples.setdefault(name, example)
+
+        for job in jobs:
+            if job.get("error"):
+                count("submit/" + errorClass(job["error"]), job["error"])
+            elif "status" not in job:
+                count("unfinished", job.get("statusError") or "no terminal state before the deadline")
+            elif job["status"] != "DONE-OK" or job["exitCode"] != "0":
+                count("job/" + job["status"], "%s exitCode=%s" % (job["jobId"], job["exitCode"]))
+
+            if job.get("purgeError"):
+                count("purge/" + errorClass(job["purgeError"]), job["purgeError"])
+
+        for error in self.pollErrors:
+            count("status/" + errorClass(error), error)
+
+        if not submitted:
+            exitCode = Client.CRITICAL
+        elif errors:
+            exitCode = Client.WARNING
+        else:
+            exitCode = Client.OK
+
+        # the throughput of the submissions, from the first submission to the end of the last one
+        ends = [job["ended"] for job in submitted]
+        starts = [job["submitted"] for job in submitted]
+
+        if len(submitted) > 1 and max(ends) > min(starts):
+            throughput = "%.2f jobs/min" % (60 * len(submitted) / (max(ends) - min(starts)))
+        else:
+            throughput = "n/a"
+
+        lines = ["%s: %d of %d jobs submitted, %d terminated, %d purged in %.1f sec" % (self.STATUS[exitCode],
+                 len(submitted), options.jobs, len(terminated), len(purged), elapsed),
+                 "throughput=%s target=%s concurrency=%d" % (throughput, options.rate and "%.2f jobs/min" % options.rate or "unlimited",
+                 options.concurrency),
+                 self.percentiles("submit", [job["ended"] - job["submitted"] for job in submitted]),
+                 self.percentiles("queue_wait", [job["started"] - job["ended"] for job in submitted if "started" in job]),
+                 self.percentiles("run", [job["terminated"] - job["started"] for job in terminated if "started" in job]),
+                 self.percentiles("turnaround", [job["terminated"] - job["submitted"] for job in terminated])]
+
+        if self.purgeTime is not None:
+            lines.append("purge_time=%.3fs (bulk)" % self.purgeTime)
+
+        states = {}
+
+        for job in terminated:
+            states[job["status"]] = states.get(job["status"], 0) + 1
+
+        lines.append("states: %s" % (" ".join(["%s=%d" % item for item in sorted(states.items())]) or "none"))
+
+        for name in sorted(errors):
+            lines.append("error %s=%d: %s" % (name, errors[name], " ".join(examples[name].split())[:300]))
+
+        if self.cleanupError:
+            lines.append("cleanup failed: %s" % self.cleanupError)
+
+        return exitCode, lines
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+---------------------------------------------------------------------------
+Reads the expiration time of the user proxy without forking voms-proxy-info.
+---------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+import base64, calendar, os, time
+
+from cream_cli.state import StateFile
+
+
+BEGIN = "-----BEGIN CERTIFICATE-----"
+END = "-----END CERTIFICATE-----"
+
+UTC_TIME = 0x17
+GENERALIZED_TIME = 0x18
+
+# the proxies already read by this process (e.g. the runner or the daemon): (path, mtime, inode) -> notAfter
+notAfterCache = {}
+
+
+#Decode the DER tag and length at offset: return the tag and the boundaries of its content.
+def readTLV(der, offset):
+    tag = der[offset]
+    length = der[offset + 1]
+    offset += 2
+
+    if length & 0x80:
+        size = length & 0x7f
+        length = 0
+
+        for byte in der[offset:offset + size]:
+            length = (length << 8) | byte
+
+        offset += size
+
+    if offset + length > len(der):
+        raise Exception("malformed certificate: truncated DER element")
+
+    return tag, offset, offset + length
+
+
+
+#Return the notAfter (seconds since the epoch) of the first certificate in a PEM file, i.e. the proxy itself.
+def readNotAfter(path):
+    with open(path) as infile:
+        pem = infile.read()
+
+    begin = pem.find(BEGIN)
+    end = pem.find(END, begin)
+
+    if begin < 0 or end < 0:
+        raise Exception("no certificate found in " + path)
+
+    der = bytearray(base64.b64decode("".join(pem[begin + len(BEGIN):end].split())))
+
+    # Certificate ::= SEQUENCE { tbsCertificate, signatureAlgorithm, signatureValue }
+    tag, start, end = readTLV(der, 0)
+    tag, start, end = readTLV(der, start)
+
+    # TBSCertificate ::= SEQUENCE { [0] version OPTIONAL, serialNumber, signature, issuer, validity, ... }
+    fields = []
+    offset = start
+
+    while offset < end and len(fields) < 5:
+        tag, start, offset = readTLV(der, offset)
+        fields.append((tag, start, offset))
+
+    if fields and fields[0][0] == 0xa0:
+        fields = fields[1:]
+
+    if len(fields) < 4:
+        raise Exception("malformed certificate: validity not found")
+
+    # Validity ::= SEQUENCE { notBefore Time, notAfter Time }
+    tag, start, end = fields[3]
+    tag, start, end = readTLV(der, start)
+    tag, start, end = readTLV(der, end)
+
+    value = str(der[start:end])
+
+    if tag == UTC_TIME:
+        # YYMMDDHHMMSSZ: years from 50 to 99 belong to the 20th century
+        year = int(value[:2])
+        value = str(year < 50 and 2000 + year or 1900 + year) + value[2:]
+    elif tag != GENERALIZED_TIME:
+        raise Exception("malformed certificate: unexpected notAfter encoding")
+
+    return calendar.timegm(time.strptime(value[:14], "%Y%m%d%H%M%S"))
+
+
+
+#Return the notAfter of the proxy, caching it by path, mtime and inode so that a replaced proxy is read again.
+def getNotAfter(path, cachePath=None):
+    info = os.stat(path)
+    key = os.path.abspath(path)
+
+    if (key, info.st_mtime, info.st_ino) in notAfterCache:
+        return notAfterCache[(key, info.st_mtime, info.st_ino)]
+
+    if cachePath:
+        try:
+            entry = StateFile(cachePath).read().get(key)
+
+            if entry and entry["mtime"] == info.st_mtime and entry["inode"] == info.st_ino:
+                notAfterCache[(key, info.st_mtime, info.st_ino)] = entry["notAfter"]
+                return entry["notAfter"]
+        except Exception:
+            pass
+
+    notAfter = readNotAfter(path)
+    notAfterCache[(key, info.st_mtime, info.st_ino)] = notAfter
+
+    if cachePath:
+        try:
+            with StateFile(cachePath).update() as cache:
+                cache[key] = {"mtime": info.st_mtime, "inode": info.st_ino, "notAfter": notAfter}
+        except Exception:
+            pass
+
+    return notAfter
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+--------------------------------------------------------------------------
+Reclaims the jobs left behind by the probes: the old entries of the job
+ledgers are cancelled and purged with bulk commands, CE by CE.
+--------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+from optparse import OptionParser
+import time
+
+from cream_cli.cream import Client
+from cream_cli.ledger import ledgers
+
+
+class Reaper(object):
+    # longer than the asynchronous jobs may legitimately wait (--max-job-age)
+    DEFAULT_OLDER_THAN = 7200
+    TERMINAL_STATES = ["DONE-OK", "DONE-FAILED", "ABORTED", "CANCELLED"]
+
+    STATUS = ["OK", "WARNING", "CRITICAL", "UNKNOWN"]
+
+    usage = "%prog [options]"
+    options = None
+
+
+    def __init__(self, name, version):
+        self.name = name
+        self.version = version
+        self.optionParser = OptionParser(usage=self.usage, version="%s v.%s" % (self.name, self.version))
+
+
+    # read out the options from the command-line
+    def createParser(self):
+        optionParser = self.optionParser
+        optionParser.add_option("-e",
+                      "--endpoint",
+                      action="append",
+                      dest="endpoints",
+                      default=[],
+                      help="Reap only the jobs of this CE, as <host>:<port> (can be repeated). [default: all the CEs of the ledgers]")
+
+        optionParser.add_option("-a",
+                      "--older-than",
+                      dest="olderThan",
+                      type="int",
+                      default=self.DEFAULT_OLDER_THAN,
+                      help="Reap the jobs submitted more than this ago. [default: %default sec]")
+
+        optionParser.add_option("-x",
+                      "--proxy",
+                      dest="proxy",
+                      help="The proxy path")
+
+        optionParser.add_option("-t",
+                      "--timeout",
+                      dest="timeout",
+                      type="int",
+                      default=Client.DEFAULT_TIMEOUT,
+                      help="Execution time limit per CE. [default: %default sec]")
+
+        optionParser.add_option("-n",
+                      "--dry-run",
+                      action="store_true",
+                      dest="dryRun",
+                      default=False,
+                      help="Only report the jobs to reap [default: %default]")
+
+        optionParser.add_option("-v",
+                      "--verbose",
+                      action="store_true",
+                      dest="verbose",
+                      default=False,
+                      help="verbose mode [default: %default]")
+
+        optionParser.add_option("--cli-path",
+                      dest="cliPath",
+                      help="The directory of the glite-ce-* commands")
+
+        optionParser.add_option("--state-dir",
+                      dest="stateDir",
+                      default=Client.DEFAULT_STATE_DIR,
+                      help="The directory holding the state shared by the probes. [default: %default]")
+
+
+    def readOptions(self, args=None):
+        (self.options, args) = self.optionParser.parse_args(args)
+
+        if self.options.olderThan < 0:
+            self.optionParser.error("the age of the jobs to reap cannot be negative")
+
+
+    #The client talking to a CE.
+    def makeClient(self, endpoint):
+        args = ["-u", "https://" + endpoint, "-t", str(self.options.timeout), "--state-dir", self.options.stateDir]
+
+        if self.options.proxy:
+            args += ["-x", self.options.proxy]
+
+        if self.options.cliPath:
+            args += ["--cli-path", self.options.cliPath]
+
+        if self.options.verbose:
+            args.append("-v")
+
+        client = Client(self.name, self.version, embedded=True)
+        client.createParser("FALSE")
+        client.readOptions(args)
+
+        return client
+
+
+    #Cancel and purge the old jobs of a CE: return the counters of the outcome.
+    def reap(self, endpoint, jobIds):
+        client = self.makeClient(endpoint)
+        result = {"reclaimed": 0, "gone": 0, "cancelled": 0, "pending": 0, "failed": 0}
+
+        statuses = client.jobStatusBulk(jobIds)
+        terminated = []
+        active = []
+
+        for jobId, record in statuses.items():
+            if record["error"] and "not found" in record["error"]:
+                result["gone"] += 1
+            elif record["error"]:
+                client.debug("cannot get the status of %s: %s" % (jobId, record["error"]))
+                result["failed"] += 1
+            elif record["status"] in self.TERMINAL_STATES:
+                terminated.append(jobId)
+            else:
+                active.append(jobId)
+
+        # the jobs unknown to the CE need no command
+        client.forgetJobs([jobId for jobId, record in statuses.items() if record["error"] and "not found" in record["error"]])
+
+        if active:
+            cancelled = [jobId for jobId, record in client.jobCancelBulk(active).items() if not record["error"]]
+            result["cancelled"] = len(cancelled)
+            result["failed"] += len(active) - len(cancelled)
+
+            if cancelled:
+                # give CREAM the time to move the cancelled jobs to CANCELLED
+                client.pollSleep(client.pollInitial, client.deadline)
+
+                for jobId, record in client.jobStatusBulk(cancelled).items():
+                    if record["status"] in self.TERMINAL_STATES or (record["error"] and "not found" in record["error"]):
+                        terminated.append(jobId)
+                    else:
+                        # purged by the next run
+                        result["pending"] += 1
+
+        if terminated:
+            for jobId, record in client.jobPurgeBulk(terminated).items():
+                if not record["error"] or "not found" in record["error"]:
+                    result["reclaimed"] += 1
+                else:
+                    client.debug("cannot purge %s: %s" % (jobId, record["error"]))
+                    result["failed"] += 1
+
+        result["reclaimed"] += result["gone"]
+
+        return result
+
+
+    #Reap the old jobs of every ledger and print one line per CE.
+    def run(self):
+        exitCode = Client.OK
+        lines = []
+        total = 0
+        found = 0
+
+        for ledger in ledgers(self.options.stateDir):
+            if self.options.endpoints and ledger.endpoint not in self.options.endpoints:
+                continue
+
+            jobs = ledger.olderThan(self.options.olderThan)
+
+            if not jobs:
+                continue
+
+            found += len(jobs)
+
+            if self.options.dryRun:
+                lines.append("%s jobs=%d oldest=%d sec" % (ledger.endpoint, len(jobs), time.time() - min([entry["submitted"] for entry in jobs.values()])))
+                continue
+
+            try:
+                result = self.reap(ledger.endpoint, sorted(jobs))
+            except Exception as ex:
+                lines.append("%s ERROR: %s" % (ledger.endpoint, ex))
+                exitCode = Client.WARNING
+                continue
+
+            total += result["reclaimed"]
+
+            if result["failed"]:
+                exitCode = Client.WARNING
+
+            lines.append("%s reclaimed=%d gone=%d cancelled=%d pending=%d failed=%d" % (ledger.endpoint, result["reclaimed"], result["gone"],
+                         result["cancelled"], result["pending"], result["failed"]))
+
+        if self.options.dryRun:
+            print "%s: %d jobs older than %d sec to reap" % (self.STATUS[exitCode], found, self.options.olderThan)
+        else:
+            print "%s: reclaimed %d of %d jobs older than %d sec" % (self.STATUS[exitCode], total, found, self.options.olderThan)
+
+        for line in lines:
+            print line
+
+        return exitCode
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+Reports the latency percentiles and the failure rates of the checks from
+the history of the CEs, as text or as an OpenMetrics text file (e.g. for
+the textfile collector of the Prometheus node exporter).
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+from optparse import OptionParser
+import os, sys, tempfile, time
+
+from cream_cli.cream import Client
+from cream_cli.history import History, histories, CHECKS, PHASES, PERCENTILES
+
+
+class HistoryReport(object):
+    DEFAULT_WINDOW = 86400
+
+    usage = "%prog [options]"
+    options = None
+
+
+    def __init__(self, name, version):
+        self.name = name
+        self.version = version
+        self.optionParser = OptionParser(usage=self.usage, version="%s v.%s" % (self.name, self.version))
+
+
+    # read out the options from the command-line
+    def createParser(self):
+        optionParser = self.optionParser
+        optionParser.add_option("-e",
+                      "--endpoint",
+                      action="append",
+                      dest="endpoints",
+                      default=[],
+                      help="Report only this CE, as <host>:<port> (can be repeated). [default: all the CEs with a history]")
+
+        optionParser.add_option("-c",
+                      "--checks",
+                      dest="checks",
+                      default=",".join(CHECKS),
+                      help="Comma separated list of checks to report. [default: %default]")
+
+        optionParser.add_option("-w",
+                      "--window",
+                      dest="window",
+                      type="int",
+                      default=self.DEFAULT_WINDOW,
+                      help="Report the results of the last window seconds. [default: %default sec]")
+
+        optionParser.add_option("--openmetrics",
+                      dest="openMetrics",
+                      help="Write the report in the OpenMetrics text format to this file ('-' for the standard output)")
+
+        optionParser.add_option("--state-dir",
+                      dest="stateDir",
+                      default=Client.DEFAULT_STATE_DIR,
+                      help="The directory holding the state shared by the probes. [default: %default]")
+
+
+    def readOptions(self, args=None):
+        (self.options, args) = self.optionParser.parse_args(args)
+
+        self.checks = [check.strip() for check in self.options.checks.split(",") if check.strip()]
+
+        for check in self.checks:
+            if check not in CHECKS:
+                self.optionParser.error("unknown check '%s' (use %s)" % (check, ",".join(CHECKS)))
+
+        if self.options.window <= 0:
+            self.optionParser.error("the window must be positive")
+
+
+    #The statistics of every CE and check: [(endpoint, check, statistics)].
+    def collect(self):
+        result = []
+
+        if self.options.endpoints:
+            sources = [History(self.options.stateDir, endpoint) for endpoint in self.options.endpoints]
+        else:
+            sources = histories(self.options.stateDir)
+
+        for history in sources:
+            summary = history.summary(self.options.window)
+
+            for check in self.checks:
+                if check in summary:
+                    result.append((history.endpoint, check, summary[check]))
+
+        return result
+
+
+    def formatText(self, results):
+        lines = ["CREAM probe history of the last %d sec: %d CEs, %d checks" % (self.options.window,
+                 len(set([endpoint for endpoint, check, statistics in results])), len(results))]
+
+        for endpoint, check, statistics in results:
+            lines.append("%s %s runs=%d warnings=%d failures=%d failure_rate=%.1f%% last=%s" % (endpoint, check,
+                         statistics["runs"], statistics["warnings"], statistics["failures"], 100 * statistics["failureRate"],
+                         time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(statistics["last"]))))
+
+            for phase in PHASES:
+                if phase in statistics["phases"]:
+                    count, p50, p95, p99 = statistics["phases"][phase]
+                    lines.append("    %-18s n=%-5d p50=%.3fs p95=%.3fs p99=%.3fs" % (phase, count, p50, p95, p99))
+
+        return "\n".join(lines) + "\n"
+
+
+    def formatOpenMetrics(self, results):
+        window = self.options.window
+        families = [("cream_probe_runs", "The check runs in the window."),
+                    ("cream_probe_warnings", "The check runs in the window returning WARNING."),
+                    ("cream_probe_failures", "The check runs in the window returning CRITICAL or UNKNOWN."),
+                    ("cream_probe_failure_ratio", "The share of the check runs in the window returning CRITICAL or UNKNOWN."),
+                    ("cream_probe_last_run_timestamp_seconds", "The time of the last check run."),
+                    ("cream_probe_phase_duration_seconds", "The percentiles of the time spent by the check runs of the window in each phase.")]
+        samples = dict((name, []) for name, help in families)
+
+        for endpoint, check, statistics in results:
+            labels = 'endpoint="%s",check="%s",window="%d"' % (escapeLabel(endpoint), check, window)
+
+            samples["cream_probe_runs"].append("cream_probe_runs{%s} %d" % (labels, statistics["runs"]))
+            samples["cream_probe_warnings"].append("cream_probe_warnings{%s} %d" % (labels, statistics["warnings"]))
+            samples["cream_probe_failures"].append("cream_probe_failures{%s} %d" % (labels, statistics["failures"]))
+            samples["cream_probe_failure_ratio"].append("cream_probe_failure_ratio{%s} %s" % (labels, repr(statistics["failureRate"])))
+            samples["cream_probe_last_run_timestamp_seconds"].append("cream_probe_last_run_timestamp_seconds{%s} %.3f" % (labels, statistics["last"]))
+
+            for phase in PHASES:
+                if phase in statistics["phases"]:
+                    for p, value in zip(PERCENTILES, statistics["phases"][phase][1:]):
+                        samples["cream_probe_phase_duration_seconds"].append('cream_probe_phase_duration_seconds{%s,phase="%s",quantile="%s"} %.6f' % (
+                                                                           labels, phase, p / 100.0, value))
+
+        lines = []
+
+        for name, help in families:
+            lines += ["# HELP %s %s" % (name, help), "# TYPE %s gauge" % name]
+            lines += samples[name]
+
+        lines.append("# EOF")
+
+        return "\n".join(lines) + "\n"
+
+
+    #Write the file in a temporary file and rename it: the collector never reads a partial export.
+    def write(self, path, text):
+        if path == "-":
+            sys.stdout.write(text)
+            return
+
+        fd, tmp = tempfile.mkstemp(prefix=".", dir=os.path.dirname(os.path.abspath(path)))
+
+        try:
+            with os.fdopen(fd, "w") as outfile:
+                outfile.write(text)
+
+            os.chmod(tmp, 0644)
+            os.rename(tmp, path)
+        except:
+            os.unlink(tmp)
+            raise
+
+
+    def run(self):
+        results = self.collect()
+
+        if self.options.openMetrics:
+            self.write(self.options.openMetrics, self.formatOpenMetrics(results))
+
+            if self.options.openMetrics == "-":
+                return Client.OK
+
+        sys.stdout.write(self.formatText(results))
+
+        return Client.OK
+
+
+
+def escapeLabel(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+--------------------------------------------------------------------------
+Runs several checks against several CREAM CEs with a bounded worker pool.
+--------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+from optparse import OptionParser
+from urlparse import urlparse
+from Queue import Queue, Empty
+import threading, sys, time
+
+from cream_cli.cream import Client
+from cream_cli.checks import CHECKS, ASYNC_CHECKS, runCheck, startCheck, finishCheck
+
+
+class Runner(object):
+    DEFAULT_WORKERS = 10
+    # the checks stop at their own deadline: this is the extra time granted before abandoning them
+    TIMEOUT_GRACE = 10
+    DEFAULT_CHECKS = "jobSubmit,jobOutput,jobCancel,jobPurge,serviceInfo,allowedSubmission"
+
+    STATUS = ["OK", "WARNING", "CRITICAL", "UNKNOWN"]
+
+    usage = "%prog [options]"
+    options = None
+    tasks = None
+
+
+    def __init__(self, name, version):
+        self.name = name
+        self.version = version
+        self.optionParser = OptionParser(usage=self.usage, version="%s v.%s" % (self.name, self.version))
+        self.tasks = []
+
+
+    # read out the options from the command-line
+    def createParser(self):
+        optionParser = self.optionParser
+        optionParser.add_option("-u",
+                      "--url",
+                      action="append",
+                      dest="urls",
+                      default=[],
+                      help="The endpoint URL of a CREAM CE (can be repeated). Example: https://<host>:<port>/cream-<lrms>-<queue>")
+
+        optionParser.add_option("-f",
+                      "--file",
+                      dest="file",
+                      help="A file containing one endpoint URL per line")
+
+        optionParser.add_option("-c",
+                      "--checks",
+                      dest="checks",
+                      default=self.DEFAULT_CHECKS,
+                      help="Comma separated list of checks to run. [default: %default]")
+
+        optionParser.add_option("-w",
+                      "--workers",
+                      dest="workers",
+                      type="int",
+                      default=self.DEFAULT_WORKERS,
+                      help="Number of checks running concurrently. [default: %default]")
+
+        optionParser.add_option("-j",
+                      "--jdl",
+                      dest="jdl",
+                      help="The jdl path used by the job checks")
+
+        optionParser.add_option("-d",
+                      "--dir",
+                      dest="dir",
+                      help="The output sandbox path used by jobOutput")
+
+        optionParser.add_option("-x",
+                      "--proxy",
+                      dest="proxy",
+                      help="The proxy path")
+
+        optionParser.add_option("-t",
+                      "--timeout",
+                      dest="timeout",
+                      type="int",
+                      default=Client.DEFAULT_TIMEOUT,
+                      help="Execution time limit of each check. [default: %default sec]")
+
+        optionParser.add_option("-v",
+                      "--verbose",
+                      action="store_true",
+                      dest="verbose",
+                      default=False,
+                      help="verbose mode [default: %default]")
+
+        optionParser.add_option("--disable-proxy-check",
+                      action="store_true",
+                      dest="disableProxyCheck",
+                      default=False,
+                      help="Disable checking user proxy certificate validity [default: %default]")
+
+        optionParser.add_option("--proxy-warning",
+                      dest="proxyWarning",
+                      type="int",
+                      help="Minimum proxy lifetime below which the result is WARNING")
+
+        optionParser.add_option("--proxy-critical",
+                      dest="proxyCritical",
+                      type="int",
+                      help="Minimum proxy lifetime below which the result is CRITICAL")
+
+        optionParser.add_option("--auto-delegation",
+                      action="store_true",
+                      dest="autoDelegation",
+                      default=False,
+                      help="Delegate the proxy at every job submission [default: %default]")
+
+        optionParser.add_option("--cli-path",
+                      dest="cliPath",
+                      help="The directory of the glite-ce-* commands")
+
+        optionParser.add_option("--backend",
+                      dest="backend",
+                      type="choice",
+                      choices=Client.BACKENDS,
+                      help="How the checks talk to CREAM: cli or ws")
+
+        optionParser.add_option("--ca-path",
+                      dest="caPath",
+                      help="The CA certificates verifying the CEs with the ws backend")
+
+        optionParser.add_option("--warning",
+                      dest="warning",
+                      help="Latency thresholds of the job checks above which the result is WARNING, e.g. turnaround=1800,queue=600,submit=30")
+
+        optionParser.add_option("--critical",
+                      dest="critical",
+                      help="Latency thresholds of the job checks above which the result is CRITICAL")
+
+        optionParser.add_option("--state-dir",
+                      dest="stateDir",
+                      help="The directory holding the state shared by the probes")
+
+
+    def readOptions(self, args=None):
+        optionParser = self.optionParser
+
+        (self.options, args) = optionParser.parse_args(args)
+
+        urls = list(self.options.urls)
+
+        if self.options.file:
+            try:
+                for line in open(self.options.file):
+                    line = line.strip()
+
+                    if line and not line.startswith("#"):
+                        urls.append(line)
+            except IOError as ex:
+                optionParser.error("cannot read the endpoints file: %s" % ex)
+
+        if not urls:
+            optionParser.error("Specify at least one endpoint with -u URL or -f FILE")
+
+        checks = [check.strip() for check in self.options.checks.split(",") if check.strip()]
+
+        for check in checks:
+            if check not in CHECKS:
+                optionParser.error("unknown check '%s' (use %s)" % (check, self.DEFAULT_CHECKS))
+
+        if self.options.workers < 1:
+            optionParser.error("the number of workers must be positive")
+
+        # the service checks are run once per host:port whatever the number of queues
+        seen = set()
+
+        for url in urls:
+            o = urlparse(url)
+            service = "%s://%s" % (o.scheme, o.netloc)
+
+            for check in checks:
+                if CHECKS[check][2] == "TRUE":
+                    endpoint = url
+                else:
+                    endpoint = service
+
+                if (check, endpoint) not in seen:
+                    seen.add((check, endpoint))
+                    self.tasks.append((check, endpoint))
+
+
+    # the command-line of the check as if it were run by Nagios
+    def makeArgs(self, check, endpoint):
+        args = ["-u", endpoint, "-t", str(self.options.timeout)]
+
+        if self.options.proxy:
+            args += ["-x", self.options.proxy]
+
+        if self.options.verbose:
+            args.append("-v")
+
+        if self.options.disableProxyCheck:
+            args.append("--disable-proxy-check")
+
+        if self.options.proxyWarning is not None:
+            args += ["--proxy-warning", str(self.options.proxyWarning)]
+
+        if self.options.proxyCritical is not None:
+            args += ["--proxy-critical", str(self.options.proxyCritical)]
+
+        if self.options.stateDir:
+            args += ["--state-dir", self.options.stateDir]
+
+        if self.options.cliPath:
+            args += ["--cli-path", self.options.cliPath]
+
+        if self.options.backend:
+            args += ["--backend", self.options.backend]
+
+        if self.options.caPath:
+            args += ["--ca-path", self.options.caPath]
+
+        if CHECKS[check][2] == "TRUE":
+            if self.options.jdl:
+                args += ["-j", self.options.jdl]
+
+            if self.options.autoDelegation:
+                args.append("--auto-delegation")
+
+            if self.options.warning:
+                args += ["--warning", self.options.warning]
+
+            if self.options.critical:
+                args += ["--critical", self.options.critical]
+
+            if check == "jobOutput" and self.options.dir:
+                args += ["-d", self.options.dir]
+
+        return args
+
+
+    #Run a single check and return its Nagios exit code and message.
+    def runCheck(self, check, endpoint, started=None):
+        return runCheck(check, self.makeArgs(check, endpoint), started=started)
+
+
+    #Start a single command check on the engine: return its client and command.
+    def startCheck(self, check, endpoint, engine):
+        return startCheck(check, self.makeArgs(check, endpoint), engine)
+
+
+    #Return the Nagios exit code and message of a check started on the engine.
+    def finishCheck(self, check, endpoint, client, command):
+        return finishCheck(check, client, command)
+
+
+    # the ws backend has blocking calls only: its checks keep a worker each
+    def onEngine(self, check):
+        return check in ASYNC_CHECKS and self.options.backend != "ws"
+
+
+    def worker(self, tasks, results):
+        while True:
+            index, check, endpoint = tasks.get()
+
+            code, msg = self.runCheck(check, endpoint, lambda client: results.put((index, "started", client)))
+            results.put((index, code, msg))
+
+
+    #One line per result: the lines after the first one (e.g. the details of an error) are dropped.
+    def printResult(self, check, endpoint, code, msg):
+        print "%s %s %s: %s" % (check, endpoint, self.STATUS[code], ("%s" % msg).split("\n", 1)[0].rstrip())
+        sys.stdout.flush()
+
+
+    #Run all the checks and print one result per endpoint/check as soon as it is available.
+    #The single command checks run on one engine driven by this thread, the others in the worker threads.
+    def run(self):
+        from cream_cli.engine import Engine
+
+        engine = Engine()
+        waiting = []
+        tasks = Queue()
+        results = Queue()
+
+        for index, (check, endpoint) in enumerate(self.tasks):
+            if self.onEngine(check):
+                waiting.append(index)
+            else:
+                tasks.put((index, check, endpoint))
+
+        for i in range(min(self.options.workers, tasks.qsize())):
+            thread = threading.Thread(target=self.worker, args=(tasks, results))
+            thread.daemon = True
+            thread.start()
+
+        started = {}
+        clients = {}
+        commands = {}
+        pending = set(range(len(self.tasks)))
+        exitCode = Client.OK
+
+        while pending:
+            # at most --workers checks on the engine: the time limit of a check starts with it
+            while waiting and len(commands) < self.options.workers:
+                index = waiting.pop(0)
+                check, endpoint = self.tasks[index]
+                clients[index], commands[index] = self.startCheck(check, endpoint, engine)
+
+            timeout = 1
+
+            if commands:
+                engine.poll()
+                timeout = 0
+
+            try:
+                while True:
+                    index, code, msg = results.get(timeout=timeout)
+                    timeout = 0
+
+                    if code == "started":
+                        started[index] = time.time()
+                        clients[index] = msg
+                    elif index in pending:
+                        pending.discard(index)
+
+                        check, endpoint = self.tasks[index]
+                        self.printResult(check, endpoint, code, msg)
+                        exitCode = max(exitCode, code)
+            except Empty:
+                pass
+
+            for index in sorted(commands):
+                if commands[index].done:
+                    command = commands.pop(index)
+                    pending.discard(index)
+
+                    check, endpoint = self.tasks[index]
+                    code, msg = self.finishCheck(check, endpoint, clients.pop(index), command)
+                    self.printResult(check, endpoint, code, msg)
+                    exitCode = max(exitCode, code)
+
+            # a check overrunning its time limit is reported and abandoned: a thread cannot be stopped,
+            # but its commands are killed as at the deadline, so it fails soon and frees its worker
+            # (a check blocked elsewhere, e.g. in a ws call, keeps its worker until it returns)
+            now = time.time()
+
+            for index in sorted(pending):
+                if index in started and now - started[index] > self.options.timeout + self.TIMEOUT_GRACE:
+                    pending.discard(index)
+                    clients[index].kill()
+
+                    check, endpoint = self.tasks[index]
+                    self.printResult(check, endpoint, Client.WARNING, "Timeout occurred (" + str(self.options.timeout) + " sec)")
+                    exitCode = max(exitCode, Client.WARNING)
+
+        return exitCode
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+A client of the CREAM web service (SOAP over HTTPS) authenticated with
+the user proxy: the connections are kept alive and reused per endpoint.
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+import calendar, httplib, os, socket, ssl, threading, time
+
+from cream_cli.status import JobStatus
+
+
+CREAM_NS = "http://glite.org/2007/11/ce/cream"
+TYPES_NS = "http://glite.org/2007/11/ce/cream/types"
+SERVICE_PATH = "/ce-cream/services/CREAM2"
+
+ENVELOPE = """<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:cream="%s" xmlns:types="%s">
+<soapenv:Body>%%s</soapenv:Body>
+</soapenv:Envelope>""" % (CREAM_NS, TYPES_NS)
+
+
+# the idle connections per endpoint and proxy: shared by all the clients of the process
+pools = {}
+poolsLock = threading.Lock()
+
+
+#The tag of an element without its namespace.
+def localName(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+#The children of an element with the given local name.
+def children(element, name):
+    return [child for child in element if localName(child.tag) == name]
+
+
+#The text of the first descendant with the given local name (None if missing).
+def findText(element, name):
+    for child in element.iter():
+        if localName(child.tag) == name:
+            return child.text
+
+    return None
+
+
+#The epoch of an xsd:dateTime, e.g. 2026-10-17T10:00:00.000Z (None if not parsable).
+def toEpoch(timestamp):
+    try:
+        return calendar.timegm(time.strptime(timestamp[:19], "%Y-%m-%dT%H:%M:%S"))
+    except (TypeError, ValueError):
+        return None
+
+
+
+class CreamService(object):
+    #The CREAM web service of the endpoint of the client.
+
+    def __init__(self, client):
+        self.client = client
+        self.host = client.hostname
+        self.port = int(client.port)
+        self.serviceURL = "https://%s:%d%s" % (self.host, self.port, SERVICE_PATH)
+        self.key = (self.host, self.port, client.proxy, client.caPath)
+
+
+    def context(self):
+        client = self.client
+
+        if not client.proxy:
+            raise Exception("the ws backend requires a proxy (X509_USER_PROXY not set)")
+
+        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        context.options |= ssl.OP_NO_SSLv2 | ssl.OP_NO_SSLv3
+        context.verify_mode = ssl.CERT_REQUIRED
+        context.check_hostname = True
+
+        # the proxy file holds the proxy certificate, its key and the chain up to the user certificate
+        try:
+            context.load_cert_chain(client.proxy)
+        except (IOError, ssl.SSLError) as ex:
+            raise Exception("cannot load the proxy %s: %s" % (client.proxy, ex))
+
+        try:
+            if os.path.isdir(client.caPath):
+                context.load_verify_locations(capath=client.caPath)
+            else:
+                context.load_verify_locations(cafile=client.caPath)
+        except (IOError, ssl.SSLError) as ex:
+            raise Exception("cannot load the CA certificates %s: %s" % (client.caPath, ex))
+
+        return context
+
+
+    #An idle connection to the endpoint, or a new one.
+    def acquire(self):
+        with poolsLock:
+            idle = pools.setdefault(self.key, [])
+
+            if idle:
+                return idle.pop(), True
+
+        self.client.debug("opening a connection to " + self.serviceURL)
+
+        return httplib.HTTPSConnection(self.host, self.port, context=self.context()), False
+
+
+    def release(self, connection):
+        with poolsLock:
+            pools.setdefault(self.key, []).append(connection)
+
+
+    #Post a SOAP request and return the body of the response; a fault raises an exception.
+    def call(self, operation, body):
+        client = self.client
+        request = ENVELOPE % body
+
+        headers = {"Content-Type": "text/xml; charset=utf-8",
+                   "SOAPAction": '"%s"' % operation,
+                   "Connection": "keep-alive"}
+
+        # the request gets only the time left before the deadline
+        client.deadline.check()
+
+        client.debug("invoking %s on %s" % (operation, self.serviceURL))
+        client.allowCall()
+
+        with client.slot():
+            return self.post(operation, request, headers)
+
+
+
+    def post(self, operation, request, headers):
+        client = self.client
+        timeout = max(1, client.deadline.remaining())
+
+        connection, reused = self.acquire()
+
+        try:
+            try:
+                connection.timeout = timeout
+
+                if connection.sock:
+                    connection.sock.settimeout(timeout)
+
+                connection.request("POST", SERVICE_PATH, request, headers)
+                response = connection.getresponse()
+            except (httplib.HTTPException, socket.error, ssl.SSLError) as ex:
+                if not reused:
+                    raise
+
+                # the server may have closed the idle connection: retry once on a new one
+                client.debug("reopening the connection to %s: %s" % (self.serviceURL, ex))
+                connection.close()
+                connection = httplib.HTTPSConnection(self.host, self.port, timeout=timeout, context=self.context())
+                connection.request("POST", SERVICE_PATH, request, headers)
+                response = connection.getresponse()
+
+            data = response.read()
+        except Exception as ex:
+            connection.close()
+
+            if client.deadline.expired():
+                error = client.deadline.exceeded("%s on %s timed out: %s" % (operation, self.serviceURL, ex))
+            else:
+                error = Exception("%s on %s failed: %s" % (operation, self.serviceURL, ex))
+
+            client.recordCall(error)
+            raise error
+
+        # the CE answered, even if with a fault
+        client.recordCall()
+
+        if response.getheader("connection", "").lower() == "close":
+            connection.close()
+        else:
+            self.release(connection)
+
+        try:
+            envelope = ElementTree.fromstring(data)
+        except Exception:
+            raise Exception("%s on %s failed: HTTP %s %s" % (operation, self.serviceURL, response.status, response.reason))
+
+        for element in envelope.iter():
+            if localName(element.tag) == "Fault":
+                raise Exception("%s on %s failed: FaultString=[%s] FaultCode=[%s] FaultCause=[%s]" % (operation, self.serviceURL,
+                                findText(element, "faultstring"), findText(element, "faultcode"), findText(element, "FaultCause") or findText(element, "description")))
+
+        if response.status != 200:
+            raise Exception("%s on %s failed: HTTP %s %s" % (operation, self.serviceURL, response.status, response.reason))
+
+        body = children(envelope, "Body")
+
+        if not body or not len(body[0]):
+            raise Exception("%s on %s failed: empty response" % (operation, self.serviceURL))
+
+        return body[0][0]
+
+
+    #The CLI form of a job id (https://<host>:<port>/CREAM<id>) from the id of the service.
+    def jobId(self, id):
+        return "https://%s:%d/%s" % (self.host, self.port, id)
+
+
+    def jobIdXML(self, jobId):
+        return "<types:jobId><types:id>%s</types:id><types:creamURL>%s</types:creamURL></types:jobId>" % (
+            escape(jobId.rsplit("/", 1)[-1]), escape(self.serviceURL))
+
+
+    #Check the per-job results of a command: raise the first error.
+    def checkResults(self, operation, response):
+        for result in response.iter():
+            if localName(result.tag) in ["JobUnknownFault", "JobStatusInvalidFault", "DelegationIdMismatchFault", "GenericFault"]:
+                raise Exception("%s failed: FaultCause=[%s] %s" % (operation, findText(result, "FaultCause") or findText(result, "description"),
+                                findText(result, "Description") or ""))
+
+
+    #Register and start a job: return its job id.
+    def jobRegister(self, jdl, delegationId):
+        body = "<cream:JobRegisterRequest><types:JobDescriptionList>" \
+               "<types:JDL>%s</types:JDL><types:delegationId>%s</types:delegationId>" \
+               "<types:autoStart>true</types:autoStart><types:jobDescriptionId>nagios</types:jobDescriptionId>" \
+               "</types:JobDescriptionList></cream:JobRegisterRequest>" % (escape(jdl), escape(delegationId))
+
+        response = self.call("JobRegister", body)
+        self.checkResults("JobRegister", response)
+
+        id = findText(response, "id")
+
+        if not id:
+            raise Exception("JobRegister on %s failed: no job id returned" % self.serviceURL)
+
+        return self.jobId(id)
+
+
+    #Return the status records of the jobs.
+    def jobInfo(self, jobIds):
+        body = "<cream:JobInfoRequest>%s</cream:JobInfoRequest>" % "".join([self.jobIdXML(jobId) for jobId in jobIds])
+
+        response = self.call("JobInfo", body)
+        records = []
+
+        for result in response.iter():
+            if localName(result.tag) != "result":
+                continue
+
+            record = JobStatus(self.jobId(findText(result, "id")))
+            info = children(result, "jobInfo")
+
+            if not info:
+                record.error = "ERROR - JobID=[%s] %s" % (record.jobId, findText(result, "FaultCause") or findText(result, "description") or "job not found")
+                records.append(record)
+                continue
+
+            # the status changes, the last one is the current status
+            for status in children(info[0], "status"):
+                record.status = findText(status, "name")
+                record.exitCode = findText(status, "exitCode") or record.exitCode
+                record.failureReason = findText(status, "failureReason") or record.failureReason
+                record.description = findText(status, "description") or record.description
+
+                timestamp = findText(status, "timestamp")
+                record.history.append((record.status, timestamp, toEpoch(timestamp)))
+
+            records.append(record)
+
+        return records
+
+
+    def jobCancel(self, jobIds):
+        response = self.call("JobCancel", "<cream:JobCancelRequest><types:jobIdList>%s</types:jobIdList></cream:JobCancelRequest>" %
+                             "".join([self.jobIdXML(jobId) for jobId in jobIds]))
+        self.checkResults("JobCancel", response)
+
+
+    def jobPurge(self, jobIds):
+        response = self.call("JobPurge", "<cream:JobPurgeRequest><types:jobIdList>%s</types:jobIdList></cream:JobPurgeRequest>" %
+                             "".join([self.jobIdXML(jobId) for jobId in jobIds]))
+        self.checkResults("JobPurge", response)
+
+
+    #Return the service info as the glite-ce-service-info lines.
+    def serviceInfo(self):
+        response = self.call("getServiceInfo", "<cream:getServiceInfoRequest><cream:verbosityLevel>1</cream:verbosityLevel></cream:getServiceInfoRequest>")
+
+        return ["Interface Version  = [%s]\n" % findText(response, "interfaceVersion"),
+                "Service Version    = [%s]\n" % findText(response, "serviceVersion"),
+                "Status             = [%s]\n" % findText(response, "status"),
+                "Accept Submissions = [%s]\n" % findText(response, "doesAcceptNewJobSubmissions")]
+
+
+    #Return True if the CE accepts new job submissions.
+    def allowedSubmission(self):
+        response = self.call("getServiceInfo", "<cream:getServiceInfoRequest><cream:verbosityLevel>0</cream:verbosityLevel></cream:getServiceInfoRequest>")
+
+        return (findText(response, "doesAcceptNewJobSubmissions") or "").strip().lower() == "true"
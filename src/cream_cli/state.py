@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-----------------------------------------------------------------------
+A small JSON document on disk shared by concurrent probes.
+-----------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+from contextlib import contextmanager
+import errno, fcntl, json, os, re, tempfile
+
+
+#Turn an endpoint (e.g. host:port/cream-lrms-queue) into a valid file name.
+def fileName(key):
+    return re.sub(r"[^\w\.\-]", "_", key)
+
+
+
+class StateFile(object):
+
+    def __init__(self, path):
+        self.path = path
+
+
+    def load(self):
+        try:
+            with open(self.path) as infile:
+                data = json.load(infile)
+
+            if isinstance(data, dict):
+                return data
+        except (IOError, ValueError):
+            pass
+
+        return {}
+
+
+    #Write the state in a temporary file and rename it: readers never see a partial document.
+    def save(self, data):
+        dir = os.path.dirname(self.path) or "."
+
+        fd, tmp = tempfile.mkstemp(prefix=".", dir=dir)
+
+        try:
+            with os.fdopen(fd, "w") as outfile:
+                json.dump(data, outfile)
+
+            os.rename(tmp, self.path)
+        except:
+            os.unlink(tmp)
+            raise
+
+
+    #Read the state under a shared lock.
+    def read(self):
+        with self.lock(fcntl.LOCK_SH):
+            return self.load()
+
+
+    #Hold the exclusive lock while the caller reads and modifies the state; save it on success.
+    @contextmanager
+    def update(self):
+        with self.lock(fcntl.LOCK_EX):
+            data = self.load()
+
+            yield data
+
+            self.save(data)
+
+
+    @contextmanager
+    def lock(self, operation):
+        dir = os.path.dirname(self.path)
+
+        if dir and not os.path.isdir(dir):
+            try:
+                os.makedirs(dir)
+            except OSError as ex:
+                if ex.errno != errno.EEXIST:
+                    raise
+
+        lockFile = open(self.path + ".lock", "a")
+
+        try:
+            fcntl.flock(lockFile.fileno(), operation)
+            yield
+        finally:
+            lockFile.close()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-------------------------------------------------------------------------
+Single-pass parser of the glite-ce-job-status output (any verbosity,
+one or many jobs) into one JobStatus record per job.
+-------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+import re
+
+
+# the header of a job block or an error about a job:
+#   ******  JobID=[https://ce:8443/CREAM123]
+#   2026-10-17 10:00:00,000 ERROR - JobID=[https://ce:8443/CREAM123] job not found
+JOB_PATTERN = re.compile(r"(?:.*?\b(?P<error>ERROR|FATAL)\b)?.*?JobID=\[(?P<jobId>[^\]]*)\]")
+
+# a field of a job block, possibly a status change with its time (-L 2):
+#   Status        = [DONE-FAILED]
+#   FailureReason = [reason [with brackets]]
+#   Status        = [IDLE] - [Sat 17 Oct 2026 10:00:00] (1792224000)
+FIELD_PATTERN = re.compile(r"[\s*]*(?P<key>[A-Za-z][\w ]*?)\s*=\s*\[(?P<value>.*?)\](?:\s*-\s*\[(?P<date>[^\]]*)\]\s*\((?P<epoch>\d+)\))?\s*$")
+
+
+# the fields of a job block stored as attributes of its record
+ATTRIBUTES = {
+    "Status": "status",
+    "Current Status": "status",
+    "ExitCode": "exitCode",
+    "Exit Code": "exitCode",
+    "FailureReason": "failureReason",
+    "Failure Reason": "failureReason",
+    "Description": "description"
+}
+
+
+class JobStatus(object):
+    #The status of a job: the fields of its block, its status changes [(status, date, epoch)] and its error (if any).
+    jobId = None
+    status = None
+    exitCode = None
+    failureReason = None
+    description = None
+    error = None
+    fields = None
+    history = None
+
+    def __init__(self, jobId):
+        self.jobId = jobId
+        self.fields = {}
+        self.history = []
+
+
+    #The time of the first and of the last status change (epoch), if reported (-L 2).
+    def timestamps(self):
+        if not self.history:
+            return None, None
+
+        return self.history[0][2], self.history[-1][2]
+
+
+    def __repr__(self):
+        return "JobStatus(%s, status=%s, exitCode=%s)" % (self.jobId, self.status, self.exitCode)
+
+
+
+class SingleJobStatus(JobStatus):
+    #The status of the only job of an output: the other fields of its block are parsed on first use.
+    __slots__ = ("jobId", "status", "exitCode", "output", "block")
+
+    def parsed(self):
+        try:
+            return self.block
+        except AttributeError:
+            self.block = parseBlocks(self.output)[0]
+            return self.block
+
+
+    fields = property(lambda self: self.parsed().fields)
+    history = property(lambda self: self.parsed().history)
+    failureReason = property(lambda self: self.parsed().failureReason)
+    description = property(lambda self: self.parsed().description)
+
+
+
+#Parse the output lines of glite-ce-job-status and return the records of the jobs in order of appearance.
+#The output of a single job at -L 0/1 (the common case) is recognized from the fixed layout of its first
+#lines and only its status and exit code are sliced out: the rest of the block is parsed if asked for.
+def parseStatus(output):
+    lines = len(output)
+    first = lines > 2 and output[0] == "\n"
+
+    if lines > first + 1:
+        # ******  JobID=[https://ce:8443/CREAM123]
+        #         Status        = [DONE-OK]     (-L 0)
+        #         Current Status = [DONE-OK]    (-L 1, -L 2)
+        #         ExitCode      = [0]           (terminal statuses)
+        header = output[first]
+        line = output[first + 1]
+
+        if line[:18] == "\tStatus        = [":
+            status = line[18:-2]
+        elif line[:19] == "\tCurrent Status = [":
+            status = line[19:-2]
+        else:
+            return parseBlocks(output)
+
+        if header[:15] == "******  JobID=[" and header[-2:] == line[-2:] == "]\n":
+            exitCode = None
+            rest = first + 2
+
+            if lines > rest:
+                line = output[rest]
+
+                if line[:18] == "\tExitCode      = [" and line[-2:] == "]\n":
+                    exitCode = line[18:-2]
+                    rest += 1
+
+                if lines > rest:
+                    tail = "".join(output[rest:])
+
+                    # another job, or an exit code further down the block (-L 2)
+                    if "JobID=[" in tail or exitCode is None and "Exit" in tail:
+                        return parseBlocks(output)
+
+            # filled in place: the call of a constructor costs as much as the rest of this path
+            record = SingleJobStatus.__new__(SingleJobStatus)
+            record.jobId = header[15:-2]
+            record.status = status
+            record.exitCode = exitCode
+            record.output = output
+            return [record]
+
+    return parseBlocks(output)
+
+
+#Parse the output lines of glite-ce-job-status, one block per job.
+#The common lines (a job header, a field, a status change) are sliced with string methods: the regular
+#expressions, several times slower, only parse the errors about the jobs and the unusual lines.
+def parseBlocks(output):
+    records = []
+    record = None
+    matchJob = JOB_PATTERN.match
+    matchField = FIELD_PATTERN.match
+
+    for line in output:
+        if "JobID=[" in line:
+            if "ERROR" in line or "FATAL" in line:
+                m = matchJob(line)
+
+                if m and m.group("error"):
+                    # an error about a job is a block of its own
+                    error = JobStatus(m.group("jobId"))
+                    error.error = line.strip()
+                    records.append(error)
+                    continue
+
+            start = line.index("JobID=[") + 7
+            end = line.find("]", start)
+
+            if end >= 0:
+                record = JobStatus(line[start:end])
+                records.append(record)
+
+            continue
+
+        if "[" not in line:
+            continue
+
+        # "key = [value]" or, at -L 2, "key = [value] - [date] (epoch)"
+        index = line.find("= [")
+        key = line[:index].strip(" \t*")
+        value = line[index + 3:].rstrip()
+        date = epoch = None
+
+        if index > 0 and value[-1:] == ")" and key[:1].isalpha():
+            head, sep, epoch = value[:-1].rpartition("(")
+            head = head.rstrip()
+            value, sep, date = head[:-1].partition("] - [")
+
+            if not sep or head[-1:] != "]" or not epoch.isdigit() or "]" in date:
+                value = None
+        elif index > 0 and value[-1:] == "]" and key[:1].isalpha():
+            value = value[:-1]
+        else:
+            value = None
+
+        if value is None:
+            m = matchField(line)
+
+            if not m:
+                continue
+
+            key, value, date, epoch = m.group("key"), m.group("value"), m.group("date"), m.group("epoch")
+
+        if record is None:
+            # some fields without the header of their block: the job id is unknown
+            record = JobStatus(None)
+            records.append(record)
+
+        if epoch is not None:
+            # a status change (-L 2): the current status is the last one unless reported on its own
+            record.history.append((value, date, int(epoch)))
+
+            if "Current Status" not in record.fields:
+                record.status = value
+
+            continue
+
+        record.fields[key] = value
+
+        if key in ATTRIBUTES:
+            setattr(record, ATTRIBUTES[key], value)
+
+    return records
@@ -23,61 +23,9 @@ __author__ = "Lisa Zangrando lisa.zangrando@pd.infn.it"
 __date__ = "27.09.2013"
 __version__ = "0.1.0"
 
-import time
-from cream_cli.cream import Client
+# the command is taken from the script name: see cream_cli.commands
+from cream_cli.commands import main
 
-def main():
-    client = Client("cream_jobCancel", "1.0")
-    client.createParser()
-    client.readOptions()
-
-    try:
-        client.checkProxy()
-
-        jobId = client.jobSubmit()
-
-        client.debug("job id: " + jobId)
-    except Exception as ex:
-        client.nagiosExit(client.CRITICAL, ex)
-
-    activeStates = ['IDLE', 'RUNNING', 'REALLY-RUNNING']
-    terminalStates = ['DONE-OK', 'DONE-FAILED', 'ABORTED', 'CANCELLED']
-
-    lastStatus=""
-
-    while not lastStatus in activeStates:
-        time.sleep(10)
-        try:
-            lastStatus, exitCode = client.jobStatus(jobId)
-            client.debug("job status: " + lastStatus)
-
-            if lastStatus in terminalStates:
-                client.nagiosExit(client.CRITICAL, "job already terminated")
-        except Exception as ex:
-            client.nagiosExit(client.CRITICAL, ex)
-
-    try:       
-        client.jobCancel(jobId)
-    except Exception as ex:
-        client.nagiosExit(client.CRITICAL, ex)
-
-
-    while not lastStatus == "CANCELLED":
-        time.sleep(10)
-        try:
-            lastStatus, exitCode = client.jobStatus(jobId)
-
-            client.debug("job status: " + lastStatus)
-        except Exception as ex:
-            client.nagiosExit(client.CRITICAL, ex)
-
-    try:
-        client.jobPurge(jobId)
-    except Exception as ex:
-        client.debug("cannot purge the job")
-
-    client.nagiosExit(client.OK, "OK: job cancelled")
 
 if __name__ == '__main__':
     main()
-
@@ -23,50 +23,9 @@ __author__ = "Lisa Zangrando lisa.zangrando@pd.infn.it"
 __date__ = "27.09.2013"
 __version__ = "0.1.0"
 
-import time
-from cream_cli.cream import Client
+# the command is taken from the script name: see cream_cli.commands
+from cream_cli.commands import main
 
-def main():
-    client = Client("cream_jobPurge", "1.0")
-    client.createParser()
-    client.readOptions()
-
-    try:
-        client.checkProxy()
-
-        jobId = client.jobSubmit()
-
-        client.debug("job id: " + jobId)
-    except Exception as ex:
-        client.nagiosExit(client.CRITICAL, ex)
-
-    terminalStates = ['DONE-OK', 'DONE-FAILED', 'ABORTED', 'CANCELLED']
-
-    lastStatus=""
-
-    while not lastStatus in terminalStates:
-        time.sleep(10)
-        try:
-            lastStatus, exitCode = client.jobStatus(jobId)
-
-            client.debug("job status: " + lastStatus)
-        except Exception as ex:
-            client.nagiosExit(client.CRITICAL, ex)
-
-    try:       
-        client.jobPurge(jobId)
-    except Exception as ex:
-        client.nagiosExit(client.CRITICAL, ex)
-
-    while (1):
-        time.sleep(10)
-        try:
-            lastStatus, exitCode = client.jobStatus(jobId)
-
-            client.debug("job status: " + lastStatus)
-        except Exception as ex:
-            client.nagiosExit(client.OK, "OK: job purged")
 
 if __name__ == '__main__':
     main()
-
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+---------------------------------------------------------------------------------
+Thin Nagios plugin forwarding a CREAM check to cream_probeDaemon.
+Usage: cream_probeClient.py <check> [options of the cream_<check> plugin]
+The check can also be given by the program name (e.g. a link named cream_jobSubmit).
+---------------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+# keep the imports minimal: avoiding the interpreter and module start-up is the point of this client
+import json, os, socket, sys
+
+DEFAULT_SOCKET = "/var/lib/argo-monitoring/eu.egi.CREAMCE/probe.sock"
+CHECKS = ["jobSubmit", "jobOutput", "jobCancel", "jobPurge", "serviceInfo", "allowedSubmission"]
+# the daemon resolves the relative paths and reads these variables as the plugin would here
+# (but runs its own glite-ce-* commands, whatever CREAM_CLI_PATH or --cli-path say)
+ENVIRONMENT = ["X509_USER_PROXY", "X509_CERT_DIR"]
+DEFAULT_TIMEOUT = 120
+# the time granted to the daemon beyond the time limit of the check (e.g. waiting for a free worker)
+TIMEOUT_GRACE = 60
+
+
+#The time limit of the check (-t/--timeout), the default one of the probes if not given.
+def checkTimeout(args):
+    timeout = DEFAULT_TIMEOUT
+
+    for index, arg in enumerate(args):
+        value = None
+
+        if arg in ("-t", "--timeout") and index + 1 < len(args):
+            value = args[index + 1]
+        elif arg.startswith("--timeout="):
+            value = arg[len("--timeout="):]
+        elif arg.startswith("-t") and not arg.startswith("--"):
+            value = arg[2:]
+
+        try:
+            timeout = int(value)
+        except (TypeError, ValueError):
+            pass
+
+    return timeout
+
+def main():
+    args = sys.argv[1:]
+    check = os.path.basename(sys.argv[0]).split(".")[0][len("cream_"):]
+
+    if check not in CHECKS:
+        if not args or args[0] not in CHECKS:
+            print "usage: %s <%s> [options]" % (os.path.basename(sys.argv[0]), "|".join(CHECKS))
+            exit(3)
+
+        check = args.pop(0)
+
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(os.environ.get("CREAM_PROBE_SOCKET", DEFAULT_SOCKET))
+    except socket.error:
+        # no daemon running: run the check as the standalone plugin would
+        from cream_cli.commands import check as runCheck
+
+        runCheck(check, args)
+
+    environ = dict((key, os.environ[key]) for key in ENVIRONMENT if key in os.environ)
+    timeout = checkTimeout(args) + TIMEOUT_GRACE
+
+    # a hung daemon must not block Nagios
+    sock.settimeout(timeout)
+
+    try:
+        sock.sendall(json.dumps({"check": check, "args": args, "cwd": os.getcwd(), "env": environ}) + "\n")
+        response = json.loads(sock.makefile().readline())
+    except socket.timeout:
+        print "CREAM probe client ERROR: no answer from the daemon within %d sec" % timeout
+        exit(3)
+    except (socket.error, ValueError):
+        print "CREAM probe client ERROR: the daemon closed the connection"
+        exit(3)
+
+    print response["output"]
+    exit(response["code"])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+"""
+Copyright (c) Members of the EGEE Collaboration. 2006-2010.
+See http://www.eu-egee.org/partners/ for details on the copyright holders.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+-----------------------------------------------------------------------------
+Resident daemon running the CREAM checks forwarded by cream_probeClient.
+-----------------------------------------------------------------------------
+"""
+__version__ = "0.1.0"
+
+# the command is taken from the script name: see cream_cli.commands
+from cream_cli.commands import main
+
+
+if __name__ == '__main__':
+    main()